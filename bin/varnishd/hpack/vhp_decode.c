@@ -43,7 +43,7 @@
 
 #include "hpack/vhp.h"
 
-#include "vhp_hufdec.h"
+#include "vhp_hufdec_fsa.h"
 
 struct vhd_ctx {
 	struct vhd_decode *d;
@@ -400,10 +400,25 @@ vhd_raw(struct vhd_ctx *ctx, unsigned first)
 	return (s->arg1);
 }
 
+/*
+ * Huffman decoding runs the generated state machine a nibble at a time,
+ * each transition yielding one symbol at most.  huf->pos holds the
+ * state, and VHD_HUF_ACCEPT when the string may end there.  The bits not
+ * yet fed to the state machine are kept in huf->bits.
+ *
+ * Whole input bytes are run through two transitions at once while there
+ * is room for both symbols, the symbols are stored unconditionally and
+ * the output only advanced by the SYM flags.  The nibble loop deals with
+ * the rest: a short output buffer, the end of the string and errors.
+ */
+
+#define VHD_HUF_ACCEPT	(1U << 8)
+
 static enum vhd_ret_e v_matchproto_(vhd_state_f)
 vhd_huffman(struct vhd_ctx *ctx, unsigned first)
 {
 	const struct vhd_state *s;
+	const struct hufdec_fsa *fsa, *fsa2;
 	struct vhd_huffman *huf;
 	enum vhd_ret_e r;
 	unsigned u, l;
@@ -418,65 +433,79 @@ vhd_huffman(struct vhd_ctx *ctx, unsigned first)
 		l = ctx->d->integer->v;
 		INIT_OBJ(huf, VHD_HUFFMAN_MAGIC);
 		huf->len = l;
+		huf->pos = VHD_HUF_ACCEPT;
 	}
 	CHECK_OBJ_NOTNULL(huf, VHD_HUFFMAN_MAGIC);
 
 	r = VHD_OK;
 	l = 0;
 	while (1) {
-		assert(huf->pos < HUFDEC_LEN);
-		assert(hufdec[huf->pos].mask > 0);
-		assert(hufdec[huf->pos].mask <= 8);
+		assert((huf->pos & ~VHD_HUF_ACCEPT) < HUFDEC_FSA_STATES);
+
+		while (huf->blen == 0 && huf->len > 0 &&
+		    ctx->in < ctx->in_e && ctx->out + l + 2 <= ctx->out_e) {
+			u = *ctx->in;
+			fsa = &hufdec_fsa[huf->pos & ~VHD_HUF_ACCEPT][u >> 4];
+			fsa2 = &hufdec_fsa[fsa->state][u & 0xf];
+			if ((fsa->flags | fsa2->flags) & HUFDEC_FSA_FAIL)
+				break;
+			ctx->out[l] = (char)fsa->sym;
+			l += fsa->flags & HUFDEC_FSA_SYM;
+			ctx->out[l] = (char)fsa2->sym;
+			l += fsa2->flags & HUFDEC_FSA_SYM;
+			huf->pos = fsa2->state;
+			if (fsa2->flags & HUFDEC_FSA_ACCEPT)
+				huf->pos |= VHD_HUF_ACCEPT;
+			huf->len--;
+			ctx->in++;
+		}
+
+		if (huf->blen == 0) {
+			if (huf->len == 0) {
+				/* End of stream */
+				if (!(huf->pos & VHD_HUF_ACCEPT)) {
+					/* Incomplete code or bad padding */
+					r = VHD_ERR_HUF;
+					break;
+				}
+				r = s->arg1;
+				vhd_next_state(ctx->d);
+				break;
+			}
 
-		if (huf->len > 0 && huf->blen < hufdec[huf->pos].mask) {
 			/* Refill from input */
 			if (ctx->in == ctx->in_e) {
 				r = VHD_MORE;
 				break;
 			}
-			huf->bits = (huf->bits << 8) | *ctx->in;
-			huf->blen += 8;
+			huf->bits = *ctx->in;
+			huf->blen = 8;
 			huf->len--;
 			ctx->in++;
 		}
 
-		if (huf->len == 0 && huf->pos == 0 && huf->blen <= 7 &&
-		    huf->bits == (1U << huf->blen) - 1U) {
-			/* End of stream */
-			r = s->arg1;
-			vhd_next_state(ctx->d);
-			break;
-		}
-
-		if (ctx->out + l == ctx->out_e) {
-			r = VHD_BUF;
-			break;
-		}
-
-		if (huf->blen >= hufdec[huf->pos].mask)
-			u = huf->bits >> (huf->blen - hufdec[huf->pos].mask);
-		else
-			u = huf->bits << (hufdec[huf->pos].mask - huf->blen);
-		huf->pos += u;
-		assert(huf->pos < HUFDEC_LEN);
+		assert(huf->blen >= 4);
+		u = (huf->bits >> (huf->blen - 4)) & 0xf;
+		fsa = &hufdec_fsa[huf->pos & ~VHD_HUF_ACCEPT][u];
 
-		if (hufdec[huf->pos].len == 0 ||
-		    hufdec[huf->pos].len > huf->blen) {
-			/* Invalid or incomplete code */
+		if (fsa->flags & HUFDEC_FSA_FAIL) {
+			/* EOS in the string */
 			r = VHD_ERR_HUF;
 			break;
 		}
 
-		huf->blen -= hufdec[huf->pos].len;
-		huf->bits &= (1U << huf->blen) - 1U;
-
-		if (hufdec[huf->pos].jump) {
-			huf->pos += hufdec[huf->pos].jump;
-			assert(huf->pos < HUFDEC_LEN);
-		} else {
-			ctx->out[l++] = hufdec[huf->pos].chr;
-			huf->pos = 0;
+		if (fsa->flags & HUFDEC_FSA_SYM) {
+			if (ctx->out + l == ctx->out_e) {
+				r = VHD_BUF;
+				break;
+			}
+			ctx->out[l++] = (char)fsa->sym;
 		}
+
+		huf->blen -= 4;
+		huf->pos = fsa->state;
+		if (fsa->flags & HUFDEC_FSA_ACCEPT)
+			huf->pos |= VHD_HUF_ACCEPT;
 	}
 
 	if (l > 0 && ctx->tbl != NULL && (s->arg2 & VHD_INCREMENTAL)) {
@@ -577,7 +606,7 @@ VHD_Init(struct vhd_decode *d)
 
 	AN(d);
 	assert(VHD_S__MAX <= UINT16_MAX);
-	assert(HUFDEC_LEN <= UINT16_MAX);
+	assert((HUFDEC_FSA_STATES | VHD_HUF_ACCEPT) <= UINT16_MAX);
 	INIT_OBJ(d, VHD_DECODE_MAGIC);
 	d->state = VHD_S_IDLE;
 	d->first = 1;
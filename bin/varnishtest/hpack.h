@@ -48,6 +48,7 @@ struct txt {
 	char *ptr;
 	int len;
 	int huff;
+#define HPK_HUF_AUTO	2	/* Huffman only if shorter */
 };
 
 struct hpk_hdr {
@@ -0,0 +1,254 @@
+/*-
+ * Copyright (c) 2026 Varnish Software AS
+ * All rights reserved.
+ *
+ * SPDX-License-Identifier: BSD-2-Clause
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions
+ * are met:
+ * 1. Redistributions of source code must retain the above copyright
+ *    notice, this list of conditions and the following disclaimer.
+ * 2. Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+ * ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+ * IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ * ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+ * FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+ * DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+ * OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+ * HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+ * LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+ * OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+ * SUCH DAMAGE.
+ *
+ * Huffman decoding benchmark, driven by huffman_bench.py
+ *
+ * Linked with the HPACK decoder sources, built against the table
+ * variant under test: bin/varnishtest/vtc_h2_hpack.c with BENCH_VTC,
+ * bin/varnishd/hpack/vhp_decode.c with BENCH_VHD.  Each string is
+ * wrapped in a literal header field with an indexed name, and decoded
+ * through HPK_DecHdr() or VHD_Decode() respectively.
+ *
+ * The input holds strings as a 32 bit little endian length followed by
+ * the Huffman encoded bytes.
+ *
+ *	huffman_bench -v file
+ *		Print the decoded strings in hex, or "ERR", one per line
+ *
+ *	huffman_bench -b iterations file
+ *		Decode all the strings 'iterations' times and print the
+ *		number of strings, of input bytes and the nanoseconds taken
+ */
+
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/types.h>
+#include <time.h>
+
+#include "vdef.h"
+#include "vas.h"
+
+struct str {
+	uint8_t		*ptr;
+	size_t		len;
+	size_t		hlen;
+};
+
+/*
+ * No code is shorter than 5 bits, and room for the name, which
+ * VHD_Decode() outputs first
+ */
+#define OUTLEN(s)	((s)->len * 8 / 5 + 16)
+
+#if defined(BENCH_VTC)
+
+#include "hpack.h"
+
+static struct hpk_ctx *ctx;
+
+static void
+decode_init(void)
+{
+
+	ctx = HPK_NewCtx(4096);
+	AN(ctx);
+}
+
+static int
+decode(uint8_t *out, const struct str *s)
+{
+	struct hpk_iter *iter;
+	struct hpk_hdr h;
+	enum hpk_result r;
+	int l;
+
+	memset(&h, 0, sizeof h);
+	iter = HPK_NewIter(ctx, s->ptr, (int)(s->len + s->hlen));
+	r = HPK_DecHdr(iter, &h);
+	HPK_FreeIter(iter);
+	if (r == hpk_err)
+		return (-1);
+	l = h.value.len;
+	memcpy(out, h.value.ptr, l);
+	free(h.key.ptr);
+	free(h.value.ptr);
+	return (l);
+}
+
+#elif defined(BENCH_VHD)
+
+#include "hpack/vhp.h"
+
+static struct vht_table tbl[1];
+
+static void
+decode_init(void)
+{
+
+	AZ(VHT_Init(tbl, 4096));
+}
+
+static int
+decode(uint8_t *out, const struct str *s)
+{
+	struct vhd_decode d[1];
+	enum vhd_ret_e r;
+	size_t inu = 0, outu = 0, ilen;
+
+	VHD_Init(d);
+	ilen = s->len + s->hlen;
+	do {
+		r = VHD_Decode(d, tbl, s->ptr, ilen, &inu,
+		    (char *)out, OUTLEN(s), &outu);
+		if (r == VHD_NAME)
+			outu = 0;
+	} while (r == VHD_NAME || r == VHD_AGAIN);
+	if (r != VHD_VALUE)
+		return (-1);
+	return ((int)outu);
+}
+
+#else
+#  error "Define BENCH_VTC or BENCH_VHD"
+#endif
+
+static struct str *
+read_input(const char *fn, size_t *np)
+{
+	struct str *s = NULL;
+	size_t n = 0, l, h, v;
+	uint8_t hdr[4], *p;
+	FILE *f;
+
+	f = fopen(fn, "rb");
+	if (f == NULL) {
+		perror(fn);
+		exit(1);
+	}
+	while (fread(hdr, 1, 4, f) == 4) {
+		l = hdr[0] | hdr[1] << 8 | hdr[2] << 16 | (size_t)hdr[3] << 24;
+		p = malloc(l + 8);
+		AN(p);
+		/* Literal without indexing, name ":authority" */
+		h = 0;
+		p[h++] = 0x01;
+		if (l < 0x7f) {
+			p[h++] = 0x80 | l;
+		} else {
+			p[h++] = 0xff;
+			for (v = l - 0x7f; v >= 0x80; v >>= 7)
+				p[h++] = 0x80 | (v & 0x7f);
+			p[h++] = v;
+		}
+		if (fread(p + h, 1, l, f) != l) {
+			fprintf(stderr, "%s: short read\n", fn);
+			exit(1);
+		}
+		s = realloc(s, (n + 1) * sizeof *s);
+		AN(s);
+		s[n].ptr = p;
+		s[n].len = l;
+		s[n].hlen = h;
+		n++;
+	}
+	(void)fclose(f);
+	*np = n;
+	return (s);
+}
+
+static void
+usage(void)
+{
+	fprintf(stderr, "Usage: huffman_bench -v file\n");
+	fprintf(stderr, "       huffman_bench -b iterations file\n");
+	exit(2);
+}
+
+int
+main(int argc, char **argv)
+{
+	struct timespec t0, t1;
+	struct str *s;
+	size_t n, i, j, bytes;
+	uint8_t *out;
+	long it, k;
+	int l;
+	unsigned sink = 0;
+
+	decode_init();
+	if (argc == 3 && !strcmp(argv[1], "-v")) {
+		s = read_input(argv[2], &n);
+		out = NULL;
+		for (i = 0; i < n; i++) {
+			out = realloc(out, OUTLEN(&s[i]));
+			AN(out);
+			l = decode(out, &s[i]);
+			if (l < 0) {
+				printf("ERR\n");
+				continue;
+			}
+			for (j = 0; j < (size_t)l; j++)
+				printf("%02x", out[j]);
+			printf("\n");
+		}
+		return (0);
+	}
+
+	if (argc != 4 || strcmp(argv[1], "-b"))
+		usage();
+	it = strtol(argv[2], NULL, 0);
+	if (it <= 0)
+		usage();
+	s = read_input(argv[3], &n);
+	bytes = 0;
+	j = 0;
+	for (i = 0; i < n; i++) {
+		bytes += s[i].len;
+		if (OUTLEN(&s[i]) > j)
+			j = OUTLEN(&s[i]);
+	}
+	out = malloc(j);
+	AN(out);
+
+	(void)clock_gettime(CLOCK_MONOTONIC, &t0);
+	for (k = 0; k < it; k++) {
+		for (i = 0; i < n; i++) {
+			l = decode(out, &s[i]);
+			sink += (unsigned)l;
+			if (l > 0)
+				sink += out[0];
+		}
+	}
+	(void)clock_gettime(CLOCK_MONOTONIC, &t1);
+
+	printf("%zu %zu %.0f %u\n", n * (size_t)it, bytes * (size_t)it,
+	    (t1.tv_sec - t0.tv_sec) * 1e9 + (t1.tv_nsec - t0.tv_nsec),
+	    sink & 1);
+	return (0);
+}
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+#
+# Benchmark and cross-check the HPACK Huffman decoders
+#
+# Each variant is compiled with huffman_bench.c and the sources of the
+# decoder it runs:
+#
+#	chain:W	varnishtest's vtc_h2_hpack.c, with the chained tables
+#		of 'huffman_gen.py -w W'
+#	fsa	varnishd's vhp_decode.c, with the state machine of
+#		'huffman_gen.py -m fsa'
+#	old	varnishd's vhp_decode.c and vhp_gen_hufdec.c from before
+#		the state machine, taken from git (-r to give the revision)
+#
+# The inputs are the strings of the RFC 7541 Appendix C examples, the
+# lines of the corpus files given with -c (recorded "name: value"
+# header dumps), and synthetic header like strings.  Every variant must
+# decode them like the Python codec of 'huffman_gen.py -m py', which
+# also decides about the random and corrupted inputs of the fuzzing
+# pass.
+#
+# The chained tables decode EOS as a NUL byte, so inputs containing it
+# are only checked to fail with the other variants.
+#
+# The build directory (-B, the top of the source tree by default)
+# provides config.h.  -S file saves the throughput of each variant, -G
+# file compares with such a file and fails when a variant got slower by
+# more than -t percent (10 by default).
+
+import getopt
+import importlib
+import json
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+
+srcdir = os.path.dirname(os.path.abspath(sys.argv[0]))
+topsrcdir = os.path.dirname(os.path.dirname(srcdir))
+huffman_gen = os.path.join(srcdir, "huffman_gen.py")
+huffman_input = os.path.join(srcdir, "huffman_input")
+hpackdir = os.path.join(topsrcdir, "bin", "varnishd", "hpack")
+vas_c = os.path.join(topsrcdir, "lib", "libvarnish", "vas.c")
+
+# Strings of the RFC 7541 Appendix C header examples
+rfc7541 = [
+    "www.example.com", "no-cache", "custom-key", "custom-value",
+    "302", "307", "200", "private", "gzip",
+    "Mon, 21 Oct 2013 20:13:21 GMT", "Mon, 21 Oct 2013 20:13:22 GMT",
+    "https://www.example.com",
+    "foo=ASDJKHQKBZXOQWEOPIUAXQWEOIU; max-age=3600; version=1",
+]
+
+# Building blocks for synthetic headers
+synth_names = [
+    "accept", "accept-encoding", "accept-language", "cache-control",
+    "content-type", "content-length", "cookie", "date", "etag",
+    "if-none-match", "last-modified", "referer", "set-cookie",
+    "user-agent", "x-forwarded-for", "x-request-id", "via",
+]
+synth_chars = ("abcdefghijklmnopqrstuvwxyz"
+               "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_.;=/:, ")
+
+def usage():
+    sys.stderr.write(
+        "Usage: %s [-c corpus]... [-V variant,...] [-n count] "
+        "[-i iterations]\n"
+        "\t[-f fuzz] [-s seed] [-B builddir] [-r revision] [-S save] "
+        "[-G gate]\n\t[-t percent]\n" %
+        sys.argv[0])
+    sys.exit(2)
+
+def run(cmd, **kw):
+    return subprocess.run(cmd, check=True, stdout=subprocess.PIPE,
+                          universal_newlines=True, **kw).stdout
+
+#######################################################################
+# Inputs
+
+def corpus_strings(fns):
+    l = []
+    for fn in fns:
+        f = open(fn, "rb")
+        for ln in f:
+            ln = ln.rstrip(b"\r\n")
+            name, sep, value = ln.partition(b":")
+            if sep and name:
+                l.append(name.strip().lower())
+                l.append(value.strip())
+            elif ln:
+                l.append(ln)
+        f.close()
+    return l
+
+def synth_strings(rnd, n):
+    l = []
+    for i in range(n):
+        if rnd.random() < 0.3:
+            l.append(rnd.choice(synth_names).encode())
+        else:
+            s = "".join(rnd.choice(synth_chars)
+                        for j in range(rnd.randrange(1, 80)))
+            l.append(s.encode())
+    return l
+
+def fuzz_inputs(rnd, hp, n):
+    ''' Random bytes, and valid strings with corrupted tails '''
+    l = []
+    for i in range(n):
+        r = rnd.random()
+        if r < 0.3:
+            l.append(bytes(rnd.randrange(256)
+                           for j in range(rnd.randrange(1, 12))))
+        elif r < 0.6:
+            s = bytes(rnd.randrange(256)
+                      for j in range(rnd.randrange(1, 20)))
+            l.append(hp.huffman_encode(s))
+        else:
+            s = bytes(rnd.randrange(32, 127)
+                      for j in range(rnd.randrange(1, 20)))
+            e = bytearray(hp.huffman_encode(s))
+            if rnd.random() < 0.5:
+                e[-1] ^= 1 << rnd.randrange(8)
+            else:
+                e += b"\xff" * rnd.randrange(1, 4)
+            l.append(bytes(e))
+    return l
+
+def write_input(fn, l):
+    f = open(fn, "wb")
+    for s in l:
+        f.write(struct.pack("<I", len(s)))
+        f.write(s)
+    f.close()
+
+#######################################################################
+# Variants
+
+def write_file(fn, data):
+    f = open(fn, "w")
+    f.write(data)
+    f.close()
+
+def old_revision():
+    ''' The last revision with vhp_gen_hufdec.c '''
+    rev = run(["git", "-C", topsrcdir, "log", "-1", "--format=%H",
+               "--diff-filter=D", "--",
+               "bin/varnishd/hpack/vhp_gen_hufdec.c"]).strip()
+    if not rev:
+        sys.stderr.write("vhp_gen_hufdec.c not found in git history\n")
+        sys.exit(1)
+    return rev + "^"
+
+def git_file(rev, fn, dst):
+    write_file(dst, run(["git", "-C", topsrcdir, "show",
+                         "%s:%s" % (rev, fn)]))
+
+def build(tmp, variant, builddir, rev):
+    mode, _, width = variant.partition(":")
+    d = os.path.join(tmp, variant.replace(":", "_"))
+    os.mkdir(d)
+    cc = [os.environ.get("CC", "cc"), "-O2", "-I" + d,
+          "-I" + os.path.join(topsrcdir, "include"),
+          "-I" + builddir, "-I" + os.path.join(builddir, "include")]
+    # The decoder sources are copied next to their tables, where
+    # their quoted includes look first.
+    if mode == "chain":
+        write_file(os.path.join(d, "vtc_h2_dectbl.h"),
+                   run([sys.executable, huffman_gen, "-w", width,
+                        huffman_input]))
+        write_file(os.path.join(d, "vtc_h2_enctbl.h"),
+                   run([sys.executable, huffman_gen, "-m", "enc",
+                        huffman_input]))
+        src = []
+        for fn in ("vtc_h2_hpack.c", "vtc_h2_tbl.c"):
+            src.append(os.path.join(d, fn))
+            shutil.copy(os.path.join(srcdir, fn), src[-1])
+        cc += ["-I" + srcdir, "-DBENCH_VTC"]
+    elif mode == "fsa":
+        write_file(os.path.join(d, "vhp_hufdec_fsa.h"),
+                   run([sys.executable, huffman_gen, "-m", "fsa",
+                        huffman_input]))
+        src = []
+        for fn in ("vhp_decode.c", "vhp_table.c"):
+            src.append(os.path.join(d, fn))
+            shutil.copy(os.path.join(hpackdir, fn), src[-1])
+        cc += ["-I" + os.path.dirname(hpackdir), "-DBENCH_VHD"]
+    else:
+        os.mkdir(os.path.join(d, "hpack"))
+        src = []
+        for fn in ("vhp.h", "vhp_decode.c", "vhp_table.c",
+                   "vhp_gen_hufdec.c"):
+            src.append(os.path.join(d, "hpack", fn))
+            git_file(rev, "bin/varnishd/hpack/" + fn, src[-1])
+        gen = os.path.join(d, "vhp_gen_hufdec")
+        run(cc + ["-o", gen, src[3], vas_c])
+        write_file(os.path.join(d, "vhp_hufdec.h"), run([gen]))
+        src = src[1:3]
+        cc += ["-DBENCH_VHD"]
+    exe = os.path.join(d, "huffman_bench")
+    run(cc + ["-o", exe, os.path.join(srcdir, "huffman_bench.c"),
+              vas_c] + src)
+    return exe
+
+def check(variant, exe, fn, inputs, hp):
+    ''' Return the number of mismatches against the reference '''
+    out = run([exe, "-v", fn]).split("\n")
+    bad = 0
+    for i, s in enumerate(inputs):
+        try:
+            ref = hp.huffman_decode(s).hex()
+            eos = False
+        except hp.HPACKError as err:
+            ref = "ERR"
+            eos = "EOS" in str(err)
+        got = out[i] or "ERR"
+        if eos and variant.startswith("chain:"):
+            continue
+        if ref != got:
+            if bad < 5:
+                print("%s: %s decodes to %s, expected %s" %
+                      (variant, s.hex(), got, ref))
+            bad += 1
+    return bad
+
+def bench(exe, fn, iterations):
+    n, nbytes, ns, sink = run([exe, "-b", str(iterations), fn]).split()
+    return int(n), int(nbytes), float(ns)
+
+#######################################################################
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],
+                                   "B:c:f:G:i:n:r:S:s:t:V:")
+    except getopt.GetoptError as err:
+        sys.stderr.write(str(err) + "\n")
+        usage()
+
+    corpus = []
+    variants = ["old", "chain:8", "fsa"]
+    count = 10000
+    iterations = 20
+    nfuzz = 20000
+    seed = 1
+    save = None
+    gate = None
+    tolerance = 10.0
+    builddir = topsrcdir
+    rev = None
+    for o, a in opts:
+        if o == "-B":
+            builddir = a
+        elif o == "-c":
+            corpus.append(a)
+        elif o == "-V" and a == "all":
+            variants = ["old"] + \
+                       ["chain:%d" % w for w in range(5, 13)] + \
+                       ["fsa"]
+        elif o == "-V":
+            variants = a.split(",")
+        elif o == "-n":
+            count = int(a)
+        elif o == "-i":
+            iterations = int(a)
+        elif o == "-f":
+            nfuzz = int(a)
+        elif o == "-s":
+            seed = int(a)
+        elif o == "-r":
+            rev = a
+        elif o == "-S":
+            save = a
+        elif o == "-G":
+            gate = a
+        elif o == "-t":
+            tolerance = float(a)
+        else:
+            usage()
+    if args:
+        usage()
+    for v in variants:
+        if v not in ("old", "fsa") and (v.split(":")[0] != "chain" or
+                                        ":" not in v):
+            usage()
+    if "old" in variants and rev is None:
+        rev = old_revision()
+
+    rnd = random.Random(seed)
+    tmp = tempfile.mkdtemp(prefix="huffman_bench.")
+    try:
+        f = open(os.path.join(tmp, "vtc_hpack.py"), "w")
+        f.write(run([sys.executable, huffman_gen, "-m", "py",
+                     "-s", os.path.join(srcdir, "vtc_h2_stattbl.h"),
+                     huffman_input]))
+        f.close()
+        sys.path.insert(0, tmp)
+        hp = importlib.import_module("vtc_hpack")
+
+        strings = [x.encode() for x in rfc7541]
+        strings += corpus_strings(corpus)
+        strings += synth_strings(rnd, count)
+        bench_in = [hp.huffman_encode(x) for x in strings if x]
+        fuzz_in = fuzz_inputs(rnd, hp, nfuzz)
+        bench_fn = os.path.join(tmp, "bench.bin")
+        fuzz_fn = os.path.join(tmp, "fuzz.bin")
+        write_input(bench_fn, bench_in)
+        write_input(fuzz_fn, fuzz_in)
+
+        print("%d strings, %d bytes, %d fuzz inputs" % (
+            len(bench_in), sum(len(x) for x in bench_in), len(fuzz_in)))
+        print("%-10s %10s %10s  %s" % ("variant", "MB/s", "ns/hdr",
+                                       "check"))
+        result = {}
+        failed = False
+        for v in variants:
+            exe = build(tmp, v, builddir, rev)
+            bad = check(v, exe, bench_fn, bench_in, hp)
+            bad += check(v, exe, fuzz_fn, fuzz_in, hp)
+            n, nbytes, ns = bench(exe, bench_fn, iterations)
+            result[v] = nbytes * 1e3 / ns
+            print("%-10s %10.1f %10.1f  %s" % (
+                v, result[v], ns / n,
+                "ok" if not bad else "%d mismatches" % bad))
+            failed |= bad > 0
+    finally:
+        shutil.rmtree(tmp)
+
+    if save:
+        f = open(save, "w")
+        json.dump(result, f, indent=1, sort_keys=True)
+        f.write("\n")
+        f.close()
+
+    if gate:
+        f = open(gate)
+        base = json.load(f)
+        f.close()
+        for v in variants:
+            if v not in base:
+                continue
+            if result[v] < base[v] * (1 - tolerance / 100):
+                print("%s: %.1f MB/s, below %.1f MB/s - %g%%" % (
+                    v, result[v], base[v], tolerance))
+                failed = True
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
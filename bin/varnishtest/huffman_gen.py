@@ -1,63 +1,114 @@
 #!/usr/bin/env python3
+#
+# Generate HPACK (RFC 7541) Huffman decoding tables from the HPH() lines
+# of include/tbl/vhp_huffman.h
+#
+# Modes:
+#	chain	chained prefix tables yielding one symbol per lookup,
+#		for bin/varnishtest (the default), the first table
+#		indexed by 5 to 12 bits (-w, 8 by default)
+#	fsa	a state machine consuming 4 bits per lookup and
+#		yielding the symbol completed by them, if any, for
+#		bin/varnishd/hpack
+#	enc	packed (code, length) and length tables with the matching
+#		encoding functions, for bin/varnishtest
+#	py	a Python HPACK codec module, using the static table of
+#		vtc_h2_stattbl.h (-s)
+#
+# With -r, report the size of the chained tables and the lookups per
+# symbol they take for each first table width, the symbols weighted by
+# their frequency in a corpus (-c) or else by their code lengths.
 
+import getopt
+import os
 import re
 import sys
 
+# Two input formats are understood, the HPH() lines of vhp_huffman.h
 #HPH(0x30, 0x00000000,  5)
-regex = re.compile("^HPH\((.{4}), (.{10}), +(.{1,3})\)")
+regex = re.compile(r"^HPH\((.{4}), (.{10}), +(.{1,3})\)")
+# and the table of RFC 7541 Appendix B, as in huffman_input
+#   '&' ( 38)  |11111000                                     f8  [ 8]
+rfc_regex = re.compile(r"^ +.* \( *(\d+)\) +\|[01|]+ +([0-9a-f]+) +\[ *(\d+)\]")
 
-if len(sys.argv) != 2:
-    print("{} takes one and only one argument".format(sys.argv[0]))
+EOS = 256
+
+def usage():
+    sys.stderr.write(
+        "Usage: %s [-m chain|fsa|enc|py] [-w bits] [-s stattbl] input\n"
+        "       %s -r [-w bits] [-c corpus] input\n" %
+        (sys.argv[0], sys.argv[0]))
     sys.exit(2)
 
+def read_codes(fn):
+    ''' Return a list of (chr, code, length) '''
+    codes = []
+    f = open(fn)
+    for l in f:
+        match = regex.match(l)
+        if match:
+            codes.append((int(match.group(1), 16), int(match.group(2), 16),
+                          int(match.group(3))))
+            continue
+        match = rfc_regex.match(l)
+        if match:
+            codes.append((int(match.group(1)), int(match.group(2), 16),
+                          int(match.group(3))))
+    f.close()
+    return codes
+
+#######################################################################
+# Chained prefix tables
+#
+# The first table is indexed by the first 'width' bits of the input.
+# Longer codes escape to a table indexed by the next bits, as wide as
+# the longest remainder, but at most 'width' bits, and so on.
+
 class sym:
-    def __init__(self, bigval, bigvall, chr=0, esc=None):
-        self.vall = bigvall % 8 if bigvall % 8 else 8
+    def __init__(self, bigval, bigvall, width, chr=0, esc=None):
+        self.vall = bigvall % width if bigvall % width else width
         self.val = bigval & ((1 << self.vall) - 1)
-        self.pfx = (bigval >> self.vall)# & 0xff
+        self.pfx = (bigval >> self.vall)
         self.chr = chr
         self.esc = esc
 
-tbls = {}
-msl = {} # max sym length
-
-f = open(sys.argv[1])
-for l in f:
-    grp = 1
-    match = regex.match(l)
-    if not match:
-        continue
-
-    char = int(match.group(grp), 16)
-    grp += 1
+def chain_tables(codes, width):
+    ''' Return the tables indexed by their prefix '''
+    tbls = {}
+    l = list(codes)
+    if EOS not in [c[0] for c in l]:
+        l.append((EOS, 0x3fffffff, 30))
 
-    val = int(match.group(grp), 16)
-    grp += 1
+    for char, val, vall in l:
+        s = sym(val, vall, width, char)
+        if s.pfx not in tbls:
+            tbls[s.pfx] = {}
 
-    vall = int(match.group(grp))
+        assert s.val not in tbls[s.pfx]
+        tbls[s.pfx][s.val] = s
 
-    s = sym(val, vall, char)
-    if s.pfx not in tbls:
-        tbls[s.pfx] = {}
+        # add the escape entries in the "previous" tables
+        pfx = s.pfx
+        while pfx:
+            pp = pfx >> width
+            pv = pfx & ((1 << width) - 1)
+            if pp not in tbls:
+                tbls[pp] = {}
+            tbls[pp][pv] = sym(pv, width, width, 0,
+                               "&tbl_{:x}".format(pfx))
+            pfx = pp
 
-    if s.val in tbls[s.pfx]:
-        assert tbls[s.pfx][s.val].e
-    tbls[s.pfx][s.val] = s
+    for pfx in tbls:
+        msl = max([x.vall for x in tbls[pfx].values()])
+        for s in tbls[pfx].values():
+            s.val = s.val << (msl - s.vall)
+        tbls[pfx] = (msl, sorted(tbls[pfx].values(), key=lambda x: x.val))
+    return tbls
 
-    # add the escape entry in the "previous" table
-    if s.pfx:
-        pp = s.pfx >> 8
-        pv = s.pfx & 0xff
-        if pp not in tbls:
-            tbls[pp] = {}
-        tbls[pp][pv] = sym(pv, 8, 0, "&tbl_{:x}".format(s.pfx))
-f.close()
+def emit_chain(codes, width):
+    tbls = chain_tables(codes, width)
 
-# add the EOS case
-s = sym(63, 6, 0)
-tbls[0xffffff][63] = s
-
-print('''/* NB:  This file is machine generated, DO NOT EDIT!
+    print('''/* NB:  This file is machine generated, DO NOT EDIT!
  * edit 'huffman_input' instead
  */
 
@@ -75,22 +126,688 @@ struct stbl {
 };
 ''')
 
-for pfx in sorted(tbls.keys(), reverse=True):
-    msl = max([x.vall for x in tbls[pfx].values()])
-    for s in tbls[pfx].values():
-        s.val = s.val << (msl - s.vall)
-
-    tbl = sorted(tbls[pfx].values(), key=lambda x: x.val)
-    print("\nstatic struct ssym sym_{:x}_array[] = {{".format(pfx))
-    for s in tbl:
-        for j in range(2 ** (msl - s.vall)):
-            print("{} {{{}, {:3d}, {}}},".format(
-                "\t     " if j else "/* idx {:3d} */".format(s.val + j),
-                s.vall, s.chr % 256,
-                s.esc if s.esc else "NULL"))
-    print('''}};
+    for pfx in sorted(tbls.keys(), reverse=True):
+        msl, tbl = tbls[pfx]
+        print("\nstatic struct ssym sym_{:x}_array[] = {{".format(pfx))
+        for s in tbl:
+            for j in range(2 ** (msl - s.vall)):
+                print("{} {{{}, {:3d}, {}}},".format(
+                    "\t     " if j else "/* idx {:3d} */".format(s.val + j),
+                    s.vall, s.chr % 256,
+                    s.esc if s.esc else "NULL"))
+        print('''}};
 
 static struct stbl tbl_{:x} = {{
     {},
     sym_{:x}_array
 }};'''.format(pfx, msl, pfx))
+
+def read_weights(fn, codes):
+    ''' Symbol weights from the byte counts of a corpus, or else the
+    probabilities the code lengths stand for '''
+    w = {}
+    if fn is None:
+        for char, val, vall in codes:
+            if char < 256:
+                w[char] = 2.0 ** -vall
+        return w
+    f = open(fn, "rb")
+    for c in f.read():
+        w[c] = w.get(c, 0) + 1
+    f.close()
+    return w
+
+def chain_report(codes, widths, weights):
+    ''' Size of the chained tables, and the lookups per symbol '''
+    # sizeof(struct ssym) and sizeof(struct stbl) on LP64
+    ssym = 16
+    stbl = 16
+    length = {}
+    for char, val, vall in codes:
+        length[char] = vall
+    total = float(sum(weights.values()))
+    assert total > 0
+
+    print("width  tables  entries    bytes  lookups/sym")
+    for width in widths:
+        tbls = chain_tables(codes, width)
+        entries = sum([2 ** x[0] for x in tbls.values()])
+        lookups = 0.0
+        for c, n in weights.items():
+            lookups += n * ((length[c] + width - 1) // width)
+        print("%5d  %6d  %7d  %7d  %11.3f" % (
+            width, len(tbls), entries, entries * ssym + len(tbls) * stbl,
+            lookups / total))
+
+#######################################################################
+# Finite state machine
+#
+# The states are the internal nodes of the code tree, numbered in
+# breadth first order with the root as state 0.  A transition feeds
+# a fixed number of bits into a state, and records the symbols completed
+# on the way and the state reached.  The ACCEPT flag tells that the
+# bits since the last symbol are a valid padding (at most 7 one bits),
+# so the input may end there, and FAIL that the EOS symbol was decoded.
+
+class node:
+    def __init__(self):
+        self.child = [None, None]
+        self.sym = None
+        self.state = None
+        self.depth = 0
+        self.ones = True
+
+def code_tree(codes):
+    root = node()
+    l = list(codes)
+    if EOS not in [c[0] for c in l]:
+        l.append((EOS, 0x3fffffff, 30))
+    for char, val, vall in l:
+        n = root
+        for i in range(vall - 1, -1, -1):
+            b = (val >> i) & 1
+            if n.child[b] is None:
+                c = node()
+                c.depth = n.depth + 1
+                c.ones = n.ones and b == 1
+                n.child[b] = c
+            n = n.child[b]
+            assert n.sym is None
+        assert n.child == [None, None]
+        n.sym = char
+
+    states = []
+    todo = [root]
+    while todo:
+        n = todo.pop(0)
+        if n.sym is not None:
+            continue
+        assert None not in n.child
+        n.state = len(states)
+        states.append(n)
+        todo += n.child
+    return states
+
+def fsa(codes, bits):
+    ''' Return the transition table and the max symbols per transition '''
+    states = code_tree(codes)
+    root = states[0]
+    tbl = []
+    nsym = 1
+    for st in states:
+        row = []
+        for v in range(1 << bits):
+            n = st
+            syms = []
+            fail = False
+            for i in range(bits - 1, -1, -1):
+                n = n.child[(v >> i) & 1]
+                if n.sym is None:
+                    continue
+                if n.sym == EOS:
+                    fail = True
+                    break
+                syms.append(n.sym)
+                n = root
+            if fail:
+                row.append((0, "FAIL", []))
+                continue
+            flags = []
+            if syms:
+                flags.append("SYM")
+            if n.ones and n.depth <= 7:
+                flags.append("ACCEPT")
+            row.append((n.state, "|".join(flags), syms))
+            nsym = max(nsym, len(syms))
+        tbl.append(row)
+    return tbl, nsym
+
+# The C table is consumed a nibble at a time, which keeps it at three
+# bytes per transition, 12KB in all.  No code is shorter than 5 bits,
+# so a nibble completes one symbol at most, and SYM doubles as the
+# number of symbols.
+
+def emit_fsa(codes):
+    tbl, nsym = fsa(codes, 4)
+    assert len(tbl) <= 256
+    assert nsym == 1
+
+    print('''/*
+ * NB:  This file is machine generated, DO NOT EDIT!
+ *
+ * Edit bin/varnishtest/huffman_gen.py instead
+ */
+
+#define HUFDEC_FSA_STATES\t%d
+
+#define HUFDEC_FSA_SYM\t\t(1U << 0)
+#define HUFDEC_FSA_ACCEPT\t(1U << 1)
+#define HUFDEC_FSA_FAIL\t\t(1U << 2)
+
+static const struct hufdec_fsa {
+\tuint8_t\t\tstate;
+\tuint8_t\t\tflags;
+\tuint8_t\t\tsym;
+} hufdec_fsa[HUFDEC_FSA_STATES][16] = {''' % len(tbl))
+
+    for i, row in enumerate(tbl):
+        print("\t[%d] = {" % i)
+        for v, e in enumerate(row):
+            state, flags, syms = e
+            if flags:
+                flags = " | ".join("HUFDEC_FSA_" + x
+                                   for x in flags.split("|"))
+            else:
+                flags = "0"
+            print("\t\t/* %s */ { %3d, %s, 0x%02x }," % (
+                format(v, "04b"), state, flags, syms[0] if syms else 0))
+        print("\t},")
+    print("};")
+
+#######################################################################
+# Encoding tables
+#
+# hufenc_tbl[] packs the code and its length in one word, hufenc_len[]
+# holds the length alone so the encoded size of a string is a sum of
+# bytes.  hufenc() keeps the bits in a 64 bit accumulator and stores them
+# a 32 bit word at a time, no code being longer than 30 bits.
+
+def emit_enc(codes):
+    tbl = {}
+    for char, val, vall in codes:
+        if char < 256:
+            tbl[char] = (val, vall)
+    assert sorted(tbl.keys()) == list(range(256))
+    assert max(x[1] for x in tbl.values()) <= 32
+
+    print('''/*
+ * NB:  This file is machine generated, DO NOT EDIT!
+ *
+ * Edit bin/varnishtest/huffman_gen.py instead
+ */
+
+#define HUFENC_CODE(e)\t((uint32_t)((e) >> 8))
+#define HUFENC_LEN(e)\t((unsigned)((e) & 0xff))
+
+static const uint64_t hufenc_tbl[256] = {''')
+    for i in range(256):
+        val, vall = tbl[i]
+        print("\t/* 0x%02x */ 0x%010x, /* 0x%08x %2d */" % (
+            i, val << 8 | vall, val, vall))
+    print("};\n")
+
+    print("static const uint8_t hufenc_len[256] = {")
+    for i in range(0, 256, 8):
+        print("\t/* 0x%02x */ %s," % (i, ", ".join(
+            "%2d" % tbl[j][1] for j in range(i, i + 8))))
+    print("};")
+
+    print('''
+/* Length in bytes of the encoded string, padding included */
+
+static size_t
+hufenc_size(const char *str, size_t len)
+{
+\tsize_t bits = 0;
+
+\twhile (len--)
+\t\tbits += hufenc_len[(uint8_t)*str++];
+\treturn ((bits + 7) / 8);
+}
+
+/* Encode a string into buf, which must hold hufenc_size() bytes */
+
+static size_t
+hufenc(uint8_t *buf, const char *str, size_t len)
+{
+\tuint8_t *p = buf;
+\tuint64_t acc = 0, e;
+\tunsigned bits = 0, l;
+
+\twhile (len--) {
+\t\te = hufenc_tbl[(uint8_t)*str++];
+\t\tl = HUFENC_LEN(e);
+\t\tacc = (acc << l) | HUFENC_CODE(e);
+\t\tbits += l;
+\t\tif (bits >= 32) {
+\t\t\tbits -= 32;
+\t\t\tvbe32enc(p, (uint32_t)(acc >> bits));
+\t\t\tp += 4;
+\t\t}
+\t}
+\twhile (bits >= 8) {
+\t\tbits -= 8;
+\t\t*p++ = (uint8_t)(acc >> bits);
+\t}
+\tif (bits > 0) {
+\t\t/* Pad with the most significant bits of EOS */
+\t\t*p++ = (uint8_t)((acc << (8 - bits)) | (0xffU >> bits));
+\t}
+\treturn ((size_t)(p - buf));
+}''')
+
+#######################################################################
+# Python HPACK codec
+#
+# The Huffman decoder of the generated module steps through the 4 bit
+# state machine above a byte at a time, by composing two transitions
+# into a byte wide table when the module is loaded.  The encoder joins
+# the codes as strings of '0' and '1' and converts them in one go.
+
+stat_regex = re.compile(r'^STAT_HDRS\( *(\d+), *"([^"]*)", *"([^"]*)"\)')
+
+def read_stattbl(fn):
+    ''' Return the static table as a list of (name, value) '''
+    tbl = []
+    f = open(fn)
+    for l in f:
+        match = stat_regex.match(l)
+        if match:
+            assert int(match.group(1)) == len(tbl) + 1
+            tbl.append((match.group(2), match.group(3)))
+    f.close()
+    return tbl
+
+def emit_py(codes, stattbl):
+    tbl, nsym = fsa(codes, 4)
+    enc = {}
+    for char, val, vall in codes:
+        enc[char] = (val, vall)
+    enc[EOS] = (0x3fffffff, 30)
+    assert sorted(enc.keys()) == list(range(257))
+
+    print('''#
+# NB:  This file is machine generated, DO NOT EDIT!
+#
+# Edit bin/varnishtest/huffman_gen.py instead
+#
+# HPACK (RFC 7541) encoding and decoding, for the offline analysis of
+# HTTP/2 traffic and as a reference for the C implementations.
+#
+#     huffman_encode(bytes) -> bytes
+#     huffman_decode(bytes) -> bytes
+#     huffman_length(bytes) -> int
+#     Encoder(max_size).encode([(name, value), ...]) -> bytes
+#     Decoder(max_size).decode(bytes) -> [(name, value), ...]
+#
+# Run as a script, it decodes the hex encoded header blocks read from
+# the standard input, one per line, with a common dynamic table.
+
+import collections
+import sys
+
+class HPACKError(ValueError):
+    pass
+
+#######################################################################
+# Huffman codes, (code, length) indexed by symbol, EOS last
+
+HUFFMAN_CODES = (''')
+    for i in range(257):
+        print("    (0x%08x, %2d),  # %s" % (enc[i][0], enc[i][1],
+              "EOS" if i == EOS else "0x%02x" % i))
+    print(")")
+
+    print('''
+#######################################################################
+# Huffman decoding state machine, 4 bits per transition
+#
+# (next state, flags, symbols) indexed by state * 16 + bits
+
+_FSA_SYM = 1
+_FSA_ACCEPT = 2
+_FSA_FAIL = 4
+
+_FSA_STATES = %d
+
+_FSA = (''' % len(tbl))
+    for i, row in enumerate(tbl):
+        print("    # state %d" % i)
+        for j in range(0, len(row), 4):
+            l = []
+            for state, flags, syms in row[j:j + 4]:
+                f = 0
+                for x in flags.split("|") if flags else []:
+                    f |= {"SYM": 1, "ACCEPT": 2, "FAIL": 4}[x]
+                l.append("(%d, %d, %r)" % (state, f, bytes(syms)))
+            print("    " + ", ".join(l) + ",")
+    print(")")
+
+    print('''
+#######################################################################
+# Static table, Appendix A
+
+STATIC_TABLE = (''')
+    for name, value in stattbl:
+        print("    (%r, %r)," % (name.encode(), value.encode()))
+    print(")")
+
+    print('''
+#######################################################################
+# Huffman coding
+
+def _byte_table():
+    \'\'\' Compose pairs of transitions into a byte wide table \'\'\'
+    rows = [[None] * 256 for _ in range(_FSA_STATES)]
+    fail = (None, b"", False)
+    for st in range(_FSA_STATES):
+        row = rows[st]
+        for hi in range(16):
+            st1, f1, s1 = _FSA[st * 16 + hi]
+            for lo in range(16):
+                if f1 & _FSA_FAIL:
+                    row[hi << 4 | lo] = fail
+                    continue
+                st2, f2, s2 = _FSA[st1 * 16 + lo]
+                if f2 & _FSA_FAIL:
+                    row[hi << 4 | lo] = fail
+                    continue
+                row[hi << 4 | lo] = (rows[st2], s1 + s2,
+                                     bool(f2 & _FSA_ACCEPT))
+    return rows[0]
+
+_DEC = _byte_table()
+
+_ENC = tuple(format(c, "0%db" % l) for c, l in HUFFMAN_CODES[:256])
+_LEN = tuple(l for c, l in HUFFMAN_CODES[:256])
+
+def huffman_length(data):
+    \'\'\' Length in bytes of the Huffman encoded data \'\'\'
+    return (sum(map(_LEN.__getitem__, data)) + 7) // 8
+
+def huffman_encode(data):
+    bits = "".join(map(_ENC.__getitem__, data))
+    n = (len(bits) + 7) // 8
+    if n == 0:
+        return b""
+    bits += "1" * (n * 8 - len(bits))
+    return int(bits, 2).to_bytes(n, "big")
+
+def huffman_decode(data):
+    row = _DEC
+    accept = True
+    out = []
+    for b in data:
+        if row is None:
+            break
+        row, syms, accept = row[b]
+        out.append(syms)
+    if row is None:
+        raise HPACKError("EOS in Huffman string")
+    if not accept:
+        raise HPACKError("Invalid Huffman padding")
+    return b"".join(out)
+
+#######################################################################
+# Integers and strings
+
+def encode_int(value, prefix, flags=0):
+    \'\'\' Encode value with a prefix bits prefix, or-ing flags in \'\'\'
+    m = (1 << prefix) - 1
+    if value < m:
+        return bytes((flags | value,))
+    out = bytearray((flags | m,))
+    value -= m
+    while value >= 0x80:
+        out.append(0x80 | (value & 0x7f))
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def decode_int(data, pos, prefix):
+    \'\'\' Return the value and the position after it \'\'\'
+    if pos >= len(data):
+        raise HPACKError("Truncated integer")
+    m = (1 << prefix) - 1
+    value = data[pos] & m
+    pos += 1
+    if value < m:
+        return value, pos
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise HPACKError("Truncated integer")
+        b = data[pos]
+        pos += 1
+        value += (b & 0x7f) << shift
+        shift += 7
+        if not b & 0x80:
+            return value, pos
+        if shift > 28:
+            raise HPACKError("Integer overflow")
+
+def encode_string(data, huffman=None):
+    \'\'\' Huffman encode if asked, or if shorter when huffman is None \'\'\'
+    if huffman is None:
+        huffman = huffman_length(data) < len(data)
+    if huffman:
+        data = huffman_encode(data)
+        return encode_int(len(data), 7, 0x80) + data
+    return encode_int(len(data), 7) + bytes(data)
+
+def decode_string(data, pos):
+    \'\'\' Return the string and the position after it \'\'\'
+    if pos >= len(data):
+        raise HPACKError("Truncated string")
+    huffman = data[pos] & 0x80
+    l, pos = decode_int(data, pos, 7)
+    if pos + l > len(data):
+        raise HPACKError("Truncated string")
+    s = bytes(data[pos:pos + l])
+    if huffman:
+        s = huffman_decode(s)
+    return s, pos + l
+
+#######################################################################
+# Header tables
+
+# The lowest index of each header and of each name in the static table
+_STATIC_HDR = {}
+_STATIC_NAME = {}
+for _i, _hdr in enumerate(STATIC_TABLE):
+    _STATIC_HDR.setdefault(_hdr, _i + 1)
+    _STATIC_NAME.setdefault(_hdr[0], _i + 1)
+
+class Table(object):
+    \'\'\'
+    The static and the dynamic table, indexed from 1
+
+    The dynamic entries are numbered in the order they were added, and
+    the newest number of each header and of each name is kept, so that
+    find() does not have to scan the table.
+    \'\'\'
+
+    def __init__(self, max_size=4096):
+        self.dyn = collections.deque()
+        self.size = 0
+        self.max_size = max_size
+        self.added = 0
+        self.hdrs = {}
+        self.names = {}
+
+    def __len__(self):
+        return len(STATIC_TABLE) + len(self.dyn)
+
+    def _index(self, n):
+        return len(STATIC_TABLE) + 1 + self.added - n
+
+    def _evict(self, limit):
+        while self.dyn and self.size > limit:
+            name, value = self.dyn.pop()
+            self.size -= len(name) + len(value) + 32
+            # The oldest entry, the newest of its kind only if alone
+            n = self.added - len(self.dyn)
+            if self.hdrs.get((name, value)) == n:
+                del self.hdrs[(name, value)]
+            if self.names.get(name) == n:
+                del self.names[name]
+
+    def resize(self, max_size):
+        self.max_size = max_size
+        self._evict(max_size)
+
+    def add(self, name, value):
+        l = len(name) + len(value) + 32
+        self._evict(self.max_size - l)
+        if l <= self.max_size:
+            self.dyn.appendleft((name, value))
+            self.size += l
+            self.added += 1
+            self.hdrs[(name, value)] = self.added
+            self.names[name] = self.added
+
+    def get(self, idx):
+        if idx < 1 or idx > len(self):
+            raise HPACKError("Invalid index %d" % idx)
+        if idx <= len(STATIC_TABLE):
+            return STATIC_TABLE[idx - 1]
+        return self.dyn[idx - len(STATIC_TABLE) - 1]
+
+    def find(self, name, value):
+        \'\'\' Return the index of the header, negated for the name only \'\'\'
+        i = _STATIC_HDR.get((name, value))
+        if i:
+            return i
+        n = self.hdrs.get((name, value))
+        if n:
+            return self._index(n)
+        i = _STATIC_NAME.get(name)
+        if i:
+            return -i
+        n = self.names.get(name)
+        if n:
+            return -self._index(n)
+        return 0
+
+#######################################################################
+# Header blocks
+
+class Decoder(object):
+
+    def __init__(self, max_size=4096):
+        self.table = Table(max_size)
+        self.max_size = max_size
+
+    def decode(self, data):
+        hdrs = []
+        pos = 0
+        while pos < len(data):
+            b = data[pos]
+            if b & 0x80:
+                # Indexed
+                idx, pos = decode_int(data, pos, 7)
+                hdrs.append(self.table.get(idx))
+                continue
+            if b & 0xe0 == 0x20:
+                # Dynamic table size update
+                size, pos = decode_int(data, pos, 5)
+                if size > self.max_size:
+                    raise HPACKError("Table size %d too large" % size)
+                self.table.resize(size)
+                continue
+            if b & 0x40:
+                idx, pos = decode_int(data, pos, 6)
+            else:
+                idx, pos = decode_int(data, pos, 4)
+            if idx:
+                name = self.table.get(idx)[0]
+            else:
+                name, pos = decode_string(data, pos)
+            value, pos = decode_string(data, pos)
+            if b & 0x40:
+                self.table.add(name, value)
+            hdrs.append((name, value))
+        return hdrs
+
+class Encoder(object):
+
+    def __init__(self, max_size=4096, huffman=None):
+        self.table = Table(max_size)
+        self.huffman = huffman
+        self.resized = False
+
+    def resize(self, max_size):
+        self.table.resize(max_size)
+        self.resized = True
+
+    def encode(self, hdrs):
+        out = []
+        if self.resized:
+            out.append(encode_int(self.table.max_size, 5, 0x20))
+            self.resized = False
+        for name, value in hdrs:
+            idx = self.table.find(name, value)
+            if idx > 0:
+                out.append(encode_int(idx, 7, 0x80))
+                continue
+            if idx < 0:
+                out.append(encode_int(-idx, 6, 0x40))
+            else:
+                out.append(b"\\x40")
+                out.append(encode_string(name, self.huffman))
+            out.append(encode_string(value, self.huffman))
+            self.table.add(name, value)
+        return b"".join(out)
+
+if __name__ == "__main__":
+    dec = Decoder()
+    for l in sys.stdin:
+        l = l.strip()
+        if not l:
+            continue
+        for name, value in dec.decode(bytes.fromhex(l)):
+            print("%s: %s" % (name.decode("latin-1"),
+                              value.decode("latin-1")))
+        print("")''')
+
+#######################################################################
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], "c:m:rs:w:")
+except getopt.GetoptError as err:
+    sys.stderr.write(str(err) + "\n")
+    usage()
+
+mode = "chain"
+width = None
+report = False
+corpus = None
+stattbl = os.path.join(os.path.dirname(sys.argv[0]), "vtc_h2_stattbl.h")
+for o, a in opts:
+    if o == "-m" and a in ("chain", "fsa", "enc", "py"):
+        mode = a
+    elif o == "-c":
+        corpus = a
+    elif o == "-r":
+        report = True
+    elif o == "-s":
+        stattbl = a
+    elif o == "-w" and a.isdigit():
+        width = int(a)
+    else:
+        usage()
+
+if mode == "chain" and width not in [None] + list(range(5, 13)):
+    usage()
+if mode == "fsa" and width not in (None, 4):
+    usage()
+if report and mode != "chain":
+    usage()
+
+if len(args) != 1:
+    print("{} takes one and only one argument".format(sys.argv[0]))
+    sys.exit(2)
+
+codes = read_codes(args[0])
+
+if report:
+    chain_report(codes, [width] if width else range(5, 13),
+                 read_weights(corpus, codes))
+elif mode == "chain":
+    emit_chain(codes, width or 8)
+elif mode == "fsa":
+    emit_fsa(codes)
+elif mode == "enc":
+    emit_enc(codes)
+else:
+    emit_py(codes, read_stattbl(stattbl))
@@ -37,23 +37,13 @@
 #include "vdef.h"
 
 #include "vas.h"
+#include "vend.h"
 #include "vqueue.h"
 
 #include "hpack.h"
 #include "vtc_h2_priv.h"
 
-struct symbol {
-	uint32_t	val;
-	uint8_t		size;
-};
-
-static const struct symbol coding_table[] = {
-#define HPACK(i, v, l) {v, l},
 #include "vtc_h2_enctbl.h"
-#undef HPACK
-	{0, 0}
-};
-
 #include "vtc_h2_dectbl.h"
 
 #define MASK(pack, n) (pack >> (64 - n))
@@ -63,19 +53,21 @@ huff_decode(char *str, int nm, struct hpk_iter *iter, int ilen)
 	int l = 0;
 	uint64_t pack = 0;
 	unsigned pl = 0; /* pack length*/
+	uint64_t cv = 0; /* bits of the current code already consumed */
+	unsigned cl = 0; /* and their length */
 	struct stbl *tbl = &tbl_0;
 	struct ssym *sym;
 
 	(void)nm;
-	while (ilen > 0 || pl != 0) {
+	while (ilen > 0 || pl != 0 || cl != 0) {
 		/* make sure we have enough data*/
 		if (pl < tbl->msk) {
-			if (ilen == 0) {
+			if (ilen == 0 && cl + pl <= 7 &&
+			    cv == (1U << cl) - 1U) {
+				/* at most 7 bits of EOS padding */
 				if (pl == 0 || (MASK(pack, pl) ==
-						(unsigned)((1U << pl) - 1U))) {
-					assert(tbl == &tbl_0);
+						(unsigned)((1U << pl) - 1U)))
 					return (l);
-				}
 			}
 			/* fit as many bytes as we can in pack */
 			while (pl <= 56 && ilen > 0) {
@@ -95,7 +87,10 @@ huff_decode(char *str, int nm, struct hpk_iter *iter, int ilen)
 		if (sym->csm == 0 || pl < sym->csm)
 			return (0);
 
-		assert(sym->csm <= 8);
+		if (sym->nxt) {
+			cv = (cv << sym->csm) | MASK(pack, sym->csm);
+			cl += sym->csm;
+		}
 		pack <<= sym->csm;
 		assert(sym->csm <= pl);
 		pl -= sym->csm;
@@ -105,64 +100,28 @@ huff_decode(char *str, int nm, struct hpk_iter *iter, int ilen)
 		}
 		str[l++] = sym->chr;
 		tbl = &tbl_0;
+		cv = 0;
+		cl = 0;
 	}
 	return (l);
 }
 
-/* inspired from Dridi Boukelmoune's cashpack. */
 static enum hpk_result
 huff_encode(struct hpk_iter *iter, const char *str, int len)
 {
-	uint64_t pack = 0;
-	int pl = 0; /* pack length*/
-	uint32_t	v;
-	uint8_t		s;
-
-	assert(iter->buf < iter->end);
-
-	while (len--) {
-		v = coding_table[(uint8_t)*str].val;
-		s = coding_table[(uint8_t)*str].size;
-
-		pl += s;
-		pack |= (uint64_t)v << (64 - pl);
-
-		while (pl >= 8) {
-			if (iter->buf == iter->end)
-				return (hpk_done);
-			*iter->buf = (char)(pack >> 56);
-			iter->buf++;
-			pack <<= 8;
-			pl -= 8;
-		}
-		str++;
-	}
-
-	/* padding */
-	if (pl) {
-		assert(pl < 8);
-		if (iter->buf == iter->end)
-			return (hpk_done);
-		pl += 8;
-		pack |= (uint64_t)0xff << (64 - pl);
-		*iter->buf = (char)(pack >> 56);
-		iter->buf++;
-	}
 
+	assert(len >= 0);
+	iter->buf += hufenc(iter->buf, str, len);
+	assert(iter->buf <= iter->end);
 	return (hpk_more);
 }
 
 static int
 huff_simulate(const char *str, int ilen, int huff)
 {
-	int olen = 0;
 	if (!huff || !ilen)
 		return (ilen);
-	while (ilen--) {
-		olen += coding_table[(unsigned char)*str].size;
-		str++;
-	}
-	return ((olen + 7) / 8);
+	return (hufenc_size(str, ilen));
 }
 
 static enum hpk_result
@@ -229,9 +188,16 @@ num_encode(struct hpk_iter *iter, uint8_t prefix, uint32_t num)
 static enum hpk_result
 str_encode(struct hpk_iter *iter, const struct txt *t)
 {
-	int slen = huff_simulate(t->ptr, t->len, t->huff);
+	int huff = t->huff;
+	int slen = huff_simulate(t->ptr, t->len, huff);
+
+	if (huff == HPK_HUF_AUTO) {
+		huff = slen < t->len;
+		if (!huff)
+			slen = t->len;
+	}
 	assert(iter->buf < iter->end);
-	if (t->huff)
+	if (huff)
 		*iter->buf = 0x80;
 	else
 		*iter->buf = 0;
@@ -242,7 +208,7 @@ str_encode(struct hpk_iter *iter, const struct txt *t)
 	if (slen > iter->end - iter->buf)
 		return (hpk_err);
 
-	if (t->huff) {
+	if (huff) {
 		return (huff_encode(iter, t->ptr, t->len));
 	} else {
 		memcpy(iter->buf, t->ptr, slen);
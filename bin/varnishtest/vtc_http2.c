@@ -1279,8 +1279,10 @@ cmd_sendhex(CMD_ARGS)
 	av++;								       \
 	     if (AV_IS("plain")) { hdr.field.huff = 0; }		       \
 	else if (AV_IS("huf"))   { hdr.field.huff = 1; }		       \
+	else if (AV_IS("auto"))  { hdr.field.huff = HPK_HUF_AUTO; }	       \
 	else								       \
-		vtc_fatal(vl, str " arg can be huf or plain (got: %s)", *av); \
+		vtc_fatal(vl, str " arg can be huf, plain or auto (got: %s)",  \
+		    *av);						       \
 	av++;								       \
 	AN(*av);							       \
 	hdr.field.ptr = *av;						       \
@@ -1321,19 +1323,19 @@ cmd_sendhex(CMD_ARGS)
  * \-idxHdr INT
  *	Insert an indexed header, using INT as index.
  *
- * \-litIdxHdr inc|not|never INT huf|plain STRING
+ * \-litIdxHdr inc|not|never INT huf|plain|auto STRING
  *	Insert an literal, indexed header. The first argument specify if the
  *	header should be added to the table, shouldn't, or mustn't be
  *	compressed if/when retransmitted.
  *
  *	INT is the idex of the header name to use.
  *
- *	The third argument informs about the Huffman encoding: yes (huf) or
- *	no (plain).
+ *	The third argument informs about the Huffman encoding: yes (huf),
+ *	no (plain) or only if it makes STRING shorter (auto).
  *
  *	The last term is the literal value of the header.
  *
- * \-litHdr inc|not|never huf|plain STRING1 huf|plain STRING2
+ * \-litHdr inc|not|never huf|plain|auto STRING1 huf|plain|auto STRING2
  *	Insert a literal header, with the same first argument as
  *	``-litIdxHdr``.
  *
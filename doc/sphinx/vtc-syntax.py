@@ -30,48 +30,126 @@
 #
 # Process various varnishtest C files and output reStructuredText to be
 # included in vtc(7).
+#
+#	vtc-syntax.py [-C cache] [-i index] file...
+#
+# -C keeps the sections found in each file in a cache, checked against
+# the mtime and size of the files, then their SHA1 when these changed.
+# -i writes a JSON index of the sections, mapping each of them to the
+# "file:line" of its SECTION: comment.
 
+import getopt
+import hashlib
+import json
+import os
 import sys
 import re
 
+resec = re.compile(r"^[ /]\* SECTION: .*\n?", re.M)
+retitle = re.compile(r"^[\t ]*\/?\* SECTION: [^ ]+ +")
+rebody = re.compile(r"^ \* ?", re.M)
+
+
+def scan_file(text):
+    """
+    Return the (section, line, title, content) of a file, the content
+    running from the SECTION: line up to the next one or the end of
+    the comment.
+    """
+    r = []
+    secs = list(resec.finditer(text))
+    lno = 1
+    pos = 0
+    for i, m in enumerate(secs):
+        lno += text.count("\n", pos, m.start())
+        pos = m.start()
+        l = m.group(0)
+        a = l.split()
+        if len(a) > 3:
+            title = retitle.sub("", l)
+        else:
+            title = ""
+        end = secs[i + 1].start() if i + 1 < len(secs) else len(text)
+        e = text.find("*/", m.end(), end)
+        if e != -1:
+            end = text.rfind("\n", m.end(), e) + 1 or m.end()
+        r.append((a[2], lno, title, rebody.sub("", text[m.end():end])))
+    return r
+
+
+class Cache():
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.ents = {}
+        self.dirty = False
+        if fn is None:
+            return
+        try:
+            with open(fn) as f:
+                self.ents = json.load(f)
+        except (IOError, ValueError):
+            pass
+
+    def sections(self, fn):
+        st = os.stat(fn)
+        key = [st.st_mtime_ns, st.st_size]
+        e = self.ents.get(fn)
+        if e is not None and e["key"] == key:
+            return e["sections"]
+        with open(fn, "rb") as f:
+            data = f.read()
+        h = hashlib.sha1(data).hexdigest()
+        if e is None or e["sha1"] != h:
+            e = {"sha1": h, "sections": scan_file(data.decode("UTF-8"))}
+        e["key"] = key
+        self.ents[fn] = e
+        self.dirty = True
+        return e["sections"]
 
-def parse_file(fn, cl, tl, sl):
-    p = False
-    section = ""
-    resec = re.compile("[ /]\* SECTION: ")
+    def save(self):
+        if self.fn is None or not self.dirty:
+            return
+        tmp = self.fn + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.ents, f)
+        os.replace(tmp, self.fn)
 
-    try:
-        # Python3
-        f = open(fn, "r", encoding="UTF-8")
-    except TypeError:
-        # Python2
-        f = open(fn, "r")
 
-    for l in f:
-        if "*/" in l:
-            p = 0
-        if resec.match(l):
-            a = l.split()
-            section = a[2]
-            sl.append(section)
-            cl[section] = []
-            if len(a) > 3:
-                tl[section] = re.sub(
-                    r"^[\t ]*\/?\* SECTION: [^ ]+ +",
-                    "", l)
-            else:
-                tl[section] = ""
-            p = 1
-        elif p:
-            cl[section].append(re.sub(r"^ \* ?", "", l))
-    f.close()
+def parse_file(fn, cl, tl, sl, cache=None, idx=None):
+    if cache is None:
+        with open(fn, "r", encoding="UTF-8") as f:
+            secs = scan_file(f.read())
+    else:
+        secs = cache.sections(fn)
+    for section, lno, title, content in secs:
+        sl.append(section)
+        tl[section] = title
+        cl[section] = [content]
+        if idx is not None:
+            idx[section] = "%s:%d" % (fn, lno)
 
 if __name__ == "__main__":
+    optlist, args = getopt.getopt(sys.argv[1:], "C:i:")
+    cache = None
+    index = None
+    for f, v in optlist:
+        if f == "-C":
+            cache = v
+        elif f == "-i":
+            index = v
+    cache = Cache(cache)
+    idx = {}
     cl = {}
     tl = {}
     sl = []
-    for fn in sys.argv[1:]:
-        parse_file(fn, cl, tl, sl)
+    for fn in args:
+        parse_file(fn, cl, tl, sl, cache, idx)
+    cache.save()
+    if index is not None:
+        with open(index, "w") as f:
+            json.dump(idx, f, indent=1, sort_keys=True)
+            f.write("\n")
     sl.sort()
     for section in sl:
         print(tl[section], end="")
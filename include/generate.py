@@ -55,12 +55,87 @@ def file_header(fo):
 """)
 
 #######################################################################
+# Resolve HEAD by reading the repository, as this runs on every make.
+# Anything unusual, reftable or a HEAD without commits, is left to git.
 
+def read_line(fn):
+    try:
+        with open(fn) as f:
+            return f.readline().strip()
+    except (IOError, UnicodeDecodeError):
+        return None
 
-v = subprocess.check_output([
-    "git --git-dir=%s rev-parse HEAD 2>/dev/null || echo NOGIT" %
-    (os.path.join(srcroot, ".git"))
-    ], shell=True, universal_newlines=True).strip()
+def is_hash(s):
+    return len(s) in (40, 64) and \
+        all(c in "0123456789abcdef" for c in s)
+
+def git_dirs(gitdir):
+    """ Return the directory of HEAD and the common directory """
+    if os.path.isfile(gitdir):
+        # Worktree or submodule: "gitdir: <path>"
+        i = read_line(gitdir)
+        if i is None or i[:8] != "gitdir: ":
+            return None, None
+        gitdir = os.path.join(os.path.dirname(gitdir), i[8:])
+    i = read_line(os.path.join(gitdir, "commondir"))
+    if i is None:
+        return gitdir, gitdir
+    return gitdir, os.path.join(gitdir, i)
+
+def packed_ref(commondir, ref):
+    try:
+        f = open(os.path.join(commondir, "packed-refs"))
+    except IOError:
+        return None
+    with f:
+        for i in f:
+            i = i.split()
+            if len(i) == 2 and i[1] == ref:
+                return i[0]
+    return None
+
+def git_head(gitdir):
+    gitdir, commondir = git_dirs(gitdir)
+    if gitdir is None:
+        return None
+    v = read_line(os.path.join(gitdir, "HEAD"))
+    for _ in range(5):
+        if v is None:
+            return None
+        if is_hash(v):
+            return v
+        if v[:5] != "ref: ":
+            return None
+        ref = v[5:]
+        v = read_line(os.path.join(gitdir, ref))
+        if v is None and commondir != gitdir:
+            v = read_line(os.path.join(commondir, ref))
+        if v is None:
+            v = packed_ref(commondir, ref)
+    return None
+
+def package_string():
+    """ PACKAGE_STRING from config.h, or from the Makefile """
+    try:
+        with open(os.path.join(buildroot, "config.h")) as f:
+            for i in f:
+                if i[:23] == "#define PACKAGE_STRING ":
+                    return i[23:].strip().strip('"')
+    except IOError:
+        pass
+    for i in open(os.path.join(buildroot, "Makefile")):
+        if i[:14] == "PACKAGE_STRING":
+            break
+    return i.split("=")[1].strip()
+
+#######################################################################
+
+v = git_head(os.path.join(srcroot, ".git"))
+if v is None:
+    v = subprocess.check_output([
+        "git --git-dir=%s rev-parse HEAD 2>/dev/null || echo NOGIT" %
+        (os.path.join(srcroot, ".git"))
+        ], shell=True, universal_newlines=True).strip()
 
 vcsfn = os.path.join(srcroot, "include", "vcs_version.h")
 
@@ -78,10 +153,7 @@ if i != ident:
     fo.write('#define VCS_Version "%s"\n' % v)
     fo.close()
 
-    for i in open(os.path.join(buildroot, "Makefile")):
-        if i[:14] == "PACKAGE_STRING":
-            break
-    i = i.split("=")[1].strip()
+    i = package_string()
 
     fo = open(os.path.join(srcroot, "include", "vmod_abi.h"), "w")
     file_header(fo)
@@ -1,38 +1,53 @@
 #!/usr/bin/env python3
 #
 # Very basic style-checker for include/tbl files.
+#
+# The files are checked in parallel, and the hashes of the files found
+# clean are kept in .style.cache, next to this script, so that only the
+# files which changed get checked again.  -n ignores the cache.
 
+import concurrent.futures
+import getopt
 import glob
+import hashlib
+import os
+import sys
 
-def check_file(fn):
-    print("Check", fn)
-    ll = []
-    for l in open(fn):
-        ll.append(l)
+CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     ".style.cache")
 
-    assert ll.pop(0)[:2] == "/*"
+def check_lines(fn, ll):
+    """ Return the error messages, an assertion fails on bad layout """
+    assert ll[0][:2] == "/*"
 
-    while ll.pop(0) != " */\n":
-        continue
+    b = 1
+    while ll[b] != " */\n":
+        b += 1
+    b += 1
+    e = len(ll)
 
-    assert len(ll) > 5
+    assert e - b > 5
 
-    assert ll.pop(0) == "\n"
-    i = ll.pop(0)
+    assert ll[b] == "\n"
+    i = ll[b + 1]
     assert i == "/*lint -save -e525 -e539 */\n" or \
            i == "/*lint -save -e525 -e539 -e835 */\n"
-    assert ll.pop(0) == "\n"
+    assert ll[b + 2] == "\n"
+    b += 3
 
-    assert ll.pop(-1) == "/*lint -restore */\n"
-    assert ll.pop(-1) == "\n"
+    assert ll[e - 1] == "/*lint -restore */\n"
+    assert ll[e - 2] == "\n"
+    e -= 2
 
-    for i in range(0, len(ll) -1):
+    for i in range(b, e - 1):
         assert ll[i] != "\n" or ll[i+1] != "\n"
         assert ll[i] != ")\n" or ll[i+1] == "\n" or ll[i+1][0] == "#"
 
     m = {}
-    while ll:
-        i = ll.pop(0)
+    n = b
+    while n < e:
+        i = ll[n]
+        n += 1
         if i == "\n":
             continue
         l = i.lstrip()
@@ -43,8 +58,9 @@ def check_file(fn):
             l = l.split('/*')[0]
             l = l.rstrip()
             if l[-1] != ')':
-                while ll.pop(0).strip() != ')':
-                    continue
+                while ll[n].strip() != ')':
+                    n += 1
+                n += 1
         elif l[0] == "#":
             j = l[1:].lstrip().split()
             # print("#", j[0])
@@ -53,20 +69,87 @@ def check_file(fn):
             if j[0] == "undef":
                 m[j[1]] = "Undef"
             while l[-2:] == "\\\n":
-                l = ll.pop(0)
+                l = ll[n]
+                n += 1
         else:
             pass
             # print(l)
-    rv = 0
+    out = []
     for i in m:
         if m[i] != "Undef":
-            print("ERROR", fn, i, m[i])
-            rv += 1
-    return rv
-
-rv = 0
-for fn in glob.glob("*.h"):
-    rv += check_file(fn)
-if rv != 0:
-    print(rv, "Errors")
-exit(rv)
+            out.append("ERROR %s %s %s" % (fn, i, m[i]))
+    return out
+
+def check_file(fn):
+    """ Return the hash of the file and its error messages """
+    with open(fn, "rb") as f:
+        data = f.read()
+    ll = data.decode().splitlines(True)
+    try:
+        out = check_lines(fn, ll)
+    except (AssertionError, IndexError):
+        out = ["ERROR %s bad layout" % fn]
+    return hashlib.sha1(data).hexdigest(), ["Check " + fn] + out
+
+def file_hash(fn):
+    with open(fn, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def read_cache():
+    """ The hashes of clean files, for this version of the checker """
+    try:
+        with open(CACHE) as f:
+            ll = f.read().split()
+    except IOError:
+        return set()
+    if not ll or ll[0] != file_hash(os.path.abspath(__file__)):
+        return set()
+    return set(ll[1:])
+
+def write_cache(clean):
+    tmp = CACHE + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(file_hash(os.path.abspath(__file__)) + "\n")
+        for i in sorted(clean):
+            f.write(i + "\n")
+    os.replace(tmp, CACHE)
+
+def main():
+    optlist, args = getopt.getopt(sys.argv[1:], "j:n")
+    njobs = os.cpu_count() or 1
+    use_cache = True
+    for f, v in optlist:
+        if f == '-j':
+            njobs = int(v)
+        elif f == '-n':
+            use_cache = False
+    if not args:
+        args = sorted(glob.glob("*.h"))
+
+    cached = read_cache() if use_cache else set()
+    hashes = [file_hash(fn) for fn in args]
+    clean = cached.intersection(hashes)
+    todo = [fn for fn, h in zip(args, hashes) if h not in clean]
+
+    # Starting workers costs more than checking a handful of files
+    if njobs > 1 and len(todo) > 8:
+        with concurrent.futures.ProcessPoolExecutor(njobs) as ex:
+            results = list(ex.map(check_file, todo))
+    else:
+        results = [check_file(fn) for fn in todo]
+
+    rv = 0
+    for h, out in results:
+        for i in out:
+            print(i)
+        if len(out) == 1:
+            clean.add(h)
+        rv += len(out) - 1
+    if use_cache and clean != cached:
+        write_cache(clean)
+    if rv != 0:
+        print(rv, "Errors")
+    exit(rv)
+
+if __name__ == "__main__":
+    main()
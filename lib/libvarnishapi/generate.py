@@ -33,14 +33,38 @@
 # Generate various .c and .h files for the VSL query expression parser
 # and the interfaces for it.
 
+import getopt
 import sys
 import copy
 
-srcroot = "../.."
+def usage():
+    sys.stderr.write("Usage: %s [-l table|switch] [srcdir buildroot]\n" %
+                     sys.argv[0])
+    sys.exit(2)
+
+# The fixed token recognizer is either a DFA driven by a character class
+# table ("table") or a switch on the first character followed by string
+# compares ("switch").
+lexer = "table"
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], "l:")
+except getopt.GetoptError as err:
+    sys.stderr.write(str(err) + "\n")
+    usage()
+for o, a in opts:
+    if o == "-l" and a in ("table", "switch"):
+        lexer = a
+    else:
+        usage()
+
+srcdir = "."
 buildroot = "../.."
-if len(sys.argv) == 3:
-    srcroot = sys.argv[1]
-    buildroot = sys.argv[2]
+if len(args) == 2:
+    srcdir = args[0]
+    buildroot = args[1]
+elif args:
+    usage()
 
 #######################################################################
 # These are our tokens
@@ -73,9 +97,25 @@ tokens = {
 
     # Special
     "T_TRUE":       None,
+    "T_IN":         None,  # 'in' after an lhs, see vxp_expr_cmp()
     "VXID":         "vxid",
 }
 
+#######################################################################
+# Emit the tag bitmap type
+
+def emit_vxp_tags_h(fo):
+    fo.write("""
+struct vxp_tagmap {
+	uint64_t		w[SLT__MAX / 64];
+};
+
+#define VXP_TAGMAP_SET(tm, tag) \\
+	((tm)->w[(tag) >> 6] |= (uint64_t)1 << ((tag) & 63))
+#define VXP_TAGMAP_TEST(tm, tag) \\
+	(((tm)->w[(tag) >> 6] >> ((tag) & 63)) & 1)
+""")
+
 #######################################################################
 # Emit a function to recognize tokens in a string
 
@@ -124,6 +164,113 @@ vxp_fixed_token(const char *p, const char **q)
 
     fo.write("\tdefault:\n\t\treturn (0);\n\t}\n}\n")
 
+#######################################################################
+# Emit the character class table used by the lexer
+
+def is_word(c):
+    return c.isalnum() or c in "_-+.*"
+
+def emit_vxp_cclass(fo):
+    fo.write("\nconst unsigned char vxp_cclass[256] = {\n")
+    for i in range(1, 128):
+        c = chr(i)
+        l = []
+        if c in " \t":
+            l.append("VXP_CC_BLANK")
+        if is_word(c):
+            l.append("VXP_CC_WORD")
+        if c in "\"'":
+            l.append("VXP_CC_QUOTE")
+        if l:
+            fo.write("\t[%d] = %s,\t/* %s */\n" % (i, " | ".join(l),
+                     repr(c)))
+    fo.write("};\n")
+
+#######################################################################
+# Emit a DFA to recognize tokens in a string
+#
+# The DFA is a trie over the token strings, with the input characters
+# mapped to a small number of classes first.  A token is accepted at
+# the longest match, provided it does not end in the middle of a word.
+
+def emit_vxp_fixed_token_dfa(fo, tokens):
+    recog = dict()
+    for i in tokens:
+        j = tokens[i]
+        if j is not None:
+            recog[j] = i
+
+    # Input classes, 0 is "not in any token"
+    chars = sorted(set("".join(recog)))
+    cls = dict()
+    for i in chars:
+        cls[i] = len(cls) + 1
+
+    # States, 0 is the dead state, 1 the start state
+    trans = [dict(), dict()]
+    accept = [None, None]
+    for tok in sorted(recog):
+        st = 1
+        for c in tok:
+            if c not in trans[st]:
+                trans[st][c] = len(trans)
+                trans.append(dict())
+                accept.append(None)
+            st = trans[st][c]
+        accept[st] = tok
+    assert len(trans) < 256
+    assert len(cls) < 256
+
+    fo.write("\nstatic const unsigned char vxp_dfa_class[256] = {\n")
+    for c in chars:
+        fo.write("\t['%s'] = %d,\n" % (c, cls[c]))
+    fo.write("};\n")
+
+    fo.write("\nstatic const unsigned char vxp_dfa[%d][%d] = {\n" %
+             (len(trans), len(cls) + 1))
+    for st, t in enumerate(trans):
+        if not t:
+            continue
+        fo.write("\t[%d] = {" % st)
+        fo.write(", ".join("[%d] = %d" % (cls[c], t[c]) for c in sorted(t)))
+        fo.write("},\n")
+    fo.write("};\n")
+
+    fo.write("""
+static const struct {
+	unsigned		tok;
+	unsigned		word;
+} vxp_dfa_accept[%d] = {
+""" % len(trans))
+    for st, tok in enumerate(accept):
+        if tok is None:
+            continue
+        fo.write("\t[%d] = { %s, %d },\t/* %s */\n" %
+                 (st, recog[tok], is_word(tok[-1]), tok))
+    fo.write("};\n")
+
+    fo.write("""
+unsigned
+vxp_fixed_token(const char *p, const char **q)
+{
+	unsigned st = 1, tok = 0;
+	const char *r;
+
+	for (r = p; ; r++) {
+		st = vxp_dfa[st][vxp_dfa_class[(unsigned char)*r]];
+		if (st == 0)
+			break;
+		if (vxp_dfa_accept[st].tok == 0)
+			continue;
+		if (vxp_dfa_accept[st].word && isword(r[1]))
+			continue;
+		tok = vxp_dfa_accept[st].tok;
+		*q = r + 1;
+	}
+	return (tok);
+}
+""")
+
 #######################################################################
 # Emit the vxp_tnames (token->string) conversion array
 
@@ -198,7 +345,20 @@ fo.write("""
 #include "vxp.h"
 """)
 
-emit_vxp_fixed_token(fo, tokens)
+emit_vxp_cclass(fo)
+if lexer == "table":
+    emit_vxp_fixed_token_dfa(fo, tokens)
+else:
+    emit_vxp_fixed_token(fo, tokens)
 emit_vxp_tnames(fo, tokens)
 
 fo.close()
+
+#######################################################################
+
+fo = open(buildroot + "/lib/libvarnishapi/vxp_tags.h", "w")
+
+file_header(fo)
+emit_vxp_tags_h(fo)
+
+fo.close()
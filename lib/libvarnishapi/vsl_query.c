@@ -34,7 +34,10 @@
 
 #include <ctype.h>
 #include <math.h>
+#include <stdint.h>
 #include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
 
 #include "vdef.h"
 #include "vas.h"
@@ -50,14 +53,53 @@
 
 #include "vsl_api.h"
 #include "vxp.h"
+#include "vxp_tags.h"
+
+/*--------------------------------------------------------------------
+ * The query expression tree is lowered into a linear program operating
+ * on a single result register, with short-circuit jumps for 'and' and
+ * 'or'.  Each test carries the bitmap of the tags it applies to.  Before
+ * the first test the tags present in the transactions are collected,
+ * from the record headers only, and tests for tags not present are
+ * decided without looking at any record.  The bitmap type comes from
+ * generate.py.
+ */
+
+enum vslq_op_e {
+	VSLQ_OP_TEST,		/* r = test(vex) */
+	VSLQ_OP_NOT,		/* r = !r */
+	VSLQ_OP_JZ,		/* if (!r) goto jmp */
+	VSLQ_OP_JNZ,		/* if (r) goto jmp */
+};
+
+struct vslq_op {
+	enum vslq_op_e		op;
+	unsigned		jmp;
+	const struct vex	*vex;
+	struct vxp_tagmap	tags;
+};
 
 struct vslq_query {
 	unsigned		magic;
 #define VSLQ_QUERY_MAGIC	0x122322A5
 
 	struct vex		*vex;
+
+	struct vslq_op		*prog;
+	unsigned		nprog;
 };
 
+static inline int
+vslq_tagmap_isect(const struct vxp_tagmap *a, const struct vxp_tagmap *b)
+{
+	unsigned u;
+
+	for (u = 0; u < SLT__MAX / 64; u++)
+		if (a->w[u] & b->w[u])
+			return (1);
+	return (0);
+}
+
 #define VSLQ_TEST_NUMOP(TYPE, PRE_LHS, OP, PRE_RHS)		\
 	do {							\
 		switch (TYPE) {					\
@@ -95,7 +137,12 @@ vslq_test_vxid(const struct vex *vex, const struct VSL_transaction *trans)
 	case T_GEQ:		/* >= */
 		if (rhs->type != VEX_INT)
 			WRONG("Wrong RHS type for vxid");
-		/* FALLTHROUGH */
+		break;
+	case T_IN:		/* in */
+		if (rhs->type != VEX_SET ||
+		    vex_set_count_str(rhs->val_set) != 0)
+			WRONG("Wrong RHS type for vxid");
+		break;
 	default:
 		break;
 	}
@@ -110,6 +157,7 @@ vslq_test_vxid(const struct vex *vex, const struct VSL_transaction *trans)
 	case T_LEQ:	VXID_TEST_NUMOP(<=);
 	case T_GEQ:	VXID_TEST_NUMOP(>=);
 	#undef VXID_TEST_NUMOP
+	case T_IN:	return (vex_set_has_int(rhs->val_set, trans->vxid));
 	default:	WRONG("Bad vxid expression token");
 	}
 
@@ -223,6 +271,18 @@ vslq_test_rec(const struct vex *vex, const struct VSLC_ptr *rec)
 			WRONG("Wrong RHS type");
 		}
 		break;
+	case T_IN:		/* in */
+		/* String members first, then integer members */
+		assert(rhs->type == VEX_SET);
+		if (vex_set_count_str(rhs->val_set) > 0 &&
+		    vex_set_has_str(rhs->val_set, b, e - b))
+			return (1);
+		if (vex_set_count_int(rhs->val_set) == 0 || *b == '\0')
+			return (0);
+		lhs_int = strtoll(b, &p, 0);
+		if (*p != '\0' && !isspace(*p))
+			return (0); /* Can't parse - no match */
+		break;
 	default:
 		break;
 	}
@@ -277,18 +337,68 @@ vslq_test_rec(const struct vex *vex, const struct VSLC_ptr *rec)
 		if (i == VRE_ERROR_NOMATCH)
 			return (1);
 		return (0);
+	case T_IN:		/* in */
+		return (vex_set_has_int(rhs->val_set, lhs_int));
 	default:
 		WRONG("Bad expression token");
 	}
 	NEEDLESS(return (0));
 }
 
+/*
+ * Advance the cursor to the next record with one of the tags in the map.
+ * The decision is made on the record header alone, the payload is not
+ * looked at.
+ */
+
 static int
-vslq_test(const struct vex *vex, struct VSL_transaction * const ptrans[])
+vslq_next(const struct VSL_cursor *c, const struct vxp_tagmap *tags)
+{
+	int i;
+
+	do {
+		i = VSL_Next(c);
+		if (i != 1)
+			return (i);
+		AN(c->rec.ptr);
+	} while (!VXP_TAGMAP_TEST(tags, VSL_TAG(c->rec.ptr)));
+	return (i);
+}
+
+/* Collect the tags of all the records in the transactions */
+static int
+vslq_present(struct VSL_transaction * const ptrans[],
+    struct vxp_tagmap *present)
 {
 	struct VSL_transaction *t;
 	int i;
 
+	AN(present);
+	for (t = ptrans[0]; t != NULL; t = *++ptrans) {
+		AZ(VSL_ResetCursor(t->c));
+		while (1) {
+			i = VSL_Next(t->c);
+			if (i < 0)
+				return (i);
+			if (i == 0)
+				break;
+			assert(i == 1);
+			AN(t->c->rec.ptr);
+			VXP_TAGMAP_SET(present, VSL_TAG(t->c->rec.ptr));
+		}
+	}
+	return (0);
+}
+
+static int
+vslq_test(const struct vslq_op *op, struct VSL_transaction * const ptrans[])
+{
+	const struct vex *vex;
+	struct VSL_transaction *t;
+	int i;
+
+	AN(op);
+	vex = op->vex;
 	CHECK_OBJ_NOTNULL(vex, VEX_MAGIC);
 	CHECK_OBJ_NOTNULL(vex->lhs, VEX_LHS_MAGIC);
 	AN(vex->lhs->tags);
@@ -323,59 +433,134 @@ vslq_test(const struct vex *vex, struct VSL_transaction * const ptrans[])
 
 		AZ(VSL_ResetCursor(t->c));
 		while (1) {
-			i = VSL_Next(t->c);
+			i = vslq_next(t->c, &op->tags);
 			if (i < 0)
 				return (i);
 			if (i == 0)
 				break;
 			assert(i == 1);
-			AN(t->c->rec.ptr);
-
-			if (!vbit_test(vex->lhs->tags, VSL_TAG(t->c->rec.ptr)))
-				continue;
 
 			i = vslq_test_rec(vex, &t->c->rec);
 			if (i)
 				return (i);
 		}
 	}
-
 	return (0);
 }
 
-static int
-vslq_exec(const struct vex *vex, struct VSL_transaction * const ptrans[])
+/*--------------------------------------------------------------------
+ * Compile the expression tree
+ */
+
+static unsigned
+vslq_count(const struct vex *vex)
 {
-	int r;
 
 	CHECK_OBJ_NOTNULL(vex, VEX_MAGIC);
+	switch (vex->tok) {
+	case T_OR:
+	case T_AND:
+		return (vslq_count(vex->a) + vslq_count(vex->b) + 1);
+	case T_NOT:
+		return (vslq_count(vex->a) + 1);
+	default:
+		return (1);
+	}
+}
+
+static void
+vslq_compile(struct vslq_query *query, const struct vex *vex)
+{
+	struct vslq_op *op;
+	unsigned u;
+
+	CHECK_OBJ_NOTNULL(query, VSLQ_QUERY_MAGIC);
+	CHECK_OBJ_NOTNULL(vex, VEX_MAGIC);
 
 	switch (vex->tok) {
 	case T_OR:
-		AN(vex->a);
-		AN(vex->b);
-		r = vslq_exec(vex->a, ptrans);
-		if (r != 0)
-			return (r);
-		return (vslq_exec(vex->b, ptrans));
 	case T_AND:
 		AN(vex->a);
 		AN(vex->b);
-		r = vslq_exec(vex->a, ptrans);
-		if (r <= 0)
-			return (r);
-		return (vslq_exec(vex->b, ptrans));
+		vslq_compile(query, vex->a);
+		op = &query->prog[query->nprog++];
+		op->op = vex->tok == T_OR ? VSLQ_OP_JNZ : VSLQ_OP_JZ;
+		vslq_compile(query, vex->b);
+		op->jmp = query->nprog;
+		break;
 	case T_NOT:
 		AN(vex->a);
 		AZ(vex->b);
-		r = vslq_exec(vex->a, ptrans);
-		if (r < 0)
-			return (r);
-		return (!r);
+		vslq_compile(query, vex->a);
+		op = &query->prog[query->nprog++];
+		op->op = VSLQ_OP_NOT;
+		break;
 	default:
-		return (vslq_test(vex, ptrans));
+		CHECK_OBJ_NOTNULL(vex->lhs, VEX_LHS_MAGIC);
+		op = &query->prog[query->nprog++];
+		op->op = VSLQ_OP_TEST;
+		op->vex = vex;
+		if (vex->lhs->vxid)
+			break;
+		AN(vex->lhs->tags);
+		for (u = 0; u < SLT__MAX; u++)
+			if (vbit_test(vex->lhs->tags, u))
+				VXP_TAGMAP_SET(&op->tags, u);
+		break;
 	}
-	NEEDLESS(return (0));
+}
+
+/*--------------------------------------------------------------------
+ * Run the program.  Errors from the tests are passed on immediately,
+ * like the recursive evaluation of the tree did.
+ */
+
+static int
+vslq_exec(const struct vslq_query *query,
+    struct VSL_transaction * const ptrans[])
+{
+	const struct vslq_op *op;
+	struct vxp_tagmap present;
+	unsigned pc = 0, have_present = 0;
+	int r = 0;
+
+	CHECK_OBJ_NOTNULL(query, VSLQ_QUERY_MAGIC);
+
+	while (pc < query->nprog) {
+		op = &query->prog[pc++];
+		switch (op->op) {
+		case VSLQ_OP_TEST:
+			if (!op->vex->lhs->vxid && !have_present) {
+				memset(&present, 0, sizeof present);
+				r = vslq_present(ptrans, &present);
+				if (r < 0)
+					return (r);
+				have_present = 1;
+			}
+			if (!op->vex->lhs->vxid &&
+			    !vslq_tagmap_isect(&op->tags, &present))
+				r = 0;
+			else
+				r = vslq_test(op, ptrans);
+			if (r < 0)
+				return (r);
+			break;
+		case VSLQ_OP_NOT:
+			r = !r;
+			break;
+		case VSLQ_OP_JZ:
+			if (!r)
+				pc = op->jmp;
+			break;
+		case VSLQ_OP_JNZ:
+			if (r)
+				pc = op->jmp;
+			break;
+		default:
+			WRONG("Bad vslq op");
+		}
+	}
+	return (r);
 }
 
 struct vslq_query *
@@ -399,6 +584,10 @@ vslq_newquery(struct VSL_data *vsl, enum VSL_grouping_e grouping,
 		ALLOC_OBJ(query, VSLQ_QUERY_MAGIC);
 		XXXAN(query);
 		query->vex = vex;
+		query->prog = calloc(vslq_count(vex), sizeof *query->prog);
+		XXXAN(query->prog);
+		vslq_compile(query, vex);
+		assert(query->nprog == vslq_count(vex));
 	}
 	VSB_destroy(&vsb);
 	return (query);
@@ -414,6 +603,7 @@ vslq_deletequery(struct vslq_query **pquery)
 	AN(query->vex);
 	vex_Free(&query->vex);
 	AZ(query->vex);
+	free(query->prog);
 
 	FREE_OBJ(query);
 }
@@ -427,7 +617,7 @@ vslq_runquery(const struct vslq_query *query,
 
 	CHECK_OBJ_NOTNULL(query, VSLQ_QUERY_MAGIC);
 
-	r = vslq_exec(query->vex, ptrans);
+	r = vslq_exec(query, ptrans);
 	for (t = ptrans[0]; t != NULL; t = *++ptrans)
 		AZ(VSL_ResetCursor(t->c));
 	return (r);
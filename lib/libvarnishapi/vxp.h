@@ -32,14 +32,20 @@
 
 #include "vxp_tokens.h"
 
-#define isword(c)  (isalpha(c) || isdigit(c) || (c) == '_' || (c) == '-' || \
-	    (c) == '+' || (c) == '.' || (c) == '*')
+/* Character classes, see vxp_cclass[] */
+#define VXP_CC_BLANK		(1U << 0)
+#define VXP_CC_WORD		(1U << 1)
+#define VXP_CC_QUOTE		(1U << 2)
+
+#define vxp_iscc(c, cc)	(vxp_cclass[(unsigned char)(c)] & (cc))
+#define isword(c)	vxp_iscc(c, VXP_CC_WORD)
 
 #define PF(t)	(int)((t)->e - (t)->b), (t)->b
 
 /* From vex_fixed_token.c */
 unsigned vxp_fixed_token(const char *p, const char **q);
 extern const char * const vxp_tnames[256];
+extern const unsigned char vxp_cclass[256];
 
 struct membit {
 	VTAILQ_ENTRY(membit)	list;
@@ -94,6 +100,7 @@ enum vex_rhs_e {
 	VEX_FLOAT,
 	VEX_STRING,
 	VEX_REGEX,
+	VEX_SET,
 };
 
 struct vex_rhs {
@@ -107,6 +114,7 @@ struct vex_rhs {
 	char			*val_string;
 	size_t			val_stringlen;
 	vre_t			*val_regex;
+	struct vex_set		*val_set;
 };
 
 struct vex {
@@ -134,6 +142,16 @@ void * vxp_Alloc(struct vxp *vxp, unsigned len);
 void vxp_Lexer(struct vxp *vxp);
 struct vex * vxp_Parse(struct vxp *vxp);
 
+/* Hashed sets, vxp_set.c */
+struct vex_set *vex_set_new(unsigned caseless);
+void vex_set_destroy(struct vex_set **);
+unsigned vex_set_count_str(const struct vex_set *);
+unsigned vex_set_count_int(const struct vex_set *);
+int vex_set_add_str(struct vex_set *, const char *, size_t);
+int vex_set_has_str(const struct vex_set *, const char *, size_t);
+int vex_set_add_int(struct vex_set *, long long);
+int vex_set_has_int(const struct vex_set *, long long);
+
 /* API internal interface */
 #define VEX_OPT_CASELESS	(1 << 0)
 struct vex * vex_New(const char *query, struct vsb *sb, unsigned options);
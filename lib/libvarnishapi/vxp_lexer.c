@@ -32,7 +32,6 @@
 
 #include "config.h"
 
-#include <ctype.h>
 #include <stdlib.h>
 #include <string.h>
 #include <unistd.h> /* for MUSL */
@@ -103,7 +102,7 @@ vxp_Lexer(struct vxp *vxp)
 	for (p = vxp->b; p < vxp->e; ) {
 
 		/* Skip any space or tab */
-		if (isblank(*p)) {
+		if (vxp_iscc(*p, VXP_CC_BLANK)) {
 			p++;
 			continue;
 		}
@@ -130,7 +129,7 @@ vxp_Lexer(struct vxp *vxp)
 		}
 
 		/* Match quoted strings */
-		if (*p == '"' || *p == '\'') {
+		if (vxp_iscc(*p, VXP_CC_QUOTE)) {
 			quote = *p;
 			for (q = p + 1; q < vxp->e; q++) {
 				if (*q == '\\') {
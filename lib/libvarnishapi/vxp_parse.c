@@ -141,9 +141,11 @@ vxp_expr_lhs(struct vxp *vxp, struct vex_lhs **plhs)
 		}
 		assert(i > 0 || vxp->t->tok == VXID);
 		vxp_NextToken(vxp);
+		ERRCHK(vxp);
 		if (vxp->t->tok != ',')
 			break;
 		vxp_NextToken(vxp);
+		ERRCHK(vxp);
 	}
 
 	if (vxp->t->tok == ':') {
@@ -289,6 +291,79 @@ vxp_expr_regex(struct vxp *vxp, struct vex_rhs **prhs)
 	vxp_NextToken(vxp);
 }
 
+/*
+ * SYNTAX:
+ *   expr_set:
+ *     '{' val { ',' val }* '}'
+ *
+ * Each value is typed on its own: an unquoted value that parses as an
+ * integer is an integer, anything else is a string.
+ */
+
+static int
+vxp_set_int(const struct token *t, long long *pi)
+{
+	char *endptr;
+
+	AN(t->dec);
+	if (vxp_iscc(*t->b, VXP_CC_QUOTE) || *t->dec == '\0')
+		return (0);
+	*pi = strtoll(t->dec, &endptr, 0);
+	return (*endptr == '\0');
+}
+
+static void
+vxp_expr_set(struct vxp *vxp, struct vex_rhs **prhs, unsigned vxid)
+{
+	struct token *t, *t0;
+	long long i;
+
+	AN(prhs);
+	AZ(*prhs);
+	SkipToken(vxp, '{');
+	t0 = vxp->t;
+
+	/* Check the syntax */
+	while (1) {
+		if (vxp->t->tok != VAL) {
+			VSB_printf(vxp->sb, "Expected set value got '%.*s' ",
+			    PF(vxp->t));
+			vxp_ErrWhere(vxp, vxp->t, -1);
+			return;
+		}
+		if (vxid && !vxp_set_int(vxp->t, &i)) {
+			VSB_printf(vxp->sb, "Expected integer got '%.*s' ",
+			    PF(vxp->t));
+			vxp_ErrWhere(vxp, vxp->t, -1);
+			return;
+		}
+		vxp_NextToken(vxp);
+		ERRCHK(vxp);
+		if (vxp->t->tok != ',')
+			break;
+		vxp_NextToken(vxp);
+		ERRCHK(vxp);
+	}
+	ExpectErr(vxp, '}');
+
+	ALLOC_OBJ(*prhs, VEX_RHS_MAGIC);
+	AN(*prhs);
+	(*prhs)->type = VEX_SET;
+	(*prhs)->val_set =
+	    vex_set_new(vxp->vex_options & VEX_OPT_CASELESS ? 1 : 0);
+	AN((*prhs)->val_set);
+	for (t = t0; t != vxp->t; t = VTAILQ_NEXT(t, list)) {
+		if (t->tok != VAL)
+			continue;
+		if (vxp_set_int(t, &i))
+			(void)vex_set_add_int((*prhs)->val_set, i);
+		else
+			(void)vex_set_add_str((*prhs)->val_set, t->dec,
+			    strlen(t->dec));
+	}
+	vxp_NextToken(vxp);
+}
+
 static void
 vxp_vxid_cmp(struct vxp *vxp)
 {
@@ -301,6 +376,7 @@ vxp_vxid_cmp(struct vxp *vxp)
 	case T_GEQ:		/* >= */
 	case T_LEQ:		/* <= */
 	case T_NEQ:		/* != */
+	case T_IN:		/* in */
 		break;
 
 	/* Error */
@@ -316,6 +392,10 @@ vxp_vxid_cmp(struct vxp *vxp)
  *   expr_cmp:
  *     lhs
  *     lhs <operator> num|str|regex
+ *     lhs 'in' set
+ *
+ * 'in' is not a reserved word, a bare 'in' is only the set membership
+ * operator right after an lhs, and otherwise a value.
  */
 
 static void
@@ -329,6 +409,10 @@ vxp_expr_cmp(struct vxp *vxp, struct vex **pvex)
 	vxp_expr_lhs(vxp, &(*pvex)->lhs);
 	ERRCHK(vxp);
 
+	if (vxp->t->tok == VAL && vxp->t->e - vxp->t->b == 2 &&
+	    !strncmp(vxp->t->b, "in", 2))
+		vxp->t->tok = T_IN;
+
 	if ((*pvex)->lhs->vxid) {
 		vxp_vxid_cmp(vxp);
 		ERRCHK(vxp);
@@ -356,6 +440,7 @@ vxp_expr_cmp(struct vxp *vxp, struct vex **pvex)
 	case T_SNEQ:		/* ne */
 	case '~':		/* ~ */
 	case T_NOMATCH:		/* !~ */
+	case T_IN:		/* in */
 		(*pvex)->tok = vxp->t->tok;
 		break;
 
@@ -390,6 +475,9 @@ vxp_expr_cmp(struct vxp *vxp, struct vex **pvex)
 	case T_NOMATCH:		/* !~ */
 		vxp_expr_regex(vxp, &(*pvex)->rhs);
 		break;
+	case T_IN:		/* in */
+		vxp_expr_set(vxp, &(*pvex)->rhs, (*pvex)->lhs->vxid);
+		break;
 	default:
 		INCOMPL();
 	}
@@ -531,6 +619,199 @@ vxp_expr(struct vxp *vxp, struct vex **pvex)
 	*pvex = or;
 }
 
+/*
+ * Merge the regular expression matches on the same records in a chain
+ * of 'or' expressions into a single match against the alternation of
+ * the regular expressions, so each record is scanned only once:
+ *
+ *   A ~ r1 or B or A ~ r2   =>   A ~ "(?:r1)|(?:r2)" or B
+ *
+ * Only the truth of the chain matters, so which of the expressions
+ * matched is not tracked.  Expressions referring to groups by number,
+ * with back references or recursion, are left alone since the
+ * numbering of groups changes in the alternation.  So are those with
+ * named references, branch resets, conditionals and backtracking
+ * control verbs, which can reach outside of their alternative.
+ */
+
+static int
+vex_lhs_eq(const struct vex_lhs *a, const struct vex_lhs *b)
+{
+	unsigned u;
+
+	CHECK_OBJ_NOTNULL(a, VEX_LHS_MAGIC);
+	CHECK_OBJ_NOTNULL(b, VEX_LHS_MAGIC);
+	if (a->vxid || b->vxid)
+		return (0);
+	if (a->field != b->field || a->level != b->level ||
+	    a->level_pm != b->level_pm)
+		return (0);
+	if ((a->prefix == NULL) != (b->prefix == NULL))
+		return (0);
+	if (a->prefix != NULL && strcmp(a->prefix, b->prefix))
+		return (0);
+	for (u = 0; u < SLT__MAX; u++)
+		if (!vbit_test(a->tags, u) != !vbit_test(b->tags, u))
+			return (0);
+	return (1);
+}
+
+static int
+vex_regex_mergeable(const struct vex *vex)
+{
+	const char *p;
+
+	CHECK_OBJ_NOTNULL(vex, VEX_MAGIC);
+	if (vex->tok != '~')
+		return (0);
+	CHECK_OBJ_NOTNULL(vex->rhs, VEX_RHS_MAGIC);
+	assert(vex->rhs->type == VEX_REGEX);
+	AN(vex->rhs->val_string);
+	for (p = vex->rhs->val_string; *p != '\0'; p++) {
+		if (p[0] == '\\' && p[1] != '\0') {
+			/* \N, \gN, \g{N}, \k<name>... */
+			p++;
+			if (isdigit(*p) || *p == 'g' || *p == 'k')
+				return (0);
+			continue;
+		}
+		if (p[0] != '(')
+			continue;
+		/* (*COMMIT), (*SKIP)... */
+		if (p[1] == '*')
+			return (0);
+		if (p[1] != '?')
+			continue;
+		/* (?1), (?+1), (?-1), (?R), (?&name), (?P>name), (?(1)...) */
+		if (isdigit(p[2]) ||
+		    (p[2] != '\0' && strchr("+R&P(|", p[2]) != NULL))
+			return (0);
+		if (p[2] == '-' && isdigit(p[3]))
+			return (0);
+	}
+	return (1);
+}
+
+static unsigned
+vex_or_leaves(struct vex *vex, struct vex **leaves, unsigned n)
+{
+
+	CHECK_OBJ_NOTNULL(vex, VEX_MAGIC);
+	if (vex->tok != T_OR) {
+		if (leaves != NULL)
+			leaves[n] = vex;
+		return (n + 1);
+	}
+	n = vex_or_leaves(vex->a, leaves, n);
+	n = vex_or_leaves(vex->b, leaves, n);
+	if (leaves != NULL) {
+		/* The leaves are relinked by the caller */
+		vex->a = vex->b = NULL;
+		vex_Free(&vex);
+	}
+	return (n);
+}
+
+/* Merge the leaves after leaves[i] with the same lhs into it */
+static void
+vex_merge_regex(const struct vxp *vxp, struct vex **leaves, unsigned n,
+    unsigned i)
+{
+	struct vsb *vsb;
+	const char *errptr;
+	unsigned j, m = 0;
+	int erroff;
+	vre_t *re;
+
+	vsb = VSB_new_auto();
+	AN(vsb);
+	VSB_printf(vsb, "(?:%s)", leaves[i]->rhs->val_string);
+	for (j = i + 1; j < n; j++) {
+		if (leaves[j] == NULL || !vex_regex_mergeable(leaves[j]) ||
+		    !vex_lhs_eq(leaves[i]->lhs, leaves[j]->lhs))
+			continue;
+		VSB_printf(vsb, "|(?:%s)", leaves[j]->rhs->val_string);
+		m++;
+	}
+	AZ(VSB_finish(vsb));
+	re = NULL;
+	if (m > 0)
+		re = VRE_compile(VSB_data(vsb), vxp->vre_options, &errptr,
+		    &erroff);
+	if (re == NULL) {
+		/* Leave them as they are */
+		VSB_destroy(&vsb);
+		return;
+	}
+	VRE_free(&leaves[i]->rhs->val_regex);
+	leaves[i]->rhs->val_regex = re;
+	free(leaves[i]->rhs->val_string);
+	leaves[i]->rhs->val_string = strdup(VSB_data(vsb));
+	AN(leaves[i]->rhs->val_string);
+	VSB_destroy(&vsb);
+
+	for (j = i + 1; j < n; j++) {
+		if (leaves[j] == NULL || !vex_regex_mergeable(leaves[j]) ||
+		    !vex_lhs_eq(leaves[i]->lhs, leaves[j]->lhs))
+			continue;
+		vex_Free(&leaves[j]);
+		AZ(leaves[j]);
+	}
+}
+
+static void
+vex_merge_or(const struct vxp *vxp, struct vex **pvex)
+{
+	struct vex **leaves, *vex, *or;
+	unsigned i, n;
+
+	AN(pvex);
+	vex = *pvex;
+	CHECK_OBJ_NOTNULL(vex, VEX_MAGIC);
+
+	if (vex->tok != T_OR) {
+		if (vex->a != NULL)
+			vex_merge_or(vxp, &vex->a);
+		if (vex->b != NULL)
+			vex_merge_or(vxp, &vex->b);
+		return;
+	}
+
+	n = vex_or_leaves(vex, NULL, 0);
+	leaves = calloc(n, sizeof *leaves);
+	AN(leaves);
+	i = vex_or_leaves(vex, leaves, 0);
+	assert(i == n);
+	*pvex = NULL;
+
+	for (i = 0; i < n; i++) {
+		if (leaves[i] == NULL)
+			continue;
+		if (vex_regex_mergeable(leaves[i]))
+			vex_merge_regex(vxp, leaves, n, i);
+		else
+			vex_merge_or(vxp, &leaves[i]);
+	}
+
+	/* Relink the remaining leaves as a left deep chain */
+	for (i = 0; i < n; i++) {
+		if (leaves[i] == NULL)
+			continue;
+		if (*pvex == NULL) {
+			*pvex = leaves[i];
+			continue;
+		}
+		or = vex_alloc(vxp);
+		AN(or);
+		or->tok = T_OR;
+		or->a = *pvex;
+		or->b = leaves[i];
+		*pvex = or;
+	}
+	AN(*pvex);
+	free(leaves);
+}
+
 /*
  * Build a struct vex tree from the token list in vxp
  */
@@ -563,6 +844,8 @@ vxp_Parse(struct vxp *vxp)
 		vxp->t = VTAILQ_NEXT(vxp->t, list);
 	}
 
+	if (vex != NULL)
+		vex_merge_or(vxp, &vex);
 	return (vex);
 }
 
@@ -586,6 +869,8 @@ vex_Free(struct vex **pvex)
 			free((*pvex)->rhs->val_string);
 		if ((*pvex)->rhs->val_regex)
 			VRE_free(&(*pvex)->rhs->val_regex);
+		if ((*pvex)->rhs->val_set)
+			vex_set_destroy(&(*pvex)->rhs->val_set);
 		FREE_OBJ((*pvex)->rhs);
 	}
 	if ((*pvex)->a != NULL) {
@@ -624,6 +909,11 @@ vex_print_rhs(const struct vex_rhs *rhs)
 		AN(rhs->val_regex);
 		fprintf(stderr, "REGEX(%s)", rhs->val_string);
 		break;
+	case VEX_SET:
+		fprintf(stderr, "SET(%u int, %u str)",
+		    vex_set_count_int(rhs->val_set),
+		    vex_set_count_str(rhs->val_set));
+		break;
 	default:
 		WRONG("rhs type");
 		break;
@@ -0,0 +1,263 @@
+/*-
+ * Copyright (c) 2026 Varnish Software AS
+ * All rights reserved.
+ *
+ * SPDX-License-Identifier: BSD-2-Clause
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions
+ * are met:
+ * 1. Redistributions of source code must retain the above copyright
+ *    notice, this list of conditions and the following disclaimer.
+ * 2. Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+ * ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+ * IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ * ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+ * FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+ * DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+ * OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+ * HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+ * LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+ * OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+ * SUCH DAMAGE.
+ *
+ * Hashed sets of strings and integers for the 'in' operator.
+ *
+ * Open addressing with linear probing, the table is kept at most half
+ * full.  Strings and integers share the table, an entry is a string
+ * if it has one.  Caseless sets hash and compare the lower case form
+ * of the strings.
+ */
+
+#include "config.h"
+
+#include <ctype.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "vdef.h"
+#include "vas.h"
+#include "miniobj.h"
+
+#include "vqueue.h"
+#include "vre.h"
+
+#include "vxp.h"
+
+struct vex_set_ent {
+	uint64_t		hash;
+	const char		*s;
+	size_t			len;
+	long long		i;
+	unsigned		used;
+};
+
+struct vex_set {
+	unsigned		magic;
+#define VEX_SET_MAGIC		0x5E7A1C09
+	unsigned		caseless;
+	unsigned		n;
+	unsigned		nint;
+	unsigned		mask;
+	struct vex_set_ent	*tbl;
+};
+
+static uint64_t
+vex_set_hash_str(const struct vex_set *set, const char *s, size_t len)
+{
+	uint64_t h = 0xcbf29ce484222325ULL;
+	unsigned char c;
+
+	while (len--) {
+		c = (unsigned char)*s++;
+		if (set->caseless)
+			c = (unsigned char)tolower(c);
+		h ^= c;
+		h *= 0x100000001b3ULL;
+	}
+	return (h);
+}
+
+static uint64_t
+vex_set_hash_int(long long i)
+{
+	uint64_t h = (uint64_t)i;
+
+	h ^= h >> 33;
+	h *= 0xff51afd7ed558ccdULL;
+	h ^= h >> 33;
+	h *= 0xc4ceb9fe1a85ec53ULL;
+	h ^= h >> 33;
+	return (h);
+}
+
+static int
+vex_set_streq(const struct vex_set *set, const struct vex_set_ent *e,
+    const char *s, size_t len)
+{
+
+	if (e->s == NULL || e->len != len)
+		return (0);
+	if (set->caseless)
+		return (!strncasecmp(e->s, s, len));
+	return (!memcmp(e->s, s, len));
+}
+
+struct vex_set *
+vex_set_new(unsigned caseless)
+{
+	struct vex_set *set;
+
+	ALLOC_OBJ(set, VEX_SET_MAGIC);
+	AN(set);
+	set->caseless = caseless;
+	set->mask = 15;
+	set->tbl = calloc(set->mask + 1L, sizeof *set->tbl);
+	AN(set->tbl);
+	return (set);
+}
+
+void
+vex_set_destroy(struct vex_set **pset)
+{
+	struct vex_set *set;
+	unsigned u;
+
+	TAKE_OBJ_NOTNULL(set, pset, VEX_SET_MAGIC);
+	for (u = 0; u <= set->mask; u++)
+		free(TRUST_ME(set->tbl[u].s));
+	free(set->tbl);
+	FREE_OBJ(set);
+}
+
+unsigned
+vex_set_count_str(const struct vex_set *set)
+{
+
+	CHECK_OBJ_NOTNULL(set, VEX_SET_MAGIC);
+	return (set->n - set->nint);
+}
+
+unsigned
+vex_set_count_int(const struct vex_set *set)
+{
+
+	CHECK_OBJ_NOTNULL(set, VEX_SET_MAGIC);
+	return (set->nint);
+}
+
+static void
+vex_set_grow(struct vex_set *set)
+{
+	struct vex_set_ent *otbl, *e;
+	unsigned u, omask;
+
+	if (2 * (set->n + 1) <= set->mask + 1)
+		return;
+	otbl = set->tbl;
+	omask = set->mask;
+	set->mask = 2 * set->mask + 1;
+	set->tbl = calloc(set->mask + 1L, sizeof *set->tbl);
+	AN(set->tbl);
+	for (u = 0; u <= omask; u++) {
+		if (!otbl[u].used)
+			continue;
+		for (e = &set->tbl[otbl[u].hash & set->mask]; e->used;
+		    e = &set->tbl[(e - set->tbl + 1) & set->mask])
+			continue;
+		*e = otbl[u];
+	}
+	free(otbl);
+}
+
+int
+vex_set_add_str(struct vex_set *set, const char *s, size_t len)
+{
+	struct vex_set_ent *e;
+	uint64_t h;
+	char *p;
+
+	CHECK_OBJ_NOTNULL(set, VEX_SET_MAGIC);
+	AN(s);
+	if (vex_set_has_str(set, s, len))
+		return (0);
+	vex_set_grow(set);
+	h = vex_set_hash_str(set, s, len);
+	for (e = &set->tbl[h & set->mask]; e->used;
+	    e = &set->tbl[(e - set->tbl + 1) & set->mask])
+		continue;
+	p = malloc(len + 1L);
+	AN(p);
+	memcpy(p, s, len);
+	p[len] = '\0';
+	e->hash = h;
+	e->s = p;
+	e->len = len;
+	e->used = 1;
+	set->n++;
+	return (1);
+}
+
+int
+vex_set_has_str(const struct vex_set *set, const char *s, size_t len)
+{
+	const struct vex_set_ent *e;
+	uint64_t h;
+	unsigned u;
+
+	CHECK_OBJ_NOTNULL(set, VEX_SET_MAGIC);
+	AN(s);
+	h = vex_set_hash_str(set, s, len);
+	for (u = h & set->mask; ; u = (u + 1) & set->mask) {
+		e = &set->tbl[u];
+		if (!e->used)
+			return (0);
+		if (e->hash == h && vex_set_streq(set, e, s, len))
+			return (1);
+	}
+}
+
+int
+vex_set_add_int(struct vex_set *set, long long i)
+{
+	struct vex_set_ent *e;
+	uint64_t h;
+
+	CHECK_OBJ_NOTNULL(set, VEX_SET_MAGIC);
+	if (vex_set_has_int(set, i))
+		return (0);
+	vex_set_grow(set);
+	h = vex_set_hash_int(i);
+	for (e = &set->tbl[h & set->mask]; e->used;
+	    e = &set->tbl[(e - set->tbl + 1) & set->mask])
+		continue;
+	e->hash = h;
+	e->i = i;
+	e->used = 1;
+	set->n++;
+	set->nint++;
+	return (1);
+}
+
+int
+vex_set_has_int(const struct vex_set *set, long long i)
+{
+	const struct vex_set_ent *e;
+	uint64_t h;
+	unsigned u;
+
+	CHECK_OBJ_NOTNULL(set, VEX_SET_MAGIC);
+	h = vex_set_hash_int(i);
+	for (u = h & set->mask; ; u = (u + 1) & set->mask) {
+		e = &set->tbl[u];
+		if (!e->used)
+			return (0);
+		if (e->hash == h && e->s == NULL && e->i == i)
+			return (1);
+	}
+}
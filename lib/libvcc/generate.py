@@ -31,22 +31,27 @@
 #
 # Generate various .c and .h files for the VCL compiler and the interfaces
 # for it.
-
-#######################################################################
-# These are our tokens
+#
+# The outputs are declared in the 'outputs' table below, each with the
+# source files it is made from, the other outputs it needs to have been
+# written first and the function generating it.  Running this file
+# generates all of them, but they can also be generated selectively,
+# from the command line or from other python code:
+#
+#	import generate
+#	generate.generate(srcroot, buildroot, ["include/vcl.h"])
 
 import copy
+import hashlib
+import json
+import optparse
+import os
 import sys
+import time
 from os.path import join
 
-srcroot = "../.."
-buildroot = "../.."
-if len(sys.argv) == 3:
-    srcroot = sys.argv[1]
-    buildroot = sys.argv[2]
-elif len(sys.argv) != 1:
-    print("Two arguments or none")
-    exit(2)
+#######################################################################
+# These are our tokens
 
 tokens = {
     "T_INC":    "++",
@@ -150,6 +155,7 @@ returns = (
     ),
 )
 
+
 #######################################################################
 # Variables available in sessions
 #
@@ -158,12 +164,11 @@ returns = (
 # 'backend' means all methods tagged "B"
 # 'both' means all methods tagged "B" or "C"
 
-varprotos = {}
+VARDOC = "doc/sphinx/reference/vcl_var.rst"
 
-def varproto(s):
-    if not s in varprotos:
-        fh.write(s + ";\n")
-        varprotos[s] = True
+# The VCL syntax levels vcc_Var_Init() knows about, the
+# generated code checks that this matches VCL_LOW..VCL_HIGH
+vcl_syntax = (40, 41)
 
 class vardef(object):
     def __init__(self, nam, typ, rd, wr, wu, vlo, vhi):
@@ -175,13 +180,39 @@ class vardef(object):
         self.vlo = vlo
         self.vhi = vhi
 
-        self.emit()
+    def protos(self, vcltypes):
+        "The VRT prototypes implementing this variable"
+        l = []
+        cnam = self.nam.replace(".", "_")
+        ctyp = vcltypes[self.typ]
+        if self.typ != "HEADER" and self.rd:
+            l.append("VCL_" + self.typ + " VRT_r_%s(VRT_CTX)" % cnam)
+        if self.typ != "HEADER" and self.wr:
+            s = "void VRT_l_%s(VRT_CTX, " % cnam
+            if self.typ == "STRING":
+                s += ctyp.c + ", ...)"
+            elif self.typ == "BODY":
+                s += "enum lbody_e, " + ctyp.c + ", ...)"
+            else:
+                s += "VCL_" + self.typ + ")"
+            l.append(s)
+        if self.uns:
+            l.append("void VRT_u_%s(VRT_CTX)" % cnam)
+        return l
+
+    def available(self, syntax):
+        return self.vlo <= syntax <= self.vhi
+
+    def emit_stub(self, fo):
+        "Placeholder, so VCC can tell in which VCL syntax it is available"
+        fo.write("\n")
+        fo.write("\tsym = VCC_MkSym(tl, \"%s\", " % self.nam)
+        fo.write(" SYM_VAR, %d, %d);\n" % (self.vlo, self.vhi))
+        fo.write("\tAN(sym);\n")
 
-    def emit(self):
-        fh.write("\n")
+    def emit(self, fo, gen):
         fo.write("\n")
         cnam = self.nam.replace(".", "_")
-        ctyp = vcltypes[self.typ]
 
         # fo.write("\t{ \"%s\", %s,\n" % (nm, self.typ))
         fo.write("\tsym = VCC_MkSym(tl, \"%s\", " % self.nam)
@@ -201,9 +232,8 @@ class vardef(object):
             fo.write('";\n')
         elif self.rd:
             fo.write('\tsym->rname = "VRT_r_%s(ctx)";\n' % cnam)
-            varproto("VCL_" + self.typ + " VRT_r_%s(VRT_CTX)" % cnam)
         fo.write("\tsym->r_methods =\n")
-        restrict(fo, self.rd)
+        gen.restrict(fo, self.rd)
         fo.write(";\n")
 
         if self.typ == "HEADER":
@@ -212,25 +242,78 @@ class vardef(object):
             fo.write('";\n')
         elif self.wr:
             fo.write('\tsym->lname = "VRT_l_%s(ctx, ";\n' % cnam)
-            s = "void VRT_l_%s(VRT_CTX, " % cnam
-            if self.typ == "STRING":
-                s += ctyp.c + ", ...)"
-            elif self.typ == "BODY":
-                s += "enum lbody_e, " + ctyp.c + ", ...)"
-            else:
-                s += "VCL_" + self.typ + ")"
-            varproto(s)
         fo.write("\tsym->w_methods =\n")
-        restrict(fo, self.wr)
+        gen.restrict(fo, self.wr)
         fo.write(";\n")
 
         if self.uns:
-            varproto("void VRT_u_%s(VRT_CTX)" % cnam)
             fo.write('\tsym->uname = "VRT_u_%s(ctx)";\n' % cnam)
         fo.write('\tsym->u_methods =\n')
-        restrict(fo, self.uns)
+        gen.restrict(fo, self.uns)
         fo.write(";\n")
 
+#######################################################################
+# Output files are only replaced when their content changes, so that
+# make(1) does not rebuild everything depending on them when some
+# irrelevant part of an input file was touched.
+
+class genfile(object):
+    def __init__(self, fn):
+        self.fn = fn
+        self.buf = []
+
+    def write(self, s):
+        self.buf.append(s)
+
+    def getvalue(self):
+        return "".join(self.buf)
+
+    def close(self):
+        "Write the file, return True if it changed"
+        s = self.getvalue()
+        try:
+            with open(self.fn) as fi:
+                if fi.read() == s:
+                    return False
+        except IOError:
+            pass
+        tmp = self.fn + ".tmp"
+        with open(tmp, "w") as fo:
+            fo.write(s)
+        os.replace(tmp, self.fn)
+        return True
+
+#######################################################################
+# The results of scanning vrt.h and parsing vcl_var.rst are cached in
+# the build directory, keyed by the hash of the input file.
+
+class parsecache(object):
+    def __init__(self, fn):
+        self.fn = fn
+        try:
+            with open(fn) as fi:
+                self.cache = json.load(fi)
+        except (IOError, ValueError):
+            self.cache = {}
+
+    def get(self, fn, func):
+        with open(fn, "rb") as fi:
+            h = hashlib.sha256(fi.read()).hexdigest()
+        key = os.path.basename(fn)
+        ce = self.cache.get(key)
+        if ce is None or ce["hash"] != h:
+            ce = {"hash": h, "data": func(fn)}
+            self.cache[key] = ce
+        return ce["data"]
+
+    def save(self):
+        fo = genfile(self.fn)
+        json.dump(self.cache, fo, indent=1, sort_keys=True)
+        fo.write("\n")
+        fo.close()
+
+#######################################################################
+
 def parse_vcl(x):
     vlo, vhi = (0, 99)
     x = x.split()
@@ -280,12 +363,14 @@ def parse_var(ln):
             continue
         break
     if vn[:8] != "storage.":
-        vardef(vn, vt, vr, vw, vu, vlo, vhi)
+        return (vn, vt, vr, vw, vu, vlo, vhi)
+    return None
 
 def parse_var_doc(fn):
     l = []
     for i in open(fn):
         l.append(i.rstrip())
+    vl = []
     for n in range(0, len(l)):
         j = l[n].split()
         if len(j) != 2 or j[0] != "Type:" or not l[n][0].isspace():
@@ -293,7 +378,10 @@ def parse_var_doc(fn):
         m = n
         while m < len(l) and (l[m] == "" or l[m][0].isspace()):
             m += 1
-        parse_var(l[n-2:m-1])
+        v = parse_var(l[n-2:m-1])
+        if v is not None:
+            vl.append(v)
+    return vl
 
 stv_variables = (
     ('free_space', 'BYTES', "0.", 'storage.<name>.free_space', """
@@ -313,37 +401,84 @@ stv_variables = (
 #######################################################################
 # VCL to C type conversion
 
-vcltypes = {}
-
 class vcltype(object):
     def __init__(self, name, ctype, internal=False):
         self.name = name
         self.c = ctype
         self.internal = internal
-        vcltypes[name] = self
-
-
-vcltype("STRINGS", "void", True)
-vcltype("STRING_LIST", "void*", True)
-vcltype("SUB", "void*", True)
-
-fi = open(join(srcroot, "include/vrt.h"))
-
-for i in fi:
-    j = i.split()
-    if len(j) < 3:
-        continue
-    if j[0] != "typedef":
-        continue
-    if j[-1][-1] != ";":
-        continue
-    if j[-1][-2] == ")":
-        continue
-    if j[-1][:4] != "VCL_":
-        continue
-    d = " ".join(j[1:-1])
-    vcltype(j[-1][4:-1], d)
-fi.close()
+
+def parse_vrt_types(fn):
+    tl = []
+    for i in open(fn):
+        j = i.split()
+        if len(j) < 3:
+            continue
+        if j[0] != "typedef":
+            continue
+        if j[-1][-1] != ";":
+            continue
+        if j[-1][-2] == ")":
+            continue
+        if j[-1][:4] != "VCL_":
+            continue
+        d = " ".join(j[1:-1])
+        tl.append((j[-1][4:-1], d))
+    return tl
+
+# The string related properties of the VCC types, which go into their
+# descriptors in vcc_obj.c:  the C expression converting a value (\v1)
+# to STRINGS (.tostring), the type multiplications are done in
+# (.multype), and whether the type is a form of string (.stringform).
+# The types not listed have none of them.
+type_props = {
+    #               tostring                            multype  stringform
+    "ACL":          (r"((\v1)->name)",                   None,    False),
+    "BACKEND":      (r"VRT_BACKEND_string(\v1)",         None,    False),
+    "BOOL":         (r"VRT_BOOL_string(\v1)",            None,    False),
+    # XXX: wrong tostring and multype
+    "BYTES":        (r"VRT_REAL_string(ctx, \v1)",       "REAL",  False),
+    # XXX: 's' suffix?
+    "DURATION":     (r"VRT_REAL_string(ctx, \v1)",       "REAL",  False),
+    "ENUM":         ("",                                 None,    False),
+    "HEADER":       (r"VRT_GetHdr(ctx, \v1)",            None,    False),
+    "INT":          (r"VRT_INT_string(ctx, \v1)",        "INT",   False),
+    "IP":           (r"VRT_IP_string(ctx, \v1)",         None,    False),
+    "REAL":         (r"VRT_REAL_string(ctx, \v1)",       "REAL",  False),
+    "STEVEDORE":    (r"VRT_STEVEDORE_string(\v1)",       None,    False),
+    "STRANDS":      (r"VRT_CollectStrands(ctx,\v+\n\v1\v-\n)",
+                                                         None,    True),
+    "STRING":       (None,                               None,    True),
+    "STRINGS":      ("",                                 None,    False),
+    "STRING_LIST":  (None,                               None,    True),
+    "TIME":         (r"VRT_TIME_string(ctx, \v1)",       None,    False),
+}
+
+def tostring(t):
+    return type_props.get(t, (None, None, False))[0] is not None
+
+def stringform(t):
+    return type_props.get(t, (None, None, False))[2]
+
+# Implicit conversions to BOOL, see vcc_expr_tobool()
+bool_conv = ("BACKEND", "DURATION", "INT", "STRINGS")
+
+VCC_CONV_NONE = 0xff
+
+def conv_cost(a, b):
+    "Number of implicit conversion steps from type a to type b"
+    if a == b:
+        return 0
+    sa = tostring(a) or stringform(a)
+    if b == "BOOL" and a in bool_conv:
+        return 1
+    if b == "STRINGS" and sa:
+        return 1
+    if stringform(b):
+        if a == "STRINGS":
+            return 1
+        if sa:
+            return 2
+    return VCC_CONV_NONE
 
 #######################################################################
 # Nothing is easily configurable below this line.
@@ -512,82 +647,159 @@ def lint_start(fo):
 def lint_end(fo):
     fo.write('\n/*lint -restore */\n')
 
-#######################################################################
-
-polish_tokens(tokens)
-
-fo = open(join(buildroot, "lib/libvcc/vcc_token_defs.h"), "w")
-
-file_header(fo)
-
-j = 128
-for i in sorted(tokens.keys()):
-    if i[0] == "'":
-        continue
-    fo.write("#define\t%s %d\n" % (i, j))
-    j += 1
-    assert j < 256
+def tbl40(a, b):
+    while len(a.expandtabs()) < 40:
+        a += "\t"
+    return a + b
 
-fo.close()
+#######################################################################
+# The state shared by the generator functions.  The parsed inputs are
+# loaded on first use, so that generating a single output only reads
+# the input files that output needs.
+
+class vccgen(object):
+    def __init__(self, srcroot, buildroot):
+        self.srcroot = srcroot
+        self.buildroot = buildroot
+        self.cache = parsecache(join(buildroot, "lib/libvcc/generate.cache"))
+        self._vcltypes = None
+        self._vars = None
+
+        self.tokens = dict(tokens)
+        polish_tokens(self.tokens)
+
+        self.rets = dict()
+        self.vcls = list()
+        self.vcls_client = list()
+        self.vcls_backend = list()
+        for i in returns:
+            self.vcls.append(i[0])
+            for j in i[1]:
+                if j == "B":
+                    self.vcls_backend.append(i[0])
+                elif j == "C":
+                    self.vcls_client.append(i[0])
+            for j in i[2]:
+                self.rets[j] = True
+
+    @property
+    def vcltypes(self):
+        if self._vcltypes is None:
+            d = {}
+            for i in (
+                    vcltype("STRINGS", "void", True),
+                    vcltype("STRING_LIST", "void*", True),
+                    vcltype("SUB", "void*", True)):
+                d[i.name] = i
+            for i, j in self.cache.get(
+                    join(self.srcroot, "include/vrt.h"),
+                    parse_vrt_types):
+                d[i] = vcltype(i, j)
+            self._vcltypes = d
+        return self._vcltypes
+
+    @property
+    def vars(self):
+        if self._vars is None:
+            self._vars = [vardef(*i) for i in self.cache.get(
+                join(self.srcroot, VARDOC), parse_var_doc)]
+        return self._vars
+
+    def methods(self, spec):
+        "Expand a Readable/Writable/Unsetable spec to method names"
+        d = dict()
+        for j in spec:
+            if j[:4] == "vcl_":
+                j = j[4:]
+            if j == 'all':
+                for i in self.vcls:
+                    d[i] = True
+            elif j == 'backend':
+                for i in self.vcls_backend:
+                    d[i] = True
+            elif j == 'client':
+                for i in self.vcls_client:
+                    d[i] = True
+            elif j == 'both':
+                for i in self.vcls_client:
+                    d[i] = True
+                for i in self.vcls_backend:
+                    d[i] = True
+            else:
+                if not j in self.vcls:
+                    print("JJ", j)
+                assert j in self.vcls
+                d[j] = True
+        return sorted(d.keys())
+
+    def restrict(self, fo, spec):
+        l = self.methods(spec)
+        p = ""
+        w = 0
+        fo.write("\t\t")
+        for j in l:
+            x = p + "VCL_MET_" + j.upper()
+            if w + len(x) > 60:
+                fo.write("\n\t\t")
+                w = 0
+            fo.write(x)
+            w += len(x)
+            p = " | "
+        if not l:
+            fo.write("0")
 
 #######################################################################
 
-rets = dict()
-vcls = list()
-vcls_client = list()
-vcls_backend = list()
-for i in returns:
-    vcls.append(i[0])
-    for j in i[1]:
-        if j == "B":
-            vcls_backend.append(i[0])
-        elif j == "C":
-            vcls_client.append(i[0])
-    for j in i[2]:
-        rets[j] = True
+def gen_vcc_token_defs_h(gen, fo):
+    file_header(fo)
+
+    j = 128
+    for i in sorted(gen.tokens.keys()):
+        if i[0] == "'":
+            continue
+        fo.write("#define\t%s %d\n" % (i, j))
+        j += 1
+        assert j < 256
 
 #######################################################################
 
-fo = open(join(buildroot, "include/tbl/vcl_returns.h"), "w")
-
-file_header(fo)
-
-lint_start(fo)
-
-fo.write("#ifdef VCL_RET_MAC\n")
-ll = sorted(returns)
-for i in sorted(rets.keys()):
-    fo.write("VCL_RET_MAC(%s, %s" % (i.lower(), i.upper()))
-    s = ",\n\t"
-    for j in ll:
-        if i in j[2]:
-            fo.write("%sVCL_MET_%s" % (s, j[0].upper()))
-            s = " |\n\t"
-    fo.write("\n)\n\n")
-fo.write("#undef VCL_RET_MAC\n")
-fo.write("#endif\n")
-
-fo.write("\n#ifdef VCL_MET_MAC\n")
-for i in ll:
-    fo.write("VCL_MET_MAC(%s, %s, %s," %
-             (i[0].lower(), i[0].upper(), i[1]))
-    p = " (\n\t"
-    for j in sorted(i[2]):
-        fo.write("%s(1U << VCL_RET_%s)" % (p, j.upper()))
-        p = " |\n\t"
-    fo.write(")\n)\n\n")
-fo.write("#undef VCL_MET_MAC\n")
-fo.write("#endif\n")
-lint_end(fo)
-fo.close()
+def gen_vcl_returns_h(gen, fo):
+    file_header(fo)
+
+    lint_start(fo)
+
+    fo.write("#ifdef VCL_RET_MAC\n")
+    ll = sorted(returns)
+    for i in sorted(gen.rets.keys()):
+        fo.write("VCL_RET_MAC(%s, %s" % (i.lower(), i.upper()))
+        s = ",\n\t"
+        for j in ll:
+            if i in j[2]:
+                fo.write("%sVCL_MET_%s" % (s, j[0].upper()))
+                s = " |\n\t"
+        fo.write("\n)\n\n")
+    fo.write("#undef VCL_RET_MAC\n")
+    fo.write("#endif\n")
+
+    fo.write("\n#ifdef VCL_MET_MAC\n")
+    for i in ll:
+        fo.write("VCL_MET_MAC(%s, %s, %s," %
+                 (i[0].lower(), i[0].upper(), i[1]))
+        p = " (\n\t"
+        for j in sorted(i[2]):
+            fo.write("%s(1U << VCL_RET_%s)" % (p, j.upper()))
+            p = " |\n\t"
+        fo.write(")\n)\n\n")
+    fo.write("#undef VCL_MET_MAC\n")
+    fo.write("#endif\n")
+    lint_end(fo)
 
 #######################################################################
 
-fo = open(join(buildroot, "include/vcl.h"), "w")
-
-file_header(fo)
+def gen_vcl_h(gen, fo):
+    file_header(fo)
 
-fo.write("""
+    fo.write("""
 #ifdef VCL_H_INCLUDED
 #  error "vcl.h included multiple times"
 #endif
@@ -598,45 +810,40 @@ fo.write("""
 #endif
 """)
 
+    fo.write("\n/* VCL Methods */\n")
+    task = {}
+    n = 1
+    for i in returns:
+        fo.write(tbl40("#define VCL_MET_%s" % i[0].upper(),
+                       "(1U << %d)\n" % n))
+        if not i[1] in task:
+            task[i[1]] = []
+        task[i[1]].append("VCL_MET_" + i[0].upper())
+        n += 1
 
-def tbl40(a, b):
-    while len(a.expandtabs()) < 40:
-        a += "\t"
-    return a + b
-
-fo.write("\n/* VCL Methods */\n")
-task = {}
-n = 1
-for i in returns:
-    fo.write(tbl40("#define VCL_MET_%s" % i[0].upper(), "(1U << %d)\n" % n))
-    if not i[1] in task:
-        task[i[1]] = []
-    task[i[1]].append("VCL_MET_" + i[0].upper())
-    n += 1
+    fo.write("\n" + tbl40("#define VCL_MET_MAX", "%d\n" % n))
+    fo.write("\n" + tbl40("#define VCL_MET_MASK", "0x%x\n" % ((1 << n) - 1)))
 
-fo.write("\n" + tbl40("#define VCL_MET_MAX", "%d\n" % n))
-fo.write("\n" + tbl40("#define VCL_MET_MASK", "0x%x\n" % ((1 << n) - 1)))
-
-fo.write("\n")
-for i in sorted(task.keys()):
-    fo.write(tbl40("#define VCL_MET_TASK_%s" % i.upper(),
-                   "( " + (" | \\\n\t\t\t\t\t  ").join(task[i]) + " )\n"))
+    fo.write("\n")
+    for i in sorted(task.keys()):
+        fo.write(tbl40("#define VCL_MET_TASK_%s" % i.upper(),
+                       "( " + (" | \\\n\t\t\t\t\t  ").join(task[i]) + " )\n"))
 
 
-fo.write("\n/* VCL Returns */\n")
-n = 1
-for i in sorted(rets.keys()):
-    fo.write(tbl40("#define VCL_RET_%s" % i.upper(), "%d\n" % n))
-    n += 1
+    fo.write("\n/* VCL Returns */\n")
+    n = 1
+    for i in sorted(gen.rets.keys()):
+        fo.write(tbl40("#define VCL_RET_%s" % i.upper(), "%d\n" % n))
+        n += 1
 
-fo.write("\n" + tbl40("#define VCL_RET_MAX", "%d\n" % n))
+    fo.write("\n" + tbl40("#define VCL_RET_MAX", "%d\n" % n))
 
-fo.write("\n/* VCL Types */\n")
-for vcltype in sorted(vcltypes.keys()):
-    fo.write("extern const struct vrt_type VCL_TYPE_%s[1];\n" % vcltype)
+    fo.write("\n/* VCL Types */\n")
+    for i in sorted(gen.vcltypes.keys()):
+        fo.write("extern const struct vrt_type VCL_TYPE_%s[1];\n" % i)
 
 
-fo.write("""
+    fo.write("""
 /* Compiled VCL Interface */
 typedef int vcl_event_f(VRT_CTX, enum vcl_event_e);
 typedef int vcl_init_f(VRT_CTX);
@@ -663,153 +870,383 @@ struct VCL_conf {
 	vcl_event_f		*event_vcl;
 """)
 
-for i in returns:
-    fo.write("\tvcl_func_f\t\t*" + i[0] + "_func;\n")
+    for i in returns:
+        fo.write("\tvcl_func_f\t\t*" + i[0] + "_func;\n")
 
-fo.write("\n};\n")
-fo.close()
+    fo.write("\n};\n")
 
 #######################################################################
 
+def gen_vrt_obj_h(gen, fo):
+    file_header(fo)
 
-def restrict(fo, spec):
-    d = dict()
-    for j in spec:
-        if j[:4] == "vcl_":
-            j = j[4:]
-        if j == 'all':
-            for i in vcls:
-                d[i] = True
-        elif j == 'backend':
-            for i in vcls_backend:
-                d[i] = True
-        elif j == 'client':
-            for i in vcls_client:
-                d[i] = True
-        elif j == 'both':
-            for i in vcls_client:
-                d[i] = True
-            for i in vcls_backend:
-                d[i] = True
-        else:
-            if not j in vcls:
-                print("JJ", j)
-            assert j in vcls
-            d[j] = True
-    p = ""
-    l = list(d.keys())
-    l.sort()
-    w = 0
-    fo.write("\t\t")
-    for j in l:
-        x = p + "VCL_MET_" + j.upper()
-        if w + len(x) > 60:
-            fo.write("\n\t\t")
-            w = 0
-        fo.write(x)
-        w += len(x)
-        p = " | "
-    if not d:
-        fo.write("0")
+    varprotos = {}
+    for v in gen.vars:
+        fo.write("\n")
+        for s in v.protos(gen.vcltypes):
+            if not s in varprotos:
+                fo.write(s + ";\n")
+                varprotos[s] = True
 
-#######################################################################
+    for i in stv_variables:
+        fo.write(gen.vcltypes[i[1]].c + " VRT_stevedore_" + i[0] +
+                 "(VCL_STEVEDORE);\n")
 
-fh = open(join(buildroot, "include/vrt_obj.h"), "w")
-file_header(fh)
+#######################################################################
 
-fo = open(join(buildroot, "lib/libvcc/vcc_obj.c"), "w")
-file_header(fo)
+def gen_vcc_obj_c(gen, fo):
+    file_header(fo)
 
-fo.write("""
+    fo.write("""
 #include "config.h"
 
+#include <stddef.h>
+
 #include "vcc_compile.h"
+""")
 
+    fo.write("\n#if VCL_LOW != %d || VCL_HIGH != %d\n" %
+             (vcl_syntax[0], vcl_syntax[-1]))
+    fo.write('#  error "Update vcl_syntax in lib/libvcc/generate.py"\n')
+    fo.write("#endif\n")
+
+    # Each VCL syntax level gets its own subset of the variables,
+    # the variables from other levels only leave a placeholder for
+    # the "Only available when" diagnostic.
+    for syntax in vcl_syntax:
+        fo.write("\nstatic void\n")
+        fo.write("vcc_var_init_%d(struct vcc *tl)\n" % syntax)
+        fo.write("{\n")
+        fo.write("    struct symbol *sym;\n")
+        avail = set(v.nam for v in gen.vars if v.available(syntax))
+        for v in gen.vars:
+            if v.available(syntax):
+                v.emit(fo, gen)
+            elif v.nam not in avail:
+                v.emit_stub(fo)
+        fo.write("}\n")
+
+    fo.write("""
 void
 vcc_Var_Init(struct vcc *tl)
 {
-    struct symbol *sym;
-""")
 
-parse_var_doc(join(srcroot, "doc/sphinx/reference/vcl_var.rst"))
-fo.write("}\n")
+	switch (tl->syntax) {
+""")
+    for syntax in vcl_syntax:
+        fo.write("\tcase %d:\n" % syntax)
+        fo.write("\t\tvcc_var_init_%d(tl);\n" % syntax)
+        fo.write("\t\tbreak;\n")
+    fo.write("""\tdefault:
+\t\tWRONG("Unknown VCL syntax");
+\t}
+}
+""")
 
-for i in stv_variables:
-    fh.write(vcltypes[i[1]].c + " VRT_stevedore_" + i[0] + "(VCL_STEVEDORE);\n")
+    fo.write("\n/* VCL type identifiers */\n")
 
-fo.write("\n/* VCL type identifiers */\n")
+    for vn in sorted(gen.vcltypes.keys()):
+        v = gen.vcltypes[vn]
+        if v.internal:
+            continue
+        fo.write("const struct vrt_type VCL_TYPE_%s[1] = { {\n" % v.name)
+        fo.write("\t.magic = VRT_TYPE_MAGIC,\n")
+        fo.write('\t.lname = "%s",\n' % v.name.lower())
+        fo.write('\t.uname = "%s",\n' % v.name)
+        fo.write('\t.ctype = "%s",\n' % v.c)
+        if v.c != "void":
+            fo.write('\t.szof = sizeof(VCL_%s),\n' % v.name)
+        fo.write("}};\n")
+
+    emit_vcc_types(fo, gen)
+    emit_vcc_type_tbl(fo, gen)
 
-for vn in sorted(vcltypes.keys()):
-    v = vcltypes[vn]
-    if v.internal:
-        continue
-    fo.write("const struct vrt_type VCL_TYPE_%s[1] = { {\n" % v.name)
-    fo.write("\t.magic = VRT_TYPE_MAGIC,\n")
-    fo.write('\t.lname = "%s",\n' % v.name.lower())
-    fo.write('\t.uname = "%s",\n' % v.name)
-    fo.write('\t.ctype = "%s",\n' % v.c)
-    if v.c != "void":
-        fo.write('\t.szof = sizeof(VCL_%s),\n' % v.name)
-    fo.write("}};\n")
+#######################################################################
 
-fo.close()
-fh.close()
+def emit_vcc_types(fo, gen):
+    "Emit the VCC type descriptors"
+    fo.write("\n/* VCC type descriptors */\n")
+    for i in sorted(gen.vcltypes.keys()):
+        ts, mt, sf = type_props.get(i, (None, None, False))
+        fo.write("\nconst struct type %s[1] = {{\n" % i)
+        fo.write("\t.magic =\t\tTYPE_MAGIC,\n")
+        fo.write("\t.id =\t\t\tVCC_TYPE_ID_%s,\n" % i)
+        fo.write('\t.name =\t\t\t"%s",\n' % i)
+        if ts is not None:
+            fo.write('\t.tostring =\t\t"%s",\n' % ts)
+        if mt is not None:
+            fo.write("\t.multype =\t\t%s,\n" % mt)
+        if sf:
+            fo.write("\t.stringform =\t\t1,\n")
+        fo.write("}};\n")
+
+def emit_vcc_type_tbl(fo, gen):
+    "Emit the VCC type info indexed by enum vcc_type_id"
+    tl = sorted(gen.vcltypes.keys())
+
+    fo.write("\n/* VCC type info, sorted by name */\n")
+    fo.write("\n#define VCC_ALIGNOF(t) offsetof(struct { char c; t x; }, x)\n")
+    fo.write("\nconst struct vcc_type_info ")
+    fo.write("vcc_type_info[VCC_TYPE_ID_MAX] = {\n")
+    for i in tl:
+        v = gen.vcltypes[i]
+        if v.c == "void":
+            sz = "0"
+            al = "0"
+        elif v.internal:
+            sz = "sizeof(%s)" % v.c
+            al = "VCC_ALIGNOF(%s)" % v.c
+        else:
+            sz = "sizeof(VCL_%s)" % i
+            al = "VCC_ALIGNOF(VCL_%s)" % i
+        fo.write("\t[VCC_TYPE_ID_%s] = {\n" % i)
+        fo.write('\t\t.name = "%s",\n' % i)
+        fo.write("\t\t.type = %s,\n" % i)
+        fo.write("\t\t.szof = %s,\n" % sz)
+        fo.write("\t\t.align = %s,\n" % al)
+        fo.write("\t\t.is_ptr = %d,\n" % (v.c[-1:] == "*"))
+        fo.write("\t},\n")
+    fo.write("};\n")
+    fo.write("\n#undef VCC_ALIGNOF\n")
+
+    fo.write("\n/* Implicit conversion steps from [row] to [column], ")
+    fo.write("0x%x: none */\n" % VCC_CONV_NONE)
+    fo.write("\nconst uint8_t ")
+    fo.write("vcc_type_conv[VCC_TYPE_ID_MAX][VCC_TYPE_ID_MAX] = {\n")
+    for a in tl:
+        fo.write("\t[VCC_TYPE_ID_%s] = {" % a)
+        for n, b in enumerate(tl):
+            if n % 8 == 0:
+                fo.write("\n\t\t")
+            else:
+                fo.write(" ")
+            fo.write("0x%02x," % conv_cost(a, b))
+        fo.write("\n\t},\n")
+    fo.write("};\n")
 
 #######################################################################
 
-fo = open(join(buildroot, "lib/libvcc/vcc_fixed_token.c"), "w")
-
-file_header(fo)
-fo.write("""
+def gen_vcc_fixed_token_c(gen, fo):
+    file_header(fo)
+    fo.write("""
 
 #include "config.h"
 
 #include "vcc_compile.h"
 """)
 
-emit_vcl_fixed_token(fo, tokens)
-emit_vcl_tnames(fo, tokens)
+    emit_vcl_fixed_token(fo, gen.tokens)
+    emit_vcl_tnames(fo, gen.tokens)
 
-fo.write("""
+    fo.write("""
 void
 vcl_output_lang_h(struct vsb *sb)
 {
 """)
 
-emit_file(fo, srcroot, "include/vdef.h")
-emit_file(fo, srcroot, "include/vrt.h")
-emit_file(fo, buildroot, "include/vcl.h")
-emit_file(fo, buildroot, "include/vrt_obj.h")
-emit_file(fo, srcroot, "include/vcc_interface.h")
+    emit_file(fo, gen.srcroot, "include/vdef.h")
+    emit_file(fo, gen.srcroot, "include/vrt.h")
+    emit_file(fo, gen.buildroot, "include/vcl.h")
+    emit_file(fo, gen.buildroot, "include/vrt_obj.h")
+    emit_file(fo, gen.srcroot, "include/vcc_interface.h")
 
-fo.write("\n}\n")
-fo.close()
+    fo.write("\n}\n")
 
 #######################################################################
-ft = open(join(buildroot, "include/tbl/vcc_types.h"), "w")
-file_header(ft)
 
-lint_start(ft)
+def gen_vcc_types_h(gen, fo):
+    file_header(fo)
 
-for vcltype in sorted(vcltypes.keys()):
-    ft.write("VCC_TYPE(" + vcltype + ", " + vcltype.lower() +")\n")
-ft.write("#undef VCC_TYPE\n")
-lint_end(ft)
-ft.close()
+    lint_start(fo)
+
+    for i in sorted(gen.vcltypes.keys()):
+        fo.write("VCC_TYPE(" + i + ", " + i.lower() +")\n")
+    fo.write("#undef VCC_TYPE\n")
+    lint_end(fo)
 
 #######################################################################
 
-fo = open(join(buildroot, "include/tbl/vrt_stv_var.h"), "w")
+def gen_vrt_stv_var_h(gen, fo):
+    file_header(fo)
+    lint_start(fo)
 
-file_header(fo)
-lint_start(fo)
+    for i in stv_variables:
+        ct = gen.vcltypes[i[1]]
+        fo.write("VRTSTVVAR(" + i[0] + ",\t" + i[1] + ",\t")
+        fo.write(ct.c + ",\t" + i[2] + ")")
+        fo.write("\n")
 
-for i in stv_variables:
-    ct = vcltypes[i[1]]
-    fo.write("VRTSTVVAR(" + i[0] + ",\t" + i[1] + ",\t")
-    fo.write(ct.c + ",\t" + i[2] + ")")
+    fo.write("#undef VRTSTVVAR\n")
+    lint_end(fo)
+
+#######################################################################
+# A machine readable description of the VCL language, for tools like
+# vclcheck.py which want to know about VCL without running VCC.
+
+def gen_vcl_spec_json(gen, fo):
+    tl = sorted(gen.vcltypes.keys())
+    spec = {
+        "syntax": list(vcl_syntax),
+        "tokens": sorted(v for v in gen.tokens.values() if v is not None),
+        "methods": [
+            {
+                "name": i[0],
+                "task": i[1],
+                "returns": sorted(i[2]),
+            } for i in returns],
+        "types": [
+            {
+                "name": i,
+                "ctype": gen.vcltypes[i].c,
+                "internal": gen.vcltypes[i].internal,
+                "tostring": tostring(i),
+                "stringform": stringform(i),
+            } for i in tl],
+        "conversions": dict(
+            (a, dict((b, conv_cost(a, b)) for b in tl
+                     if conv_cost(a, b) != VCC_CONV_NONE))
+            for a in tl),
+        "variables": [
+            {
+                "name": v.nam,
+                "type": v.typ,
+                "wildcard": v.typ == "HEADER",
+                "read": gen.methods(v.rd),
+                "write": gen.methods(v.wr),
+                "unset": gen.methods(v.uns),
+                "vlo": v.vlo,
+                "vhi": v.vhi,
+            } for v in gen.vars],
+        "stevedore_variables": [
+            {
+                "name": i[0],
+                "type": i[1],
+            } for i in stv_variables],
+    }
+    json.dump(spec, fo, indent=1, sort_keys=True)
     fo.write("\n")
 
-fo.write("#undef VRTSTVVAR\n")
-lint_end(fo)
-fo.close()
+#######################################################################
+# The output graph
+#
+# Each output is listed with the source files it is generated from,
+# the outputs which must exist before it can be generated and the
+# function producing it.
+
+class output(object):
+    def __init__(self, name, srcs, deps, func):
+        self.name = name
+        self.srcs = srcs
+        self.deps = deps
+        self.func = func
+
+outputs = (
+    output("lib/libvcc/vcc_token_defs.h", (), (),
+           gen_vcc_token_defs_h),
+    output("include/tbl/vcl_returns.h", (), (),
+           gen_vcl_returns_h),
+    output("include/vcl.h", ("include/vrt.h",), (),
+           gen_vcl_h),
+    output("include/vrt_obj.h", ("include/vrt.h", VARDOC), (),
+           gen_vrt_obj_h),
+    output("lib/libvcc/vcc_obj.c", ("include/vrt.h", VARDOC), (),
+           gen_vcc_obj_c),
+    output("lib/libvcc/vcc_fixed_token.c",
+           ("include/vdef.h", "include/vrt.h", "include/vcc_interface.h"),
+           ("include/vcl.h", "include/vrt_obj.h"),
+           gen_vcc_fixed_token_c),
+    output("include/tbl/vcc_types.h", ("include/vrt.h",), (),
+           gen_vcc_types_h),
+    output("include/tbl/vrt_stv_var.h", ("include/vrt.h",), (),
+           gen_vrt_stv_var_h),
+    output("lib/libvcc/vcl_spec.json", ("include/vrt.h", VARDOC), (),
+           gen_vcl_spec_json),
+)
+
+def find_output(name):
+    for i in outputs:
+        if i.name == name:
+            return i
+    raise KeyError("Unknown output: " + name)
+
+def closure(names):
+    "The outputs needed to generate names, in dependency order"
+    l = []
+    def add(o):
+        if o in l:
+            return
+        for i in o.deps:
+            add(find_output(i))
+        l.append(o)
+    for i in names:
+        add(find_output(i))
+    return l
+
+#######################################################################
+
+def render(gen, name):
+    "Generate a single output into a string, without writing it"
+    fo = genfile(None)
+    find_output(name).func(gen, fo)
+    return fo.getvalue()
+
+def generate(srcroot, buildroot, names=None):
+    """
+    Generate the named outputs (all by default) and the outputs they
+    depend on, in the order of their dependencies.
+
+    Returns a list of (name, seconds, changed) tuples.
+    """
+    if names is None:
+        names = [i.name for i in outputs]
+    gen = vccgen(srcroot, buildroot)
+    result = []
+
+    for o in closure(names):
+        t0 = time.time()
+        fo = genfile(join(buildroot, o.name))
+        o.func(gen, fo)
+        result.append((o.name, time.time() - t0, fo.close()))
+
+    gen.cache.save()
+    return result
+
+#######################################################################
+
+if __name__ == "__main__":
+    usagetext = "Usage: %prog [options] [srcroot buildroot]"
+    oparser = optparse.OptionParser(usage=usagetext)
+    oparser.add_option('-o', '--output', action='append', metavar="file",
+                       help="Only generate this output (and what it " +
+                       "depends on), can be repeated")
+    oparser.add_option('-l', '--list', action='store_true', default=False,
+                       help="List the outputs and their inputs")
+    oparser.add_option('-t', '--timing', action='store_true',
+                       default=False,
+                       help="Report the time spent on each output")
+    (opts, args) = oparser.parse_args()
+
+    srcroot = "../.."
+    buildroot = "../.."
+    if len(args) == 2:
+        srcroot = args[0]
+        buildroot = args[1]
+    elif args:
+        print("Two arguments or none")
+        exit(2)
+
+    if opts.list:
+        for i in outputs:
+            print(i.name + ":", " ".join(i.srcs + i.deps))
+        exit(0)
+
+    try:
+        r = generate(srcroot, buildroot, opts.output)
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        exit(2)
+
+    if opts.timing:
+        for i, t, c in r:
+            print("%8.3f ms %s %s" % (t * 1e3, "*" if c else " ", i),
+                  file=sys.stderr)
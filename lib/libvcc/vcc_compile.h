@@ -99,19 +99,41 @@ struct token {
 /*---------------------------------------------------------------------*/
 typedef const struct type	*vcc_type_t;
 
+enum vcc_type_id {
+#define VCC_TYPE(UC, lc)	VCC_TYPE_ID_##UC,
+#include "tbl/vcc_types.h"
+	VCC_TYPE_ID_MAX
+};
+
 struct type {
 	unsigned		magic;
 #define TYPE_MAGIC		0xfae932d9
 
+	enum vcc_type_id	id;
 	const char		*name;
 	const char		*tostring;
 	vcc_type_t		multype;
 	int			stringform;
 };
 
+/* Generated by generate.py into vcc_obj.c */
 #define VCC_TYPE(UC, lc)	extern const struct type UC[1];
 #include "tbl/vcc_types.h"
 
+/* Generated by generate.py into vcc_obj.c, indexed by type id */
+struct vcc_type_info {
+	const char		*name;
+	vcc_type_t		type;
+	size_t			szof;
+	size_t			align;
+	unsigned		is_ptr;
+};
+
+extern const struct vcc_type_info vcc_type_info[VCC_TYPE_ID_MAX];
+
+#define VCC_CONV_NONE		0xff
+extern const uint8_t vcc_type_conv[VCC_TYPE_ID_MAX][VCC_TYPE_ID_MAX];
+
 /*---------------------------------------------------------------------*/
 typedef const struct kind	*vcc_kind_t;
 
@@ -389,6 +411,7 @@ void vcc_AddToken(struct vcc *tl, unsigned tok, const char *b,
 
 /* vcc_types.c */
 vcc_type_t VCC_Type(const char *p);
+unsigned VCC_TypeConv(vcc_type_t from, vcc_type_t to);
 
 /* vcc_var.c */
 sym_wildcard_t vcc_Var_Wildcard;
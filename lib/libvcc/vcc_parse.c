@@ -378,6 +378,7 @@ vcc_Parse(struct vcc *tl)
 	vcc_ParseVcl(tl);
 	ERRCHK(tl);
 	AN(tl->syntax);
+	vcc_Var_Init(tl);
 	while (tl->t->tok != EOI) {
 		ERRCHK(tl);
 		switch (tl->t->tok) {
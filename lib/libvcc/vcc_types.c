@@ -32,157 +32,42 @@
 
 #include "config.h"
 
+#include <stdlib.h>
 #include <string.h>
 
 #include "vcc_compile.h"
 
-const struct type ACL[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"ACL",
-	.tostring =		"((\v1)->name)",
-}};
-
-const struct type BACKEND[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"BACKEND",
-	.tostring =		"VRT_BACKEND_string(\v1)",
-}};
-
-const struct type BLOB[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"BLOB",
-}};
-
-const struct type BODY[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"BODY",
-}};
-
-const struct type BOOL[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"BOOL",
-	.tostring =		"VRT_BOOL_string(\v1)",
-}};
-
-const struct type BYTES[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"BYTES",
-	.tostring =		"VRT_REAL_string(ctx, \v1)", // XXX: wrong
-	.multype =		REAL,	// XXX: wrong
-}};
-
-const struct type DURATION[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"DURATION",
-	.tostring =		"VRT_REAL_string(ctx, \v1)", // XXX 's' suff?
-	.multype =		REAL,
-}};
-
-const struct type ENUM[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"ENUM",
-	.tostring =		"",
-}};
-
-const struct type HEADER[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"HEADER",
-	.tostring =		"VRT_GetHdr(ctx, \v1)",
-}};
-
-const struct type HTTP[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"HTTP",
-}};
-
-const struct type INSTANCE[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"INSTANCE",
-}};
-
-const struct type INT[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"INT",
-	.multype =		INT,
-	.tostring =		"VRT_INT_string(ctx, \v1)",
-}};
-
-const struct type IP[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"IP",
-	.tostring =		"VRT_IP_string(ctx, \v1)",
-}};
-
-const struct type PROBE[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"PROBE",
-}};
-
-const struct type REAL[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"REAL",
-	.tostring =		"VRT_REAL_string(ctx, \v1)",
-	.multype =		REAL,
-}};
-
-const struct type STEVEDORE[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"STEVEDORE",
-	.tostring =		"VRT_STEVEDORE_string(\v1)",
-}};
-
-const struct type STRING[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"STRING",
-	.stringform =		1,
-}};
-
-const struct type STRANDS[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"STRANDS",
-	.stringform =		1,
-	.tostring =		"VRT_CollectStrands(ctx,\v+\n\v1\v-\n)",
-}};
-
-const struct type STRINGS[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"STRINGS",
-	.tostring =		"",
-}};
-
-const struct type STRING_LIST[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"STRING_LIST",
-	.stringform =		1,
-}};
-
-const struct type SUB[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"SUB",
-}};
-
-const struct type TIME[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"TIME",
-	.tostring =		"VRT_TIME_string(ctx, \v1)",
-}};
+/*
+ * The type descriptors are generated into vcc_obj.c, from the table in
+ * generate.py
+ */
 
-const struct type VCL[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"VCL",
-}};
+static int
+vcc_type_cmp(const void *a, const void *b)
+{
+	const struct vcc_type_info *ti = b;
 
-const struct type VOID[1] = {{
-	.magic =		TYPE_MAGIC,
-	.name =			"VOID",
-}};
+	return (strcmp(a, ti->name));
+}
 
 vcc_type_t
 VCC_Type(const char *p)
 {
-
-#define VCC_TYPE(UC, lc)	if (!strcmp(p, #UC)) return (UC);
-#include "tbl/vcc_types.h"
-	return (NULL);
+	const struct vcc_type_info *ti;
+
+	ti = bsearch(p, vcc_type_info, VCC_TYPE_ID_MAX, sizeof *ti,
+	    vcc_type_cmp);
+	if (ti == NULL)
+		return (NULL);
+	assert(ti->type->id == ti - vcc_type_info);
+	return (ti->type);
 }
 
+unsigned
+VCC_TypeConv(vcc_type_t from, vcc_type_t to)
+{
+
+	CHECK_OBJ_NOTNULL(from, TYPE_MAGIC);
+	CHECK_OBJ_NOTNULL(to, TYPE_MAGIC);
+	return (vcc_type_conv[from->id][to->id]);
+}
@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2020 Varnish Software AS
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+Quick and cheap sanity check of VCL files, without running VCC.
+
+The knowledge about the VCL language comes from the vcl_spec.json
+file produced by lib/libvcc/generate.py, so this stays in sync with
+the compiler it was built with.  Checked are:
+
+ * the lexical structure and the top level statements
+ * the existence of variables and their availability in the VCL
+   syntax level of the file
+ * read, write and unset permissions of variables in the methods a
+   subroutine can be called from
+ * the actions returned from each method
+ * the type of literal values assigned to variables
+
+This is not a replacement for VCC: expressions, VMODs and anything
+brought in with 'include' are not looked into, so a VCL passing this
+check can still fail to compile.
+
+Usage as a module:
+
+	import vclcheck
+	spec = vclcheck.load_spec("vcl_spec.json")
+	for err in vclcheck.check_file(spec, "default.vcl"):
+	    print(err)
+
+With -t, the arguments are varnishtest files, and the VCL of their
+-vcl+backend commands is checked.
+'''
+
+import getopt
+import json
+import os
+import re
+import sys
+
+#######################################################################
+
+class spec(object):
+    ''' The VCL language, as described by vcl_spec.json '''
+
+    def __init__(self, d):
+        self.syntax = d["syntax"]
+        self.tokens = sorted(d["tokens"], key=lambda x: -len(x))
+        self.methods = dict((i["name"], i) for i in d["methods"])
+        self.types = dict((i["name"], i) for i in d["types"])
+        self.conversions = d["conversions"]
+        self.variables = {}
+        for i in d["variables"]:
+            self.variables.setdefault(i["name"], []).append(i)
+        self.roots = set(i.split(".")[0] for i in self.variables)
+        self.stv_variables = dict(
+            (i["name"], i) for i in d["stevedore_variables"])
+
+    def find_var(self, name):
+        ''' Return the candidate definitions and the variable name '''
+        if name in self.variables:
+            return self.variables[name], name
+        l = name.split(".")
+        while len(l) > 1:
+            l.pop()
+            n = ".".join(l)
+            vl = [v for v in self.variables.get(n, []) if v["wildcard"]]
+            if vl:
+                return vl, n
+        return [], name
+
+    def convertible(self, fm, to):
+        return to in self.conversions.get(fm, {})
+
+def load_spec(fn):
+    with open(fn) as fi:
+        return spec(json.load(fi))
+
+#######################################################################
+
+class token(object):
+    def __init__(self, tok, txt, lno, col):
+        self.tok = tok
+        self.txt = txt
+        self.lno = lno
+        self.col = col
+
+    def __repr__(self):
+        return "<%s %r %d:%d>" % (self.tok, self.txt, self.lno, self.col)
+
+class VclError(Exception):
+    def __init__(self, tok, msg):
+        super(VclError, self).__init__(msg)
+        self.tok = tok
+        self.msg = msg
+
+def isident1(c):
+    return c.isalpha() and c.isascii()
+
+def isident(c):
+    return (c.isalnum() and c.isascii()) or c in "_-"
+
+def lexer(sp, src):
+    ''' Split VCL source into tokens, like vcc_Lexer() '''
+    tl = []
+    p = 0
+    e = len(src)
+    lno = 1
+    lbeg = 0
+
+    def add(tok, q):
+        tl.append(token(tok, src[p:q], lno, p - lbeg + 1))
+
+    while p < e:
+        c = src[p]
+        if c == "\n":
+            p += 1
+            lno += 1
+            lbeg = p
+            continue
+        if c.isspace():
+            p += 1
+            continue
+        if c == "#" or src.startswith("//", p):
+            q = src.find("\n", p)
+            p = e if q < 0 else q
+            continue
+        if src.startswith("/*", p):
+            q = src.find("*/", p + 2)
+            if q < 0:
+                add("EOI", p + 2)
+                raise VclError(tl[-1], "Unterminated /* ... */ comment")
+            if src.find("/*", p + 2, q) >= 0:
+                add("EOI", p + 2)
+                raise VclError(tl[-1], "/* ... */ comment contains /*")
+            q += 2
+        elif src.startswith("C{", p) or src.startswith('{"', p):
+            t, x = ("CSRC", "}C") if c == "C" else ("CSTR", '"}')
+            q = src.find(x, p + 2)
+            if q < 0:
+                add("EOI", p + 2)
+                raise VclError(tl[-1], "Unterminated " +
+                               ("inline C source" if t == "CSRC"
+                                else "long-string"))
+            q += 2
+            add(t, q)
+        else:
+            for i in sp.tokens:
+                if src.startswith(i, p):
+                    q = p + len(i)
+                    add(i, q)
+                    break
+            else:
+                q = p + 1
+                if c == '"':
+                    while q < e and src[q] not in '"\r\n':
+                        q += 1
+                    if q == e or src[q] != '"':
+                        add("EOI", q)
+                        raise VclError(tl[-1], "Unterminated string")
+                    q += 1
+                    add("CSTR", q)
+                elif isident1(c):
+                    while q < e and isident(src[q]):
+                        q += 1
+                    add("ID", q)
+                elif c.isdigit():
+                    while q < e and src[q].isdigit():
+                        q += 1
+                    if q < e and src[q] == ".":
+                        q += 1
+                        while q < e and src[q].isdigit():
+                            q += 1
+                        add("FNUM", q)
+                    else:
+                        add("CNUM", q)
+                else:
+                    add("EOI", q)
+                    raise VclError(tl[-1], "Syntax error")
+        # Multiline comments and strings
+        n = src.count("\n", p, q)
+        if n:
+            lno += n
+            lbeg = src.rfind("\n", p, q) + 1
+        p = q
+    tl.append(token("EOI", "", lno, p - lbeg + 1))
+    return tl
+
+#######################################################################
+
+duration_units = ("ms", "s", "m", "h", "d", "w", "y")
+bytes_units = ("B", "KB", "MB", "GB", "TB")
+
+class sub(object):
+    def __init__(self, name, tok, body):
+        self.name = name
+        self.tok = tok
+        self.body = body
+        self.calls = []
+        self.methods = set()
+
+class vclfile(object):
+    def __init__(self, sp, fn, src):
+        self.sp = sp
+        self.fn = fn
+        self.src = src
+        self.syntax = None
+        self.subs = {}
+        self.includes = False
+        self.errors = []
+
+    def err(self, tok, msg):
+        self.errors.append((tok.lno, tok.col, msg))
+
+    #--------------------------------------------------------------
+    # Top level
+
+    def expect(self, tl, i, tok):
+        if tl[i].tok != tok:
+            raise VclError(tl[i], "Expected '%s' got '%s'" %
+                           (tok, tl[i].txt))
+        return i + 1
+
+    def skip_block(self, tl, i):
+        ''' Skip a {...} block, return index after the closing brace '''
+        i = self.expect(tl, i, "{")
+        n = 1
+        b = i
+        while n:
+            if tl[i].tok == "EOI":
+                raise VclError(tl[b - 1], "Unbalanced '{'")
+            if tl[i].tok == "{":
+                n += 1
+            elif tl[i].tok == "}":
+                n -= 1
+            i += 1
+        return i
+
+    def parse_vcl(self, tl, i):
+        t0 = tl[i]
+        i = self.expect(tl, i + 1, "FNUM")
+        v = tl[i - 1].txt.split(".")
+        syntax = int(v[0]) * 10 + int(v[1])
+        if syntax not in self.sp.syntax:
+            raise VclError(t0, "VCL version %s not supported." %
+                           tl[i - 1].txt)
+        i = self.expect(tl, i, ";")
+        if self.syntax is None:
+            self.syntax = syntax
+        elif syntax > self.syntax:
+            raise VclError(t0, "VCL version %s higher than the top level"
+                           " version %.1f" % (tl[i - 2].txt,
+                                              .1 * self.syntax))
+        return i
+
+    def parse(self):
+        tl = lexer(self.sp, self.src)
+        i = 0
+        if tl[i].tok != "ID" or tl[i].txt != "vcl":
+            raise VclError(tl[i], "VCL version declaration missing")
+        i = self.parse_vcl(tl, i)
+        while tl[i].tok != "EOI":
+            t = tl[i]
+            if t.tok == "CSRC":
+                i += 1
+                continue
+            if t.tok != "ID":
+                raise VclError(t, "Expected one of 'acl', 'sub', "
+                               "'backend', 'probe', 'import', or 'vcl'")
+            if t.txt == "vcl":
+                i = self.parse_vcl(tl, i)
+            elif t.txt == "include":
+                self.includes = True
+                i = self.expect(tl, i + 1, "CSTR")
+                i = self.expect(tl, i, ";")
+            elif t.txt == "import":
+                i = self.expect(tl, i + 1, "ID")
+                if tl[i].tok == "ID" and tl[i].txt == "as":
+                    i = self.expect(tl, i + 1, "ID")
+                if tl[i].tok == "ID" and tl[i].txt == "from":
+                    i = self.expect(tl, i + 1, "CSTR")
+                i = self.expect(tl, i, ";")
+            elif t.txt in ("backend", "probe", "acl"):
+                i = self.expect(tl, i + 1, "ID")
+                if t.txt == "backend" and tl[i].txt == "none":
+                    i = self.expect(tl, i + 1, ";")
+                    continue
+                while tl[i].tok not in ("{", "EOI"):
+                    i += 1
+                i = self.skip_block(tl, i)
+            elif t.txt == "sub":
+                i = self.expect(tl, i + 1, "ID")
+                nt = tl[i - 1]
+                b = i
+                i = self.skip_block(tl, i)
+                self.add_sub(nt, tl[b + 1:i - 1])
+            else:
+                raise VclError(t, "Expected one of 'acl', 'sub', "
+                               "'backend', 'probe', 'import', or 'vcl'")
+
+    def add_sub(self, nt, body):
+        name = nt.txt
+        if name[:4] == "vcl_" and name[4:] not in self.sp.methods:
+            self.err(nt, "The names 'vcl_*' are reserved for subroutines.")
+            return
+        if name in self.subs:
+            # Method bodies are concatenated, custom subs are not
+            if name[:4] != "vcl_":
+                self.err(nt, "Subroutine '%s' redefined" % name)
+                return
+            self.subs[name].body += body
+            return
+        self.subs[name] = sub(name, nt, body)
+
+    #--------------------------------------------------------------
+    # Subroutine bodies
+
+    def dotted(self, body, i):
+        ''' Collect an ID.ID... name, return it and the next index '''
+        l = [body[i].txt]
+        i += 1
+        while (i + 1 < len(body) and body[i].tok == "." and
+               body[i + 1].tok == "ID"):
+            l.append(body[i + 1].txt)
+            i += 2
+        return ".".join(l), i
+
+    def scan_calls(self, s):
+        for i, t in enumerate(s.body):
+            if t.tok == "ID" and t.txt == "call" and \
+               i + 1 < len(s.body) and s.body[i + 1].tok == "ID":
+                s.calls.append(s.body[i + 1])
+
+    def propagate(self):
+        ''' Work out which methods each subroutine can be called from '''
+        for s in self.subs.values():
+            self.scan_calls(s)
+        for s in self.subs.values():
+            if s.name[:4] != "vcl_":
+                continue
+            todo = [s]
+            m = s.name[4:]
+            while todo:
+                x = todo.pop()
+                if m in x.methods:
+                    continue
+                x.methods.add(m)
+                for c in x.calls:
+                    y = self.subs.get(c.txt)
+                    if y is not None:
+                        todo.append(y)
+        if self.includes:
+            return
+        for s in self.subs.values():
+            for c in s.calls:
+                if c.txt not in self.subs:
+                    self.err(c, "Symbol not found: '%s'" % c.txt)
+
+    def check_access(self, s, t, name, how):
+        vl, vn = self.sp.find_var(name)
+        if not vl:
+            self.err(t, "Symbol not found: '%s'" % name)
+            return None
+        v = [x for x in vl if x["vlo"] <= self.syntax <= x["vhi"]]
+        if not v:
+            x = vl[0]
+            m = " (Only available when"
+            if x["vlo"] >= self.sp.syntax[0]:
+                m += " %.1f <=" % (.1 * x["vlo"])
+            m += " VCL syntax"
+            if x["vhi"] <= self.sp.syntax[-1]:
+                m += " <= %.1f" % (.1 * x["vhi"])
+            self.err(t, "Symbol not found: '%s'%s)" % (name, m))
+            return None
+        v = v[0]
+        verb = {"read": "readable", "write": "writable",
+                "unset": "unsetable"}[how]
+        if not v[how]:
+            self.err(t, "Variable '%s' is read only." % name
+                     if how == "write" else
+                     "Variable '%s' is not %s." % (name, verb))
+            return v
+        for m in sorted(s.methods):
+            if m not in v[how]:
+                self.err(t, "'%s': Not %s from method 'vcl_%s'." %
+                         (name, verb, m))
+        return v
+
+    def literal_type(self, body, i):
+        ''' Type of a single literal value followed by ';', or None '''
+        t = body[i]
+        n = body[i + 1] if i + 1 < len(body) else None
+        if t.tok == "CSTR":
+            ty = "STRINGS"
+        elif t.tok == "ID" and t.txt in ("true", "false"):
+            ty = "BOOL"
+        elif t.tok in ("CNUM", "FNUM"):
+            ty = "INT" if t.tok == "CNUM" else "REAL"
+            if n is not None and n.tok == "ID":
+                if n.txt in duration_units:
+                    ty = "DURATION"
+                elif n.txt in bytes_units:
+                    ty = "BYTES"
+                else:
+                    return None
+                i += 1
+                n = body[i + 1] if i + 1 < len(body) else None
+        else:
+            return None
+        if n is None or n.tok != ";":
+            return None
+        return ty
+
+    def check_set(self, body, i, t, v):
+        if body[i].tok != "=":
+            return
+        ty = self.literal_type(body, i + 1)
+        if ty is None:
+            return
+        vt = v["type"]
+        if vt in ("HEADER", "BODY"):
+            vt = "STRING_LIST"
+        if ty == vt:
+            return
+        if ty == "INT" and vt in ("REAL", "BYTES"):
+            return
+        if not self.sp.convertible(ty, vt):
+            if ty == "STRINGS":
+                ty = "STRING"
+            self.err(body[i + 1], "Expression has type %s, expected %s" %
+                     (ty, v["type"]))
+
+    def check_return(self, s, body, i):
+        t = body[i]
+        if i + 1 >= len(body) or body[i + 1].tok != "(":
+            return
+        if i + 2 >= len(body) or body[i + 2].tok != "ID":
+            return
+        a = body[i + 2]
+        for m in sorted(s.methods):
+            if a.txt not in self.sp.methods[m]["returns"]:
+                self.err(a, "Invalid return \"%s\" from method 'vcl_%s'" %
+                         (a.txt, m))
+
+    def check_sub(self, s):
+        body = s.body
+        new = set()
+        i = 0
+        while i < len(body):
+            t = body[i]
+            if t.tok != "ID":
+                i += 1
+                continue
+            if t.txt == "new" and i + 1 < len(body):
+                new.add(body[i + 1].txt)
+                i += 2
+                continue
+            if t.txt == "return":
+                self.check_return(s, body, i)
+                i += 1
+                continue
+            if t.txt in ("set", "unset") and i + 1 < len(body) and \
+               body[i + 1].tok == "ID":
+                how = "write" if t.txt == "set" else "unset"
+                name, j = self.dotted(body, i + 1)
+                if name.split(".")[0] in self.sp.roots:
+                    v = self.check_access(s, body[i + 1], name, how)
+                    if v is not None and how == "write" and j < len(body):
+                        self.check_set(body, j, body[i + 1], v)
+                i = j
+                continue
+            if i > 0 and body[i - 1].tok == ".":
+                i += 1
+                continue
+            name, j = self.dotted(body, i)
+            call = j < len(body) and body[j].tok == "("
+            if call and "." in name:
+                # A method, like req.url.lower(), reads its object
+                name = name.rsplit(".", 1)[0]
+                call = False
+            root = name.split(".")[0]
+            if root == "storage" and "." in name:
+                self.check_storage(t, name)
+            elif root in self.sp.roots and root not in new and \
+               ("." in name or name in self.sp.variables) and not call:
+                self.check_access(s, t, name, "read")
+            i = j
+
+    def check_storage(self, t, name):
+        l = name.split(".")
+        if len(l) == 3 and l[2] not in self.sp.stv_variables:
+            self.err(t, "Symbol not found: '%s'" % name)
+
+    def check(self):
+        try:
+            self.parse()
+        except VclError as e:
+            self.err(e.tok, e.msg)
+        else:
+            self.propagate()
+            for n in sorted(self.subs):
+                self.check_sub(self.subs[n])
+        return ["%s:%d:%d: %s" % ((self.fn,) + i)
+                for i in sorted(set(self.errors))]
+
+#######################################################################
+
+def check_source(sp, fn, src):
+    ''' Check VCL source text, return a list of error messages '''
+    return vclfile(sp, fn, src).check()
+
+def check_file(sp, fn):
+    ''' Check a VCL file, return a list of error messages '''
+    with open(fn, encoding="UTF-8") as fi:
+        return check_source(sp, fn, fi.read())
+
+def vtc_vcls(src):
+    ''' The VCL of the -vcl+backend arguments of a varnishtest file,
+    as (line number, syntax, text) '''
+    l = []
+    for m in re.finditer(r"-vcl\+backend\s*{", src):
+        b = m.end()
+        e = b
+        n = 1
+        while n and e < len(src):
+            if src[e] == "{":
+                n += 1
+            elif src[e] == "}":
+                n -= 1
+            e += 1
+        # -syntax applies from where it appears in the command
+        c = src.rfind("\nvarnish ", 0, m.start())
+        syntax = "4.1"
+        for i in re.findall(r"-syntax\s+(\S+)", src[c:m.start()]):
+            syntax = i
+        l.append((src.count("\n", 0, b) + 1, syntax, src[b:e - 1]))
+    return l
+
+def check_vtc(sp, fn):
+    ''' Check the -vcl+backend VCL of a varnishtest file, with the
+    backends varnishtest adds replaced by one, and the line numbers of
+    the .vtc file '''
+    with open(fn, encoding="UTF-8") as fi:
+        src = fi.read()
+    el = []
+    for lno, syntax, vcl in vtc_vcls(src):
+        vcl = "\n" * (lno - 2) + "vcl %s; backend default none;\n" % \
+            syntax + vcl
+        el += check_source(sp, fn, vcl)
+    return el
+
+def usage():
+    print("Usage: vclcheck.py [-s vcl_spec.json] [-t] file ...",
+          file=sys.stderr)
+    exit(2)
+
+if __name__ == "__main__":
+    try:
+        optlist, args = getopt.getopt(sys.argv[1:], "s:t")
+    except getopt.GetoptError:
+        usage()
+    specfn = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "vcl_spec.json")
+    check = check_file
+    for f, v in optlist:
+        if f == '-s':
+            specfn = v
+        elif f == '-t':
+            check = check_vtc
+    if not args:
+        usage()
+    vsp = load_spec(specfn)
+    rv = 0
+    for i in args:
+        for j in check(vsp, i):
+            print(j)
+            rv = 1
+    exit(rv)
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2026 Varnish Software AS
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+"""
+Run all the code generators of the tree from a single interpreter
+
+    codegen.py [-f] [-j jobs] [-l] [-t] [srcroot buildroot]
+
+The generators, include/generate.py, lib/libvcc/generate.py,
+lib/libvarnishapi/generate.py, huffman_gen.py, vsctool.py for each
+.vsc file and vmodtool.py for each VMOD, are run as the __main__
+module of a child forked from this process, with the arguments and in
+the build directory the Makefiles use.  The huffman_gen.py jobs and the
+vmodtool.py arguments are read from the Makefile.am files.  A job waits for the jobs
+producing its inputs, the others run concurrently.
+
+    -f
+        run all jobs, see below
+
+    -j jobs
+        number of jobs to run at a time
+        default: number of CPUs
+
+    -l
+        list the jobs with their inputs and outputs
+
+    -t
+        report the time spent on each job, marked "*" when outputs
+        changed and "!" when it failed
+
+A job is skipped when its arguments, and the mtime and size of its
+script and inputs are those recorded in .codegen.state, in buildroot,
+after its last run, and its outputs exist.  include/generate.py always runs.
+
+The outputs are written to a temporary file renamed over the old one
+if their content changed, and otherwise keep their mtime, so make does
+not rebuild what depends on them.
+"""
+
+import builtins
+import getopt
+import glob
+import io
+import json
+import multiprocessing
+import os
+import runpy
+import sys
+import time
+import traceback
+
+real_open = builtins.open
+
+class job(object):
+    def __init__(self, name, script, argv, cwd, inputs, outputs,
+                 stdout=None, always=False):
+        self.name = name
+        self.script = script
+        # Paths relative to the build directory, as make passes them,
+        # since some of them end up in the outputs
+        self.argv = [os.path.relpath(i, cwd) if os.path.isabs(i) else i
+                     for i in argv]
+        self.cwd = cwd
+        self.inputs = inputs
+        self.outputs = outputs
+        self.stdout = stdout
+        self.always = always
+
+#######################################################################
+# The jobs, as found in the Makefiles
+
+def vmod_job(srcroot, buildroot, d):
+    """ vmodtool.py, with the vmodtoolargs of the VMOD's Makefile.am """
+    src = os.path.join(srcroot, d)
+    bld = os.path.join(buildroot, d)
+    args = ["--strict", "--boilerplate", "-o", "vcc_if"]
+    for i in open(os.path.join(src, "Makefile.am")):
+        if i.split("=")[0].strip() == "vmodtoolargs":
+            args = i.split("=", 1)[1].split()
+    pfx = "vcc_if"
+    if "-o" in args:
+        pfx = args[args.index("-o") + 1]
+    outputs = [os.path.join(bld, pfx + ".c"), os.path.join(bld, pfx + ".h")]
+    for i in open(os.path.join(src, "vmod.vcc")):
+        if i[:8] == "$Module ":
+            name = i.split()[1]
+            outputs.append(os.path.join(bld, "vmod_" + name + ".rst"))
+            outputs.append(os.path.join(bld, "vmod_" + name + ".man.rst"))
+            break
+    if "--boilerplate" in args:
+        outputs.append(os.path.join(bld, "automake_boilerplate.am"))
+    return job(os.path.join(d, pfx + ".c"),
+               os.path.join(srcroot, "lib/libvcc/vmodtool.py"),
+               args + [os.path.join(src, "vmod.vcc")], bld,
+               [os.path.join(src, "vmod.vcc")], outputs)
+
+def makefile_jobs(srcroot, buildroot, d, script):
+    """
+    The rules of d/Makefile.am running script with their output on
+    stdout, with the arguments and prerequisites in the rule
+    """
+    src = os.path.join(srcroot, d)
+    bld = os.path.join(buildroot, d)
+    name = os.path.basename(script)
+    subst = (("$(top_srcdir)", srcroot), ("$(srcdir)", src),
+             ("$(top_builddir)", buildroot), ("$(builddir)", bld))
+
+    def path(fn):
+        for k, v in subst:
+            fn = fn.replace(k, v)
+        # Relative prerequisites are found in srcdir, through VPATH
+        return os.path.normpath(os.path.join(src, fn))
+
+    lines = []
+    cont = ""
+    for i in open(os.path.join(src, "Makefile.am")):
+        i = cont + i.rstrip("\n")
+        if i[-1:] == "\\":
+            cont = i[:-1] + " "
+            continue
+        cont = ""
+        lines.append(i)
+
+    jobs = []
+    target = None
+    for i in lines:
+        if i[:1] != "\t":
+            target = None
+            t, sep, prereq = i.partition(":")
+            if sep and "=" not in t and len(t.split()) == 1 and \
+               t[:1] not in ".$":
+                target = t.strip()
+                inputs = [path(fn) for fn in prereq.split()
+                          if os.path.basename(fn) != name]
+            continue
+        words = i.split()
+        cmd = [w for w in words if os.path.basename(w) == name]
+        if target is None or not cmd or ">" not in words:
+            continue
+        args = words[words.index(cmd[0]) + 1:words.index(">")]
+        args = [path(a) if "$(" in a else a for a in args]
+        jobs.append(job(os.path.join(d, target), script, args, bld,
+                        inputs, [os.path.join(bld, target)],
+                        stdout=os.path.join(bld, target)))
+    return jobs
+
+def find_jobs(srcroot, buildroot):
+    S = lambda *p: os.path.join(srcroot, *p)
+    B = lambda *p: os.path.join(buildroot, *p)
+    jobs = []
+
+    jobs.append(job("include/vcs_version.h",
+                    S("include/generate.py"), [srcroot, buildroot],
+                    B("include"), [],
+                    [S("include/vcs_version.h"), S("include/vmod_abi.h")],
+                    always=True))
+
+    # lib/libvcc/generate.py knows its outputs and their sources
+    sys.path.insert(0, S("lib/libvcc"))
+    try:
+        import generate as vccgen
+    finally:
+        del sys.path[0]
+    srcs = []
+    for o in vccgen.outputs:
+        srcs += [S(i) for i in o.srcs if S(i) not in srcs]
+    jobs.append(job("lib/libvcc/vcc_obj.c",
+                    S("lib/libvcc/generate.py"), [srcroot, buildroot],
+                    B("lib/libvcc"), srcs,
+                    [B(o.name) for o in vccgen.outputs]))
+
+    jobs.append(job("lib/libvarnishapi/vxp_tokens.h",
+                    S("lib/libvarnishapi/generate.py"),
+                    [S("lib/libvarnishapi"), buildroot],
+                    B("lib/libvarnishapi"), [],
+                    [B("lib/libvarnishapi", i) for i in (
+                        "vxp_tokens.h", "vxp_fixed_token.c", "vxp_tags.h")]))
+
+    hufgen = S("bin/varnishtest/huffman_gen.py")
+    for d in ("bin/varnishtest", "bin/varnishd"):
+        jobs += makefile_jobs(srcroot, buildroot, d, hufgen)
+
+    for fn in sorted(glob.glob(S("bin/varnishd/VSC_*.vsc")) +
+                     glob.glob(S("lib/libvmod_*/VSC_*.vsc"))):
+        d = os.path.relpath(os.path.dirname(fn), srcroot)
+        bn = os.path.basename(fn)[:-4]
+        jobs.append(job(os.path.join(d, bn + ".c"),
+                        S("lib/libvcc/vsctool.py"), ["-ch", fn], B(d),
+                        [fn], [B(d, bn + ".c"), B(d, bn + ".h")]))
+
+    for fn in sorted(glob.glob(S("lib/libvmod_*/vmod.vcc"))):
+        d = os.path.relpath(os.path.dirname(fn), srcroot)
+        jobs.append(vmod_job(srcroot, buildroot, d))
+    return jobs
+
+#######################################################################
+# Running a job, in a forked child
+
+class genfile(object):
+    """ A file written aside and renamed over fn if its content changed """
+
+    def __init__(self, fn, mode, kw):
+        self.fn = fn
+        self.tmp = "%s.%d.tmp" % (fn, os.getpid())
+        self.fo = real_open(self.tmp, mode, **kw)
+
+    def __getattr__(self, attr):
+        return getattr(self.fo, attr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.fo.closed:
+            return
+        self.fo.close()
+        commit(self.tmp, self.fn)
+
+def commit(tmp, fn):
+    """ Rename tmp over fn, unless they have the same content """
+    try:
+        with real_open(fn, "rb") as f1, real_open(tmp, "rb") as f2:
+            if f1.read() == f2.read():
+                os.remove(tmp)
+                return
+    except IOError:
+        pass
+    os.replace(tmp, fn)
+
+def snapshot(fn):
+    try:
+        with real_open(fn, "rb") as f:
+            return f.read(), os.stat(fn)
+    except IOError:
+        return None
+
+def unchanged(fn, before):
+    """
+    Compare fn with its snapshot, and if the generator wrote the same
+    content in some way of its own, give the file back its mtime.
+    """
+    after = snapshot(fn)
+    if before is None or after is None or after[0] != before[0]:
+        return False
+    st = before[1]
+    if after[1].st_mtime_ns != st.st_mtime_ns:
+        os.utime(fn, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return True
+
+def run_job(j):
+    """ Return the seconds spent, the outputs changed and any error """
+    t0 = time.time()
+    before = {fn: snapshot(fn) for fn in j.outputs}
+    outputs = set(j.outputs)
+    opened = []
+
+    def gen_open(file, mode="r", *args, **kw):
+        if isinstance(file, str) and "w" in mode and not args and \
+           os.path.abspath(file) in outputs:
+            fo = genfile(os.path.abspath(file), mode, kw)
+            opened.append(fo)
+            return fo
+        return real_open(file, mode, *args, **kw)
+
+    err = None
+    out = None
+    try:
+        for fn in j.outputs:
+            os.makedirs(os.path.dirname(fn), exist_ok=True)
+        os.chdir(j.cwd)
+        sys.argv = [j.script] + j.argv
+        sys.path.insert(0, os.path.dirname(j.script))
+        builtins.open = gen_open
+        if j.stdout is not None:
+            sys.stdout = io.StringIO()
+        runpy.run_path(j.script, run_name="__main__")
+    except SystemExit as e:
+        if e.code:
+            err = "%s: exit status %s" % (j.name, e.code)
+    except Exception:
+        err = traceback.format_exc()
+    finally:
+        builtins.open = real_open
+        for fo in opened:
+            fo.close()
+        if sys.stdout is not sys.__stdout__:
+            out = sys.stdout.getvalue()
+            sys.stdout = sys.__stdout__
+    if err is None and out is not None:
+        with genfile(j.stdout, "w", {}) as fo:
+            fo.write(out)
+    changed = [fn for fn in j.outputs if not unchanged(fn, before[fn])]
+    return time.time() - t0, changed, err
+
+#######################################################################
+# Scheduling
+
+def signature(j):
+    sig = [j.argv]
+    for fn in [j.script] + j.inputs:
+        try:
+            st = os.stat(fn)
+            sig.append([fn, st.st_mtime_ns, st.st_size])
+        except OSError:
+            sig.append([fn, None, None])
+    return sig
+
+def up_to_date(j, state):
+    if j.always or state.get(j.name) != signature(j):
+        return False
+    return all(os.path.exists(fn) for fn in j.outputs)
+
+def run(jobs, njobs, state, force):
+    """
+    Run the jobs, the ones producing inputs of others first, and
+    return a list of (job, seconds, changed) tuples, seconds being None
+    for the jobs skipped and changed None for the jobs which failed.
+    """
+    deps = {}
+    for j in jobs:
+        deps[j.name] = [k.name for k in jobs
+                        if k is not j and set(k.outputs) & set(j.inputs)]
+    todo = list(jobs)
+    done = set()
+    result = []
+    failed = False
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Pool(max(njobs, 1), maxtasksperchild=1) as pool:
+        while todo:
+            ready = [j for j in todo if done.issuperset(deps[j.name])]
+            assert ready, "Circular job dependencies"
+            torun = []
+            for j in ready:
+                if not force and up_to_date(j, state):
+                    result.append((j, None, []))
+                else:
+                    torun.append(j)
+            for j, (t, changed, err) in zip(
+                    torun, pool.map(run_job, torun, 1)):
+                if err is not None:
+                    sys.stderr.write(err.rstrip("\n") + "\n")
+                    state.pop(j.name, None)
+                    failed = True
+                    changed = None
+                else:
+                    state[j.name] = signature(j)
+                result.append((j, t, changed))
+            done.update(j.name for j in ready)
+            todo = [j for j in todo if j not in ready]
+    return result, failed
+
+def main():
+    optlist, args = getopt.getopt(sys.argv[1:], "fj:lt")
+    force = False
+    njobs = os.cpu_count() or 1
+    do_list = False
+    timing = False
+    for f, v in optlist:
+        if f == '-f':
+            force = True
+        elif f == '-j':
+            njobs = int(v)
+        elif f == '-l':
+            do_list = True
+        elif f == '-t':
+            timing = True
+    if len(args) == 2:
+        srcroot, buildroot = args
+    elif not args:
+        srcroot = buildroot = "."
+    else:
+        sys.stderr.write(__doc__)
+        sys.exit(2)
+    srcroot = os.path.abspath(srcroot)
+    buildroot = os.path.abspath(buildroot)
+
+    t0 = time.time()
+    jobs = find_jobs(srcroot, buildroot)
+    if do_list:
+        for j in jobs:
+            print(j.name + ":")
+            for fn in [j.script] + j.inputs:
+                print("\t< " + os.path.relpath(fn, srcroot))
+            for fn in j.outputs:
+                print("\t> " + os.path.relpath(fn, buildroot))
+        sys.exit(0)
+
+    statefn = os.path.join(buildroot, ".codegen.state")
+    try:
+        with open(statefn) as f:
+            state = json.load(f)
+    except (IOError, ValueError):
+        state = {}
+    result, failed = run(jobs, njobs, state, force)
+    with genfile(statefn, "w", {}) as fo:
+        json.dump(state, fo, indent=1, sort_keys=True)
+        fo.write("\n")
+
+    if timing:
+        for j, t, changed in result:
+            if t is None:
+                print("%8s    %s %s" % ("-", " ", j.name), file=sys.stderr)
+            else:
+                print("%8.3f ms %s %s" % (
+                    t * 1e3, "!" if changed is None else
+                    "*" if changed else " ", j.name), file=sys.stderr)
+        print("%8.3f ms total, %d of %d jobs run" % (
+            (time.time() - t0) * 1e3,
+            sum(1 for i in result if i[1] is not None), len(result)),
+            file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
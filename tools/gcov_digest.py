@@ -37,9 +37,27 @@ Options:
     -g gcov-program
         default:gcov6
 
+    -j jobs
+        run gcov in that many directories in parallel
+        default: 1
+
+    -J
+        read gcov's JSON output (--json-format --stdout, gcc 10 and
+        later) from the pipe instead of the .gcov files it writes
+
     -o output-filename
         default: stdout
 
+    -b
+        binary output, see produce_binary()
+
+    -r digest
+        read a text or binary digest instead of running gcov, to
+        convert it
+
+    -t test
+        attribute the coverage to a test, see pertest below
+
     -x exclude-subdir
         default ".git" and ".deps"
 
@@ -48,50 +66,93 @@ Options:
     directories to process.
     default: .
 
+ Subcommands:
+
+    merge [-a] [-b] [-o output-filename] digest...
+        sum digests, keeping the per test attribution with -a
+
+    pertest [options] -c command test...
+        run each test and attribute the coverage it produces to it
+
+    index [-o index] [-u index] digest...
+        map the source lines to the tests which execute them
+
+    query [-i index] [diff]
+        print the tests affected by a unified diff
+
 """
 
 import os
 import sys
+import json
 import getopt
 import subprocess
+import multiprocessing
+import zlib
 
 counts = {}
 lengths = {}
+tests = {}
+srclengths = {}
 
 exclude = [".git", ".deps",]
 
-def process_gcov(fn, sn):
+def process_gcov(fn, sn, counts, lengths):
     """ Sum .gcov file into counts, then delete it """
     dd = counts.get(sn)
     if dd is None:
         dd = {}
+    plno = 0
     for ln in open(fn, encoding="UTF-8"):
         d = ln.split(":")
+        if len(d) < 3:
+            # "------------------" and "function:" of per function
+            # listings
+            continue
         cnt = d[0].strip()
         ll = d[1]
+        lno = int(ll)
+        if lno <= plno:
+            # per function listing of a line with several functions
+            continue
+        plno = lno
         if cnt == "-":
             continue
         if cnt == "#####":
             cnt = 0
         else:
             cnt = int(cnt)
-        lno = int(d[1])
         if lno not in dd:
             dd[lno] = 0
         dd[lno] += cnt
     counts[sn] = dd
-    pl = lengths.get(sn)
     ll = ll.strip()
     if d[2] == "/*EOF*/\n":
+        ll = None
+    merge_length(lengths, sn, ll, fn)
+    os.remove(fn)
+
+def merge_length(lengths, sn, ll, fn):
+    """ Record the length of a source file, "-1" if they conflict """
+    pl = lengths.get(sn)
+    if ll is None:
         ll = pl
     elif pl != ll and not pl is None:
-        print("CONFLICT", fn, ll, pl)
+        print("CONFLICT", fn, ll, pl, file=sys.stderr)
         ll = "-1"
     lengths[sn] = ll
-    os.remove(fn)
 
-def run_gcov(prog, subdir):
-    """ Walk tree, run gcov, process output """
+def merge(counts, lengths, c2, l2):
+    """ Sum the counts and lengths c2 and l2 into counts and lengths """
+    for sn, dd2 in c2.items():
+        dd = counts.setdefault(sn, {})
+        for lno, cnt in dd2.items():
+            dd[lno] = dd.get(lno, 0) + cnt
+        merge_length(lengths, sn, l2[sn], sn)
+
+def find_jobs(subdir):
+    """ Walk tree, return the (directory, object) to run gcov on """
+    jobs = []
     for root, dirs, files in os.walk(subdir):
         for i in exclude:
             if i in dirs:
@@ -106,30 +167,132 @@ def run_gcov(prog, subdir):
             # must be found relative to the parent directory
 
             if root[-6:] == "/.libs":
-                x = subprocess.check_output(
-                    ["cd " + root + "/.. && " +
-                     "exec " + prog + " .libs/" + fn],
-                    stderr=subprocess.STDOUT, shell=True,
-                    universal_newlines=True)
-                pf = ".."
+                jobs.append((os.path.join(root, ".."), ".libs/" + fn))
             else:
-                x = subprocess.check_output(
-                    ["cd " + root + " && " +
-                     "exec " + prog + " " + fn],
-                    stderr=subprocess.STDOUT, shell=True,
-                    universal_newlines=True)
-                pf = ""
-
-            for ln in x.split("\n"):
-                ln = ln.split()
-                if not ln:
-                    continue
-                if ln[0].find("reating") != -1:
-                    gn = ln[1].strip("'")
-                    assert gn[-5:] == ".gcov"
-                    sn = gn[:-5]
-                    process_gcov(
-                        os.path.join(root, pf, gn), sn)
+                jobs.append((root, fn))
+    return jobs
+
+def gcov_job(prog, cwd, fn):
+    """ Run gcov on one object, return its counts and lengths """
+    c = {}
+    l = {}
+    x = subprocess.check_output(
+        ["cd " + cwd + " && " +
+         "exec " + prog + " " + fn],
+        stderr=subprocess.STDOUT, shell=True,
+        universal_newlines=True)
+
+    for ln in x.split("\n"):
+        ln = ln.split()
+        if not ln:
+            continue
+        if ln[0].find("reating") != -1:
+            gn = ln[1].strip("'")
+            assert gn[-5:] == ".gcov"
+            sn = gn[:-5]
+            process_gcov(os.path.join(cwd, gn), sn, c, l)
+    return c, l
+
+def source_length(path):
+    """ Number of lines of a source file, None if it cannot be read """
+    if path not in srclengths:
+        try:
+            with open(path, "rb") as f:
+                srclengths[path] = str(sum(1 for _ in f))
+        except OSError:
+            srclengths[path] = None
+    return srclengths[path]
+
+def gcov_json_job(prog, cwd, fn):
+    """
+    Run gcov on one object in JSON mode, return its counts and lengths
+
+    The JSON documents are read from gcov's stdout as they come, one
+    per object.  Lines holding several functions are listed for each
+    of them, and summed like in the .gcov files.
+    """
+    c = {}
+    l = {}
+    p = subprocess.Popen(
+        ["cd " + cwd + " && " +
+         "exec " + prog + " --json-format --stdout " + fn],
+        stdout=subprocess.PIPE, shell=True, universal_newlines=True)
+    for ln in p.stdout:
+        if not ln.startswith("{"):
+            continue
+        doc = json.loads(ln)
+        wd = doc.get("current_working_directory", cwd)
+        for f in doc["files"]:
+            sn = os.path.basename(f["file"])
+            dd = c.setdefault(sn, {})
+            for i in f["lines"]:
+                lno = i["line_number"]
+                dd[lno] = dd.get(lno, 0) + i["count"]
+            merge_length(l, sn,
+                         source_length(os.path.join(wd, f["file"])), fn)
+    p.stdout.close()
+    if p.wait():
+        raise subprocess.CalledProcessError(p.returncode, prog)
+    return c, l
+
+def gcov_dir(args):
+    """
+    Run the jobs of one directory in sequence, as gcov writes the .gcov
+    files of the sources it covers, headers included, there.
+    """
+    prog, use_json, jobs = args
+    if use_json:
+        return [(i, gcov_json_job(prog, cwd, fn)) for i, cwd, fn in jobs]
+    return [(i, gcov_job(prog, cwd, fn)) for i, cwd, fn in jobs]
+
+def run_gcov(prog, subdirs, njobs=1, use_json=False):
+    """
+    Run gcov on the objects found, njobs directories in parallel,
+    return the counts and lengths
+    """
+    jobs = []
+    for subdir in subdirs:
+        jobs += find_jobs(subdir)
+
+    # In JSON mode gcov writes no files, and any object can go anywhere
+    bydir = {}
+    for i, (cwd, fn) in enumerate(jobs):
+        k = i if use_json else os.path.normpath(cwd)
+        bydir.setdefault(k, []).append((i, cwd, fn))
+    work = [(prog, use_json, x) for x in bydir.values()]
+
+    if njobs > 1 and len(work) > 1:
+        pool = multiprocessing.Pool(njobs)
+        done = pool.map(gcov_dir, work, 1)
+        pool.close()
+        pool.join()
+    else:
+        done = map(gcov_dir, work)
+
+    # Merge in the order of the tree walk, as a serial run would
+    results = []
+    for x in done:
+        results += x
+    results.sort(key=lambda x: x[0])
+    c = {}
+    l = {}
+    for i, (c2, l2) in results:
+        merge(c, l, c2, l2)
+    return c, l
+
+def runs(cnt):
+    """ Yield (first, last, count) runs of consecutive lines """
+    first = last = pcn = None
+    for ln, cn in sorted(cnt.items()):
+        if first is not None and ln == last + 1 and cn == pcn:
+            last = ln
+            continue
+        if first is not None:
+            yield first, last, pcn
+        first = last = ln
+        pcn = cn
+    if first is not None:
+        yield first, last, pcn
 
 def produce_output(fdo):
     """
@@ -140,23 +303,24 @@ def produce_output(fdo):
 
         "+" in linefm means "previous line + 1"
         "." in count means "same as previous count"
+
+    With per test attribution, the sources hit by each test follow a
+    "@test" line.
     """
 
+    if tests:
+        for t in sorted(tests):
+            fdo.write("@" + t + "\n")
+            output_counts(fdo, *tests[t])
+    else:
+        output_counts(fdo, counts, lengths)
+
+def output_counts(fdo, counts, lengths):
     for sn, cnt in counts.items():
         fdo.write("/" + sn + " " + str(lengths[sn]) + "\n")
-        lnos = list(cnt.items())
-        lnos.sort()
         pln = -1
         pcn = -1
-        while lnos:
-            ln, cn = lnos.pop(0)
-            lnl = ln
-            while lnos:
-                lnn, cnn = lnos[0]
-                if lnl + 1 != lnn or cnn != cn:
-                    break
-                lnos.pop(0)
-                lnl = lnn
+        for ln, lnl, cn in runs(cnt):
             if ln == pln + 1:
                 s = "+ "
             else:
@@ -164,9 +328,7 @@ def produce_output(fdo):
 
             if ln != lnl:
                 s += "%d " % lnl
-                pln = lnl
-            else:
-                pln = ln
+            pln = lnl
 
             if cn == pcn:
                 s += "."
@@ -175,29 +337,505 @@ def produce_output(fdo):
                 pcn = cn
             fdo.write(s + "\n")
 
+#######################################################################
+# Binary digests
+#
+# BINARY_MAGIC followed by a zlib stream of unsigned LEB128 varints
+# and strings (a varint length and UTF-8 bytes):
+#
+#    for each test, with per test attribution:
+#        "@" and the name of the test
+#        its sources, as below
+#    for each source:
+#        name, length (as in the text format), number of runs
+#        for each run:
+#            first line - (previous last line + 1), last - first, count
+
+BINARY_MAGIC = b"VGCD1\n"
+
+def put_varint(buf, n):
+    assert n >= 0
+    while n >= 0x80:
+        buf.append(0x80 | (n & 0x7f))
+        n >>= 7
+    buf.append(n)
+
+def get_varint(buf, pos):
+    n = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        shift += 7
+        if not b & 0x80:
+            return n, pos
+
+def put_str(buf, s):
+    s = s.encode("UTF-8")
+    put_varint(buf, len(s))
+    buf += s
+
+def get_str(buf, pos):
+    n, pos = get_varint(buf, pos)
+    return buf[pos:pos + n].decode("UTF-8"), pos + n
+
+def produce_binary(fdo):
+    """ Produce compressed binary output file """
+    buf = bytearray()
+    if tests:
+        for t in sorted(tests):
+            put_str(buf, "@" + t)
+            binary_counts(buf, *tests[t])
+    else:
+        binary_counts(buf, counts, lengths)
+    fdo.write(BINARY_MAGIC)
+    fdo.write(zlib.compress(bytes(buf), 9))
+
+def binary_counts(buf, counts, lengths):
+    for sn, cnt in counts.items():
+        put_str(buf, sn)
+        put_str(buf, str(lengths[sn]))
+        r = list(runs(cnt))
+        put_varint(buf, len(r))
+        pln = -1
+        for ln, lnl, cn in r:
+            put_varint(buf, ln - pln - 1)
+            put_varint(buf, lnl - ln)
+            put_varint(buf, cn)
+            pln = lnl
+
+def read_digest(fn):
+    """
+    Read a text or binary digest, return a dict of the counts and
+    lengths of each test, None for a digest without attribution
+    """
+    r = {}
+    c = {}
+    l = {}
+    with open(fn, "rb") as f:
+        data = f.read()
+
+    if data.startswith(BINARY_MAGIC):
+        buf = zlib.decompress(data[len(BINARY_MAGIC):])
+        pos = 0
+        while pos < len(buf):
+            sn, pos = get_str(buf, pos)
+            if sn[0] == "@":
+                c, l = r.setdefault(sn[1:], ({}, {}))
+                continue
+            if not r:
+                r[None] = (c, l)
+            ll, pos = get_str(buf, pos)
+            l[sn] = None if ll == "None" else ll
+            dd = c.setdefault(sn, {})
+            n, pos = get_varint(buf, pos)
+            pln = -1
+            for _ in range(n):
+                d, pos = get_varint(buf, pos)
+                rl, pos = get_varint(buf, pos)
+                cn, pos = get_varint(buf, pos)
+                ln = pln + 1 + d
+                for i in range(ln, ln + rl + 1):
+                    dd[i] = cn
+                pln = ln + rl
+        return r
+
+    dd = None
+    pln = -1
+    pcn = -1
+    for ln in data.decode("UTF-8").split("\n"):
+        if not ln:
+            continue
+        if ln[0] == "@":
+            c, l = r.setdefault(ln[1:], ({}, {}))
+            continue
+        if ln[0] == "/":
+            if not r:
+                r[None] = (c, l)
+            sn, ll = ln[1:].rsplit(" ", 1)
+            l[sn] = None if ll == "None" else ll
+            dd = c.setdefault(sn, {})
+            pln = -1
+            pcn = -1
+            continue
+        w = ln.split()
+        first = pln + 1 if w[0] == "+" else int(w[0])
+        last = int(w[1]) if len(w) == 3 else first
+        if w[-1] != ".":
+            pcn = int(w[-1])
+        for i in range(first, last + 1):
+            dd[i] = pcn
+        pln = last
+    return r
+
+def write_digest(fo, binary):
+    """ Write the digest, to stdout if fo is None """
+    if binary and fo is None:
+        produce_binary(sys.stdout.buffer)
+    elif binary:
+        with open(fo, "wb") as fdo:
+            produce_binary(fdo)
+    elif fo is None:
+        produce_output(sys.stdout)
+    else:
+        with open(fo, "w") as fdo:
+            produce_output(fdo)
+
+#######################################################################
+# Merging digests
+
+def merge_digests(fns, attribute):
+    """
+    Sum digests into counts and lengths, or into tests keeping each
+    test apart
+    """
+    for fn in fns:
+        for t, (c, l) in read_digest(fn).items():
+            if not attribute:
+                merge(counts, lengths, c, l)
+            elif t is None:
+                sys.stderr.write("%s: no per test attribution\n" % fn)
+                sys.exit(1)
+            else:
+                tc, tl = tests.setdefault(t, ({}, {}))
+                merge(tc, tl, c, l)
+
+def main_merge(argv):
+    """
+    merge [-a] [-b] [-o output-filename] digest...
+
+    Sum several digests, from sharded test runs for instance.  With -a
+    the per test attribution of the digests is kept.
+    """
+    optlist, args = getopt.getopt(argv, "abo:")
+    fo = None
+    binary = False
+    attribute = False
+    for f, v in optlist:
+        if f == '-a':
+            attribute = True
+        elif f == '-b':
+            binary = True
+        elif f == '-o' and v != '-':
+            fo = v
+    if not args:
+        sys.stderr.write(main_merge.__doc__)
+        sys.exit(2)
+    merge_digests(args, attribute)
+    write_digest(fo, binary)
+
+#######################################################################
+# Per test attribution
+
+def remove_gcda(subdirs):
+    for subdir in subdirs:
+        for root, dirs, files in os.walk(subdir):
+            for i in exclude:
+                if i in dirs:
+                    dirs.remove(i)
+            for fn in files:
+                if fn[-5:] == ".gcda":
+                    os.remove(os.path.join(root, fn))
+
+def main_pertest(argv):
+    """
+    pertest [-b] [-g gcov-program] [-j jobs] [-J] [-o output-filename]
+            [-x exclude-subdir] [-d directory]... -c command test...
+
+    Run "command test" for each test, after removing the .gcda files
+    of the directories (default: .), and attribute the coverage found
+    afterwards to the test.  The digests of several runs, on different
+    machines for instance, can be put together with "merge -a".
+    """
+    optlist, args = getopt.getopt(argv, "bc:d:g:j:Jo:x:")
+    fo = None
+    binary = False
+    command = None
+    subdirs = []
+    njobs = 1
+    use_json = False
+    gcovprog = os.environ.get('GCOVPROG')
+    if gcovprog is None:
+        gcovprog = "gcov6 -r"
+    for f, v in optlist:
+        if f == '-b':
+            binary = True
+        elif f == '-c':
+            command = v
+        elif f == '-d':
+            subdirs.append(v)
+        elif f == '-g':
+            gcovprog = v
+        elif f == '-j':
+            njobs = int(v)
+        elif f == '-J':
+            use_json = True
+        elif f == '-o' and v != '-':
+            fo = v
+        elif f == '-x':
+            exclude.append(v)
+    if command is None or not args:
+        sys.stderr.write(main_pertest.__doc__)
+        sys.exit(2)
+    if not subdirs:
+        subdirs = ["."]
+
+    for t in args:
+        remove_gcda(subdirs)
+        if subprocess.call(command + " " + t, shell=True):
+            sys.stderr.write("%s: failed\n" % t)
+        tests[t] = run_gcov(gcovprog, subdirs, njobs, use_json)
+    write_digest(fo, binary)
+
+#######################################################################
+# Test selection
+#
+# The index is a JSON document:
+#
+#    {"tests": [test, ...],
+#     "sources": {source: [[first, last, [test number, ...]], ...]}}
+#
+# holding, for each source, runs of consecutive lines executed by the
+# same tests.  Sources are named like in the digests, by their base
+# name.
+
+def read_index(fn):
+    """
+    Read an index, return its tests and the tests executing each
+    source line
+    """
+    with open(fn) as f:
+        doc = json.load(f)
+    names = doc["tests"]
+    cover = {}
+    for sn, rr in doc["sources"].items():
+        dd = cover.setdefault(sn, {})
+        for first, last, tt in rr:
+            ts = frozenset(names[i] for i in tt)
+            for lno in range(first, last + 1):
+                dd[lno] = ts
+    return names, cover
+
+def write_index(fo, cover):
+    names = sorted(set().union(*(ts for dd in cover.values()
+                                 for ts in dd.values())))
+    num = {t: i for i, t in enumerate(names)}
+    srcs = {}
+    for sn in sorted(cover):
+        rr = []
+        for first, last, ts in runs(cover[sn]):
+            if ts:
+                rr.append([first, last, sorted(num[t] for t in ts)])
+        if rr:
+            srcs[sn] = rr
+    doc = {"tests": names, "sources": srcs}
+    if fo is None:
+        json.dump(doc, sys.stdout, separators=(",", ":"))
+        sys.stdout.write("\n")
+    else:
+        with open(fo, "w") as fdo:
+            json.dump(doc, fdo, separators=(",", ":"))
+            fdo.write("\n")
+
+def main_index(argv):
+    """
+    index [-o index] [-u index] digest...
+
+    Build a test selection index from digests with per test
+    attribution.  With -u, the tests of the digests replace their
+    previous coverage in an existing index, and the others are kept.
+    """
+    optlist, args = getopt.getopt(argv, "o:u:")
+    fo = None
+    update = None
+    for f, v in optlist:
+        if f == '-o' and v != '-':
+            fo = v
+        elif f == '-u':
+            update = v
+    if not args:
+        sys.stderr.write(main_index.__doc__)
+        sys.exit(2)
+    merge_digests(args, True)
+
+    cover = {}
+    if update is not None:
+        for sn, dd in read_index(update)[1].items():
+            cover[sn] = {lno: ts - tests.keys() for lno, ts in dd.items()}
+    for t, (c, l) in tests.items():
+        for sn, cnt in c.items():
+            dd = cover.setdefault(sn, {})
+            for lno, cn in cnt.items():
+                if cn > 0:
+                    dd[lno] = dd.get(lno, frozenset()) | {t}
+    write_index(fo, cover)
+
+def diff_path(ln):
+    """
+    The file name of a "--- " or "+++ " line, without the "a/" or "b/"
+    of git
+    """
+    fn = ln[4:].rstrip("\n").split("\t")[0]
+    if fn[:2] in ("a/", "b/"):
+        fn = fn[2:]
+    return fn
+
+def diff_lines(fdi):
+    """
+    Parse a unified diff, return the lines changed in each file of the
+    old tree, by path, and the set of the files removed.
+
+    A deleted line counts as changed, and so do the two lines around
+    lines inserted without deleting any.
+    """
+    changed = {}
+    removed = set()
+    dd = None
+    ofn = None
+    olno = 0
+    deleted = False
+    for ln in fdi:
+        if ln.startswith("--- "):
+            ofn = diff_path(ln)
+            dd = None
+            continue
+        if ln.startswith("+++ "):
+            fn = diff_path(ln)
+            if fn == "/dev/null":
+                fn = ofn
+                removed.add(fn)
+            dd = changed.setdefault(fn, set())
+            continue
+        if dd is None:
+            continue
+        if ln.startswith("@@ "):
+            # "-first,0" for an insertion after the line "first"
+            r = ln.split()[1][1:].split(",")
+            olno = int(r[0])
+            if r[1:] == ["0"]:
+                olno += 1
+            deleted = False
+            continue
+        if ln[:1] == "-":
+            dd.add(olno)
+            olno += 1
+            deleted = True
+        elif ln[:1] == "+":
+            if not deleted:
+                dd.add(olno - 1)
+                dd.add(olno)
+        elif ln[:1] == " ":
+            olno += 1
+            deleted = False
+    return changed, removed
+
+def main_query(argv):
+    """
+    query [-i index] [diff]
+
+    Print the tests executing the lines changed by a unified diff, read
+    from the file or stdin, such as the output of "git diff".  Changed
+    and added .vtc files are printed as well, and the sources the index
+    does not know are reported on stderr, all tests should be run for
+    them.
+    """
+    optlist, args = getopt.getopt(argv, "i:")
+    index = "gcov_index.json"
+    for f, v in optlist:
+        if f == '-i':
+            index = v
+    if len(args) > 1:
+        sys.stderr.write(main_query.__doc__)
+        sys.exit(2)
+    names, cover = read_index(index)
+    if args:
+        with open(args[0], encoding="UTF-8", errors="replace") as fdi:
+            changed, removed = diff_lines(fdi)
+    else:
+        changed, removed = diff_lines(open(sys.stdin.fileno(), encoding="UTF-8",
+                                  errors="replace"))
+
+    sel = set()
+    for fn, dd in sorted(changed.items()):
+        sn = os.path.basename(fn)
+        if sn[-4:] == ".vtc":
+            if fn in removed:
+                continue
+            tt = [t for t in names if os.path.basename(t) == sn]
+            sel.update(tt if tt else [fn])
+            continue
+        cc = cover.get(sn)
+        if cc is None:
+            sys.stderr.write("%s: not in the index\n" % fn)
+            continue
+        for lno in dd:
+            sel |= cc.get(lno, frozenset())
+    for t in sorted(sel):
+        print(t)
+
 if __name__ == "__main__":
 
-    optlist, args = getopt.getopt(sys.argv[1:], "g:o:x:")
+    if sys.argv[1:2] == ["index"]:
+        main_index(sys.argv[2:])
+        sys.exit(0)
+    if sys.argv[1:2] == ["query"]:
+        main_query(sys.argv[2:])
+        sys.exit(0)
+    if sys.argv[1:2] == ["merge"]:
+        main_merge(sys.argv[2:])
+        sys.exit(0)
+    if sys.argv[1:2] == ["pertest"]:
+        main_pertest(sys.argv[2:])
+        sys.exit(0)
+
+    optlist, args = getopt.getopt(sys.argv[1:], "bg:j:Jo:r:t:x:")
 
-    fo = sys.stdout
+    fo = None
+    binary = False
+    digests = []
+    test = None
+    njobs = 1
+    use_json = False
     gcovprog = os.environ.get('GCOVPROG')
     if gcovprog is None:
         gcovprog = "gcov6 -r"
 
     for f, v in optlist:
         if f == '-o' and v == '-':
-            fo = sys.stdout
+            fo = None
         elif f == '-o':
-            fo = open(v, "w")
+            fo = v
+        elif f == '-b':
+            binary = True
         elif f == '-g':
             gcovprog = v
+        elif f == '-j':
+            njobs = int(v)
+        elif f == '-J':
+            use_json = True
+        elif f == '-r':
+            digests.append(v)
+        elif f == '-t':
+            test = v
         elif f == '-x':
             exclude.append(v)
         else:
             assert False
-    if not args:
-        args = ["."]
-    for dn in args:
-        run_gcov(gcovprog, dn)
 
-    produce_output(fo)
+    if digests:
+        assert len(digests) == 1 and not args
+        for t, cl in read_digest(digests[0]).items():
+            if t is None:
+                counts, lengths = cl
+            else:
+                tests[t] = cl
+    else:
+        if not args:
+            args = ["."]
+        counts, lengths = run_gcov(gcovprog, args, njobs, use_json)
+
+    if test is not None:
+        tests[test] = (counts, lengths)
+
+    write_digest(fo, binary)
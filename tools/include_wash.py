@@ -1,10 +1,38 @@
 #!/usr/bin/env python3
+#
+# Check the include order rules of the .c files, or with -r, report
+# what the headers cost the build:
+#
+#	include_wash.py [-r] [-n count] [-C cache] [-I dir]... [dir]
+#
+# The report follows the includes of every .c file below dir (default:
+# the current directory) through the headers found in the tree, to
+# give for each header the number of translation units pulling it in,
+# its size, the size of everything it pulls in with it (closure) and
+# the product of both.  The "trim" candidates are the #include lines
+# of headers whose removal would save the most bytes over all the
+# translation units, as far as no other path brings the same headers.
+# Every file is counted once per translation unit, as if it had an
+# include guard, which understates the include/tbl tables.
+#
+# Quoted includes are looked up next to the including file, then in
+# the -I directories (default: include and bin/varnishd below dir),
+# angled ones in the -I directories only.  Includes not found in the
+# tree, system and generated headers of an unbuilt tree, are not
+# followed.  All includes are followed, conditional or not.
+#
+# The includes of each file are cached by size and mtime in the -C
+# file (default: .include_wash.cache in dir).
 
+import getopt
+import json
 import os
+import sys
 
-def check(fn):
+def includes(fn):
+    """ The included names of a file, with their quoting """
     l = []
-    for i in open(fn):
+    for i in open(fn, errors="replace"):
         i = i.strip()
         if not i:
             continue
@@ -12,10 +40,14 @@ def check(fn):
             continue
         if i.find("include") == -1:
             continue
-        if i.find('"') == -1:
-            l.append(i.split('<')[1].split('>')[0])
-        else:
-            l.append(i.split('"')[1])
+        if i.find('"') != -1:
+            l.append(('"', i.split('"')[1]))
+        elif i.find('<') != -1:
+            l.append(('<', i.split('<')[1].split('>')[0]))
+    return l
+
+def check(fn, l):
+    l = [i[1] for i in l]
     if "vrt.h" in l:
         vrt = l.index("vrt.h")
         if "vdef.h" not in l:
@@ -35,7 +67,186 @@ def check(fn):
                 if j in l:
                     print(fn, j + " included with cache.h")
 
-for (dir, dns, fns) in os.walk("."):
-    for f in fns:
-        if f[-2:] == ".c":
-            check(dir + "/" + f)
+#######################################################################
+
+class Scanner():
+    """ The includes and sizes of files, cached by size and mtime """
+
+    def __init__(self, cachefn):
+        self.cachefn = cachefn
+        self.cache = {}
+        self.dirty = False
+        try:
+            with open(cachefn) as f:
+                self.cache = json.load(f)
+        except (IOError, ValueError):
+            pass
+
+    def scan(self, fn):
+        st = os.stat(fn)
+        key = [st.st_size, st.st_mtime_ns]
+        e = self.cache.get(fn)
+        if e is None or e[0] != key:
+            e = [key, includes(fn)]
+            self.cache[fn] = e
+            self.dirty = True
+        return st.st_size, e[1]
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = self.cachefn + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.cache, f, separators=(",", ":"))
+        os.replace(tmp, self.cachefn)
+
+class Graph():
+    """ The include graph of the tree, from the .c files down """
+
+    def __init__(self, root, incdirs, scanner):
+        self.root = root
+        self.incdirs = incdirs
+        self.scanner = scanner
+        self.size = {}
+        self.edges = {}
+        self.unresolved = 0
+        self.tus = []
+        for d, dns, fns in os.walk(root):
+            if ".git" in dns:
+                dns.remove(".git")
+            for f in fns:
+                if f[-2:] == ".c":
+                    self.tus.append(self.add(os.path.join(d, f)))
+        self.tus.sort()
+
+    def resolve(self, fn, q, name):
+        dirs = self.incdirs
+        if q == '"':
+            dirs = [os.path.dirname(fn)] + dirs
+        for d in dirs:
+            p = os.path.join(d, name)
+            if os.path.isfile(p):
+                return os.path.normpath(p)
+        return None
+
+    def add(self, fn):
+        """ Scan a file and everything it includes """
+        fn = os.path.normpath(fn)
+        todo = [fn]
+        while todo:
+            f = todo.pop()
+            if f in self.edges:
+                continue
+            self.size[f], l = self.scanner.scan(f)
+            self.edges[f] = []
+            for q, name in l:
+                h = self.resolve(f, q, name)
+                if h is None:
+                    self.unresolved += 1
+                elif h not in self.edges[f]:
+                    self.edges[f].append(h)
+                    todo.append(h)
+        return fn
+
+    def closure(self, fn, skip=None):
+        """ The files fn pulls in, fn included, without the edge skip """
+        seen = {fn}
+        todo = [fn]
+        while todo:
+            f = todo.pop()
+            for h in self.edges[f]:
+                if h not in seen and (f, h) != skip:
+                    seen.add(h)
+                    todo.append(h)
+        return seen
+
+def report(g, count):
+    tu_closure = {tu: g.closure(tu) for tu in g.tus}
+    users = {}
+    for tu, c in tu_closure.items():
+        for h in c:
+            if h != tu:
+                users.setdefault(h, []).append(tu)
+    hdr_closure = {h: g.closure(h) for h in users}
+    cbytes = {h: sum(g.size[i] for i in c) for h, c in hdr_closure.items()}
+    total = sum(g.size[i] for c in tu_closure.values() for i in c)
+    name = lambda fn: os.path.relpath(fn, g.root)
+
+    print("%d translation units, %d headers, %d includes not in the tree" %
+          (len(g.tus), len(users), g.unresolved))
+    print("%d bytes read by the compiler" % total)
+    print()
+    fmt = "%-40s %5s %8s %9s %10s"
+    print(fmt % ("header", "TUs", "bytes", "closure", "total"))
+    order = sorted(users, key=lambda h: -len(users[h]) * cbytes[h])
+    for h in order[:count]:
+        print(fmt % (name(h), len(users[h]), g.size[h], cbytes[h],
+                     len(users[h]) * cbytes[h]))
+
+    # Rank the includes of headers by the upper bound of their savings,
+    # then work out the real savings of the most promising ones.
+    est = []
+    for p in users:
+        for h in g.edges[p]:
+            est.append((len(users[p]) * cbytes[h], p, h))
+    est.sort(reverse=True)
+    trim = []
+    for _, p, h in est[:count * 3]:
+        saved = 0
+        for tu in users[p]:
+            c = tu_closure[tu]
+            if h not in c:
+                continue
+            c2 = g.closure(tu, (p, h))
+            saved += sum(g.size[i] for i in c - c2)
+        trim.append((saved, p, h))
+    trim.sort(reverse=True)
+    print()
+    fmt = "%-40s %-30s %10s"
+    print(fmt % ("trim", "#include", "saved"))
+    for saved, p, h in trim[:count]:
+        if saved:
+            print(fmt % (name(p), name(h), saved))
+
+def main():
+    optlist, args = getopt.getopt(sys.argv[1:], "C:I:n:r")
+    root = "."
+    cachefn = None
+    incdirs = []
+    count = 20
+    do_report = False
+    for f, v in optlist:
+        if f == '-C':
+            cachefn = v
+        elif f == '-I':
+            incdirs.append(v)
+        elif f == '-n':
+            count = int(v)
+        elif f == '-r':
+            do_report = True
+    if len(args) > 1:
+        sys.stderr.write(
+            "Usage: include_wash.py [-r] [-n count] [-C cache] "
+            "[-I dir]... [dir]\n")
+        sys.exit(2)
+    if args:
+        root = args[0]
+    if not incdirs:
+        incdirs = [os.path.join(root, "include"),
+                   os.path.join(root, "bin/varnishd")]
+    if cachefn is None:
+        cachefn = os.path.join(root, ".include_wash.cache")
+
+    scanner = Scanner(cachefn)
+    if not do_report:
+        for (dir, dns, fns) in os.walk(root):
+            for f in fns:
+                if f[-2:] == ".c":
+                    fn = dir + "/" + f
+                    check(fn, scanner.scan(fn)[1])
+    else:
+        report(Graph(root, incdirs, scanner), count)
+    scanner.save()
+
+if __name__ == "__main__":
+    main()